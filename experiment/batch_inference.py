@@ -0,0 +1,372 @@
+import os
+import json
+import pickle
+import argparse
+import hydra
+import threading
+import numpy as np
+import pandas as pd
+import torch
+import lightgbm as lgb
+import xgboost as xgb
+from catboost import CatBoost
+from omegaconf import OmegaConf
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.inference.onnx import get_export_path, export_model, ExportedModel
+from src.inference.trees import tree_models, compile_model, get_compiled_path, load_tree_ensemble
+from scripts.python.routines.columnar import is_columnar, ColumnarFrame
+from src.utils import utils
+
+
+log = utils.get_logger(__name__)
+
+
+# classes are imported on loading, so ElasticNet and GBDT models are served without the torch tabular stack
+torch_models = {
+    'tabnet': 'src.models.tabnet.model.TabNetModel',
+    'node': 'src.models.node.model.NodeModel',
+    'tab_transformer': 'src.models.tab_transformer.model.TabTransformerModel',
+}
+
+
+def load_model(model_type: str, ckpt_path: str):
+    if model_type == "lightgbm":
+        model = lgb.Booster(model_file=ckpt_path)
+    elif model_type == "catboost":
+        model = CatBoost()
+        model.load_model(ckpt_path)
+    elif model_type == "xgboost":
+        model = xgb.Booster()
+        model.load_model(ckpt_path)
+    elif model_type in ["elastic_net", "logistic_regression"]:
+        with open(ckpt_path, 'rb') as f:
+            model = pickle.load(f)
+    elif model_type in torch_models:
+        model = hydra.utils.get_class(torch_models[model_type]).load_from_checkpoint(checkpoint_path=ckpt_path)
+        model.eval()
+        model.freeze()
+    else:
+        raise ValueError(f"Unsupported model_type: {model_type}")
+    return model
+
+
+class ServedModel:
+    """
+        Trained model loaded once and scored in batches of batch_size rows.
+        Regression predictions are returned in 'Estimation' column, classification predictions
+        in 'pred', 'pred_prob_{cl_id}' and 'pred_raw_{cl_id}' columns, as in inference pipelines.
+        Binary models with one output (lightgbm binary, xgboost binary:logistic) get probabilities
+        of both classes, 'pred_raw_0' is their raw output.
+
+    Args:
+        model_type: lightgbm, catboost, xgboost, elastic_net, logistic_regression, tabnet, node, tab_transformer
+        ckpt_path: saved model
+        feature_names: model features in training order
+        task: 'regression' or 'classification'
+        batch_size: max number of rows in one model call
+        runtime: 'native' (predict of the model library), 'onnx' or 'torchscript' for torch models
+            (checkpoint is exported next to it on first use, see src.inference.onnx),
+            'compiled' for lightgbm, xgboost and catboost (see src.inference.trees)
+        num_threads: number of CPU threads of onnx and torchscript runtimes, 0 keeps runtime default
+        quantize: dynamic int8 quantization of exported torch models
+    """
+
+    def __init__(
+            self,
+            model_type: str,
+            ckpt_path: str,
+            feature_names,
+            task: str = "regression",
+            batch_size: int = 4096,
+            runtime: str = "native",
+            num_threads: int = 0,
+            quantize: bool = False,
+    ):
+        if task not in ["regression", "classification"]:
+            raise ValueError(f"Unsupported task: {task}")
+        if runtime not in ["native", "onnx", "torchscript", "compiled"]:
+            raise ValueError(f"Unsupported runtime: {runtime}")
+        self.model_type = model_type
+        self.ckpt_path = ckpt_path
+        self.feature_names = list(feature_names)
+        self.task = task
+        self.batch_size = batch_size
+        if runtime in ["onnx", "torchscript"] and model_type not in torch_models:
+            runtime = "native"
+        elif runtime == "compiled" and model_type not in tree_models:
+            runtime = "native"
+        self.runtime = runtime
+        self.model = load_model(model_type, ckpt_path)
+        self.exported = None
+        self.compiled = None
+        if self.runtime in ["onnx", "torchscript"]:
+            fn = get_export_path(ckpt_path, self.runtime, quantize)
+            if not os.path.isfile(fn) or os.path.getmtime(fn) < os.path.getmtime(ckpt_path):
+                export_model(self.model, fn, len(self.feature_names), task, self.runtime, quantize)
+            self.exported = ExportedModel(fn, task, num_threads)
+        elif self.runtime == "compiled":
+            fn = get_compiled_path(ckpt_path)
+            if os.path.isfile(fn) and os.path.getmtime(fn) >= os.path.getmtime(ckpt_path):
+                self.compiled = load_tree_ensemble(fn)
+            else:
+                self.compiled = compile_model(model_type, self.model)
+                self.compiled.save(fn)
+        self.lock = threading.Lock()
+
+    def predict_batch(self, X: np.ndarray):
+        """
+        Returns raw outputs and probabilities (None for regression) of the model for rows X.
+        """
+        model = self.model
+        is_clf = self.task == "classification"
+        if self.exported is not None:
+            raw, pred = self.exported.predict(X)
+            if not is_clf:
+                pred = raw
+        elif self.compiled is not None:
+            raw, pred = self.compiled.predict(X)
+        elif self.model_type == "lightgbm":
+            pred = model.predict(X, num_iteration=model.best_iteration)
+            raw = model.predict(X, num_iteration=model.best_iteration, raw_score=True) if is_clf else pred
+        elif self.model_type == "catboost":
+            if is_clf:
+                pred = model.predict(X, prediction_type="Probability")
+                raw = model.predict(X, prediction_type="RawFormulaVal")
+            else:
+                pred = raw = model.predict(X)
+        elif self.model_type == "xgboost":
+            dmat = xgb.DMatrix(X, feature_names=self.feature_names)
+            pred = model.predict(dmat)
+            raw = model.predict(dmat, output_margin=True) if is_clf else pred
+        elif self.model_type in ["elastic_net", "logistic_regression"]:
+            if is_clf:
+                pred = model.predict_proba(X)
+                raw = model.decision_function(X)
+            else:
+                pred = raw = model.predict(X)
+        else:
+            with torch.no_grad():
+                X_pt = torch.from_numpy(X)
+                model.produce_probabilities = False
+                raw = model(X_pt).cpu().numpy()
+                if is_clf:
+                    model.produce_probabilities = True
+                    pred = model(X_pt).cpu().numpy()
+                else:
+                    pred = raw
+        if not is_clf:
+            return np.asarray(pred).reshape(X.shape[0]), None
+        pred = np.asarray(pred).reshape(X.shape[0], -1)
+        if pred.shape[1] == 1:
+            # probability of the positive class, as binary_two_columns of compiled CatBoost
+            pred = np.concatenate([1.0 - pred, pred], axis=1)
+        return np.asarray(raw).reshape(X.shape[0], -1), pred
+
+    def predict(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Predictions for subjects of df, which must contain all model features.
+        """
+        missed = pd.Index(self.feature_names).difference(df.columns)
+        if len(missed) > 0:
+            raise ValueError(f"Missing {len(missed)} model features, e.g.: {list(missed[:10])}")
+        X = df.loc[:, self.feature_names].to_numpy(dtype=np.float32)
+        raws = []
+        probs = []
+        with self.lock:
+            for start in range(0, X.shape[0], self.batch_size):
+                raw, prob = self.predict_batch(X[start:start + self.batch_size])
+                raws.append(raw)
+                probs.append(prob)
+        res = pd.DataFrame(index=df.index)
+        if self.task == "regression":
+            res["Estimation"] = np.concatenate(raws).astype(np.float32)
+            return res
+        raw = np.concatenate(raws, axis=0)
+        prob = np.concatenate(probs, axis=0)
+        res["pred"] = np.argmax(prob, axis=1)
+        for cl_id in range(prob.shape[1]):
+            res[f"pred_prob_{cl_id}"] = prob[:, cl_id]
+        for cl_id in range(raw.shape[1]):
+            res[f"pred_raw_{cl_id}"] = raw[:, cl_id]
+        return res
+
+
+class ModelRegistry:
+    """
+        Models loaded once per process and addressed by name.
+    """
+
+    def __init__(self):
+        self.models = {}
+
+    def register(self, name: str, model_type: str, ckpt_path: str, feature_names, task: str = "regression", batch_size: int = 4096, **kwargs):
+        if name in self.models and self.models[name].ckpt_path == ckpt_path:
+            return self.models[name]
+        log.info(f"Loading model <{name}>: {model_type} from {ckpt_path}")
+        self.models[name] = ServedModel(model_type, ckpt_path, feature_names, task, batch_size, **kwargs)
+        return self.models[name]
+
+    def get(self, name: str) -> ServedModel:
+        if name not in self.models:
+            raise KeyError(f"Unknown model: {name}")
+        return self.models[name]
+
+    def names(self):
+        return list(self.models.keys())
+
+
+def read_feature_names(features_fn: str):
+    if features_fn.endswith('.xlsx'):
+        return list(pd.read_excel(features_fn).loc[:, 'features'].values)
+    with open(features_fn) as f:
+        return f.read().splitlines()
+
+
+def load_registry(fn: str) -> ModelRegistry:
+    """
+    Registry from yaml/json file of models:
+        name:
+          model_type: lightgbm
+          ckpt_path: path/to/model
+          features_fn: path/to/features.xlsx (column 'features') or .txt (one per line)
+          task: regression
+          batch_size: 4096
+          runtime: native (onnx, torchscript, compiled)
+          num_threads: 0
+          quantize: False
+    """
+    registry = ModelRegistry()
+    for name, params in OmegaConf.to_container(OmegaConf.load(fn)).items():
+        registry.register(
+            name,
+            params['model_type'],
+            params['ckpt_path'],
+            read_feature_names(params['features_fn']),
+            params.get('task', 'regression'),
+            params.get('batch_size', 4096),
+            runtime=params.get('runtime', 'native'),
+            num_threads=params.get('num_threads', 0),
+            quantize=params.get('quantize', False),
+        )
+    return registry
+
+
+def iter_input_chunks(fn: str, columns, chunk_size: int = 1000):
+    """
+    Yields chunks of chunk_size subjects with columns of the input cohort.
+    Columnar frames and csv/tsv files are streamed from disk, pickles and xlsx files are read at once.
+    """
+    if is_columnar(fn):
+        yield from ColumnarFrame(fn).iter_chunks(columns, chunk_size)
+    elif fn.endswith('.csv') or fn.endswith('.tsv'):
+        sep = '\t' if fn.endswith('.tsv') else ','
+        for chunk in pd.read_csv(fn, sep=sep, index_col=0, chunksize=chunk_size):
+            yield chunk.loc[:, columns]
+    else:
+        if fn.endswith('.xlsx'):
+            df = pd.read_excel(fn, index_col=0)
+        else:
+            df = pd.read_pickle(fn)
+        for start in range(0, df.shape[0], chunk_size):
+            yield df.iloc[start:start + chunk_size].loc[:, columns]
+
+
+def score_file(model: ServedModel, fn_in: str, fn_out: str, chunk_size: int = 1000) -> int:
+    """
+    Scores input cohort chunk by chunk and appends predictions to csv file fn_out.
+    Returns number of scored subjects.
+    """
+    num_subjects = 0
+    for chunk_id, chunk in enumerate(iter_input_chunks(fn_in, model.feature_names, chunk_size)):
+        res = model.predict(chunk)
+        res.to_csv(fn_out, mode='w' if chunk_id == 0 else 'a', header=chunk_id == 0)
+        num_subjects += res.shape[0]
+    log.info(f"Scored {num_subjects} subjects from {fn_in} to {fn_out}")
+    return num_subjects
+
+
+def get_request_handler(registry: ModelRegistry, chunk_size: int = 1000):
+    """
+    Endpoints:
+        GET /models: names of registered models
+        POST /predict/{name}: frame in pandas 'split' json ({"index", "columns", "data"}) -> predictions in 'split' json
+        POST /score/{name}: {"input": path, "output": path} -> {"num_subjects"}, file is scored chunk by chunk
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, code, obj):
+            body = json.dumps(obj).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/models':
+                self._send(200, registry.names())
+            else:
+                self._send(404, {'error': f"Unknown path: {self.path}"})
+
+        def do_POST(self):
+            parts = self.path.strip('/').split('/')
+            if len(parts) != 2 or parts[0] not in ['predict', 'score']:
+                self._send(404, {'error': f"Unknown path: {self.path}"})
+                return
+            try:
+                model = registry.get(parts[1])
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if parts[0] == 'predict':
+                    df = pd.DataFrame(request['data'], index=request.get('index'), columns=request['columns'])
+                    res = model.predict(df)
+                    self._send(200, json.loads(res.to_json(orient='split')))
+                else:
+                    num_subjects = score_file(model, request['input'], request['output'], request.get('chunk_size', chunk_size))
+                    self._send(200, {'num_subjects': num_subjects})
+            except KeyError as e:
+                self._send(404, {'error': str(e)})
+            except (ValueError, OSError) as e:
+                self._send(400, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            log.info(format % args)
+
+    return Handler
+
+
+def serve(registry: ModelRegistry, host: str = "127.0.0.1", port: int = 8000, chunk_size: int = 1000):
+    server = ThreadingHTTPServer((host, port), get_request_handler(registry, chunk_size))
+    log.info(f"Serving {registry.names()} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Batch inference of trained models")
+    parser.add_argument("--registry", required=True, help="yaml/json file of models (see load_registry)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_score = subparsers.add_parser("score", help="score input cohort to csv")
+    parser_score.add_argument("--model", required=True)
+    parser_score.add_argument("--input", required=True)
+    parser_score.add_argument("--output", required=True)
+    parser_score.add_argument("--chunk_size", type=int, default=1000)
+    parser_serve = subparsers.add_parser("serve", help="local HTTP endpoint")
+    parser_serve.add_argument("--host", default="127.0.0.1")
+    parser_serve.add_argument("--port", type=int, default=8000)
+    parser_serve.add_argument("--chunk_size", type=int, default=1000)
+    args = parser.parse_args(args)
+
+    registry = load_registry(args.registry)
+    if args.command == "score":
+        if os.path.dirname(args.output) != "":
+            os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        score_file(registry.get(args.model), args.input, args.output, args.chunk_size)
+    else:
+        serve(registry, args.host, args.port, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
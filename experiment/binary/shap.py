@@ -1,6 +1,5 @@
 import shap
 import numpy as np
-import copy
 import matplotlib.pyplot as plt
 from pathlib import Path
 import torch
@@ -11,6 +10,7 @@ from scripts.python.routines.plot.layout import add_layout
 from scripts.python.routines.plot.scatter import add_scatter_trace
 from scripts.python.routines.plot.violin import add_violin_trace
 import plotly.express as px
+from experiment.explainers import get_kernel_explainer, kernel_shap_values, raw_to_prob_shap_values
 
 
 log = utils.get_logger(__name__)
@@ -134,45 +134,23 @@ def perform_shap_explanation(config, shap_data):
             base_prob.append(base_prob_num[class_id] / base_prob_den)
 
         # Сonvert raw SHAP values to probability SHAP values
-        shap_values_prob = copy.deepcopy(shap_values)
-        for class_id in range(0, len(explainer.expected_value)):
-            for subject_id in range(0, y_all_pred_prob.shape[0]):
-
-                # Сhecking raw SHAP values
-                real_raw = y_all_pred_raw[subject_id, class_id]
-                expl_raw = explainer.expected_value[class_id] + sum(shap_values[class_id][subject_id])
-                diff_raw = real_raw - expl_raw
-                if abs(diff_raw) > 1e-6:
-                    log.warning(f"Difference between raw for subject {subject_id} in class {class_id}: {abs(diff_raw)}")
-
-                # Checking conversion to probability space
-                real_prob = y_all_pred_prob[subject_id, class_id]
-                expl_prob_num = np.exp(explainer.expected_value[class_id] + sum(shap_values[class_id][subject_id]))
-                expl_prob_den = 0
-                for c_id in range(0, len(explainer.expected_value)):
-                    expl_prob_den += np.exp(explainer.expected_value[c_id] + sum(shap_values[c_id][subject_id]))
-                expl_prob = expl_prob_num / expl_prob_den
-                delta_prob = expl_prob - base_prob[class_id]
-                diff_prob = real_prob - expl_prob
-                if abs(diff_prob) > 1e-6:
-                    log.warning(f"Difference between prediction for subject {subject_id} in class {class_id}: {abs(diff_prob)}")
-
-                # Сonvert raw SHAP values to probability SHAP values
-                shap_contrib_logodd = np.sum(shap_values[class_id][subject_id])
-                shap_contrib_prob = delta_prob
-                coeff = shap_contrib_prob / shap_contrib_logodd
-                for feature_id in range(0, X_all.shape[1]):
-                    shap_values_prob[class_id][subject_id, feature_id] = shap_values[class_id][subject_id, feature_id] * coeff
-                diff_check = shap_contrib_prob - sum(shap_values_prob[class_id][subject_id])
-                if abs(diff_check) > 1e-6:
-                    log.warning(f"Difference between SHAP contribution for subject {subject_id} in class {class_id}: {diff_check}")
-
+        shap_values_prob, tol_report = raw_to_prob_shap_values(
+            shap_values,
+            explainer.expected_value,
+            base_prob,
+            y_all_pred_raw,
+            y_all_pred_prob,
+            shap_data['class_names'],
+            tol=1e-6
+        )
+        Path(f"shap").mkdir(parents=True, exist_ok=True)
+        tol_report.to_excel(f"shap/tolerance.xlsx", index=True)
         shap_values = shap_values_prob
         expected_value = base_prob
 
     elif config.shap_explainer == "Kernel":
-        explainer = shap.KernelExplainer(shap_data['shap_kernel'], X_trn)
-        shap_values = explainer.shap_values(X_all)
+        explainer = get_kernel_explainer(config, shap_data['shap_kernel'], X_trn)
+        shap_values = kernel_shap_values(explainer, X_all, config.get("shap_n_jobs", 1))
         expected_value = explainer.expected_value
     elif config.shap_explainer == "Deep":
         model.produce_probabilities = True
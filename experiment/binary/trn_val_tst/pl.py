@@ -12,6 +12,7 @@ from pytorch_lightning import (
 from pytorch_lightning.loggers import LightningLoggerBase
 
 from src.utils import utils
+from experiment.pruning import get_trial_reporter, get_lightning_callback
 
 log = utils.get_logger(__name__)
 
@@ -48,6 +49,10 @@ def process(config: DictConfig) -> Optional[float]:
             if "_target_" in cb_conf:
                 log.info(f"Instantiating callback <{cb_conf._target_}>")
                 callbacks.append(hydra.utils.instantiate(cb_conf))
+    # Epochs are reported to the Optuna trial of pruning_optuna sweeps
+    reporter = get_trial_reporter(config, config.trainer.max_epochs)
+    if reporter is not None and "callbacks" in config and "early_stopping" in config.callbacks:
+        callbacks.append(get_lightning_callback(reporter, 0, config.callbacks.early_stopping.monitor, config.callbacks.early_stopping.mode))
 
     # Init lightning loggers
     logger: List[LightningLoggerBase] = []
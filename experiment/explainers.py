@@ -0,0 +1,217 @@
+import copy
+import multiprocessing
+import numpy as np
+import pandas as pd
+import shap
+import cloudpickle
+from concurrent.futures import ProcessPoolExecutor
+from experiment.folds import get_fold_threads, _init_worker
+from src.utils import utils
+
+
+log = utils.get_logger(__name__)
+
+
+# Explainer and explained rows of the current run_chunks() call, in workers restored once per process
+_worker_state = {}
+
+# Buffers of the last explained sample in KernelExplainer, allocated again for every sample
+kernel_buffers = ['synth_data', 'maskMatrix', 'kernelWeights', 'y', 'ey', 'lastMask', 'synth_data_index']
+
+
+def batch_predict_func(predict_func, batch_size: int = 10000):
+    """
+    predict_func called on at most batch_size rows at once. KernelExplainer evaluates the model on
+    (number of coalitions x background size) rows per explained sample, which bounds memory of the model backends.
+    """
+    def predict(X):
+        if X.shape[0] <= batch_size:
+            return predict_func(X)
+        return np.concatenate([predict_func(X[start:start + batch_size]) for start in range(0, X.shape[0], batch_size)], axis=0)
+    return predict
+
+
+def summarize_background(X_bkgrd: np.ndarray, method: str = "kmeans", size: int = 100, random_state: int = 1337):
+    """
+    Background for KernelExplainer: 'kmeans' - size weighted k-means centroids, 'sample' - size random samples, 'none' - all samples.
+    The cost of KernelExplainer is linear in the background size.
+    """
+    if method == "none" or X_bkgrd.shape[0] <= size:
+        return X_bkgrd
+    if method == "kmeans":
+        return shap.kmeans(X_bkgrd, size)
+    elif method == "sample":
+        return shap.sample(X_bkgrd, size, random_state=random_state)
+    else:
+        raise ValueError(f"Unsupported background summarization: {method}")
+
+
+def get_kernel_explainer(config, predict_func, X_bkgrd: np.ndarray):
+    bkgrd = summarize_background(
+        X_bkgrd,
+        config.get("shap_bkgrd_summary", "none"),
+        config.get("shap_bkgrd_size", 100),
+        config.get("seed", 1337)
+    )
+    return shap.KernelExplainer(batch_predict_func(predict_func, config.get("shap_batch_size", 10000)), bkgrd)
+
+
+def _concat_shap_values(chunks):
+    if isinstance(chunks[0], list):
+        return [np.concatenate([chunk[out_id] for chunk in chunks], axis=0) for out_id in range(len(chunks[0]))]
+    return np.concatenate(chunks, axis=0)
+
+
+def take_shap_rows(shap_values, rows):
+    """
+    Rows of SHAP values in any explainer output format (array or list of arrays per output).
+    """
+    if isinstance(shap_values, list):
+        return [values[rows] for values in shap_values]
+    return shap_values[rows]
+
+
+def _init_chunk_worker(num_threads: int, state: bytes):
+    _init_worker(num_threads)
+    _worker_state.update(cloudpickle.loads(state))
+
+
+def run_chunks(func, num_rows: int, n_jobs: int = 1, desc: str = None, **state):
+    """
+    Calls func(start, end) for chunks of num_rows rows in a pool of n_jobs spawned processes and returns
+    the list of results in the order of chunks. state is available to func in _worker_state.
+
+    Spawn is used as in run_folds(), because OpenMP runtimes of xgboost/lightgbm/torch hang in forked
+    children once the model was used in the parent, every process is limited to get_fold_threads(n_jobs) threads.
+    Explainers hold predict_func, which is usually a closure over the model, so state is serialized with
+    cloudpickle and restored once per process.
+    """
+    if n_jobs <= 1 or num_rows < 2:
+        _worker_state.update(state)
+        try:
+            return [func(0, num_rows)]
+        finally:
+            _worker_state.clear()
+    chunk_size = int(np.ceil(num_rows / (4 * n_jobs)))
+    bounds = [(start, min(start + chunk_size, num_rows)) for start in range(0, num_rows, chunk_size)]
+    num_threads = get_fold_threads(n_jobs)
+    if desc is not None:
+        log.info(f"{desc} for {num_rows} samples in {n_jobs} processes with {num_threads} threads each")
+    ctx = multiprocessing.get_context('spawn')
+    initargs = (num_threads, cloudpickle.dumps(state))
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx, initializer=_init_chunk_worker, initargs=initargs) as executor:
+        return list(executor.map(func, *zip(*bounds)))
+
+
+def _explain_kernel_chunk(start: int, end: int):
+    explainer = _worker_state['explainer']
+    X = _worker_state['X']
+    return explainer.shap_values(X[start:end], nsamples=_worker_state['nsamples'], silent=True)
+
+
+def kernel_shap_values(explainer, X: np.ndarray, n_jobs: int = 1, nsamples="auto"):
+    """
+    KernelExplainer SHAP values of rows X split into chunks computed in a pool of n_jobs spawned processes.
+    """
+    if n_jobs > 1:
+        # buffers of an already used explainer are not sent to workers (and can not be pickled)
+        explainer = copy.copy(explainer)
+        for attr in kernel_buffers:
+            explainer.__dict__.pop(attr, None)
+    chunks = run_chunks(_explain_kernel_chunk, X.shape[0], n_jobs, "Calculating Kernel SHAP", explainer=explainer, X=X, nsamples=nsamples)
+    if len(chunks) == 1:
+        return chunks[0]
+    return _concat_shap_values(chunks)
+
+
+def _explain_lime_chunk(start: int, end: int):
+    explainer = _worker_state['explainer']
+    results = []
+    for row in _worker_state['X'][start:end]:
+        explanation = explainer.explain_instance(data_row=row, predict_fn=_worker_state['predict_func'], **_worker_state['kwargs'])
+        results.append({
+            'map': explanation.as_map(),
+            'predicted_value': getattr(explanation, 'predicted_value', None),
+            'local_pred': getattr(explanation, 'local_pred', None),
+        })
+    return results
+
+
+def lime_explanations(explainer, predict_func, X: np.ndarray, n_jobs: int = 1, **kwargs):
+    """
+    LIME explanations of rows X computed in a pool of n_jobs spawned processes. Perturbation samples of every
+    instance are scored by one predict_func call inside explain_instance.
+
+    Returns:
+        list of dicts with 'map' (Explanation.as_map()), 'predicted_value' and 'local_pred' for every row
+    """
+    chunks = run_chunks(_explain_lime_chunk, X.shape[0], n_jobs, "Calculating LIME explanations", explainer=explainer, X=X, predict_func=predict_func, kwargs=kwargs)
+    return [res for chunk in chunks for res in chunk]
+
+
+def get_parts_shap_values(calc_func, parts_ids: dict):
+    """
+    SHAP values for every part ('trn', 'val', 'tst', 'all', ...), every row is explained only once:
+    calc_func(ids) is called for the union of rows of all parts and the parts are sliced from its result.
+
+    Args:
+        calc_func: function of sorted row positions returning SHAP values in explainer format
+        parts_ids: dict of part name to row positions (or None for absent parts)
+
+    Returns:
+        dict of part name to SHAP values of its rows (in the order of its ids)
+    """
+    parts_ids = {part: np.asarray(ids) for part, ids in parts_ids.items() if ids is not None}
+    if len(parts_ids) == 0:
+        return {}
+    ids_union = np.unique(np.concatenate(list(parts_ids.values())))
+    shap_values = calc_func(ids_union)
+    return {part: take_shap_rows(shap_values, np.searchsorted(ids_union, ids)) for part, ids in parts_ids.items()}
+
+
+def raw_to_prob_shap_values(shap_values, expected_value, base_prob, y_pred_raw=None, y_pred_prob=None, class_names=None, tol=1e-5):
+    """
+    Converts raw (log-odds) SHAP values of multiclass model to probability space: SHAP values of every
+    class and subject are scaled to sum to the change of softmax probability relative to base_prob.
+    All operations are performed on (classes, subjects, features) tensor.
+
+    Args:
+        shap_values: list of (subjects, features) raw SHAP values for every class
+        expected_value: raw expected value for every class
+        base_prob: base probability for every class
+        y_pred_raw: (subjects, classes) raw model outputs for consistency check
+        y_pred_prob: (subjects, classes) model probabilities for consistency check
+        class_names: names of classes for the report
+        tol: tolerance of the consistency check
+
+    Returns:
+        list of (subjects, features) probability SHAP values for every class,
+        report DataFrame with max absolute differences and numbers of subjects above tol for every class
+    """
+    S = np.stack(shap_values, axis=0)
+    expected_value = np.asarray(expected_value, dtype=np.float64)
+    base_prob = np.asarray(base_prob, dtype=np.float64)
+    contrib_raw = S.sum(axis=2, dtype=np.float64)
+    expl_raw = expected_value[:, np.newaxis] + contrib_raw
+    expl_prob = np.exp(expl_raw - expl_raw.max(axis=0, keepdims=True))
+    expl_prob /= expl_prob.sum(axis=0, keepdims=True)
+    contrib_prob = expl_prob - base_prob[:, np.newaxis]
+    coeff = np.divide(contrib_prob, contrib_raw, out=np.zeros_like(contrib_prob), where=contrib_raw != 0)
+    S_prob = S * coeff[:, :, np.newaxis].astype(S.dtype)
+
+    diffs = {'contrib': np.abs(contrib_prob - S_prob.sum(axis=2, dtype=np.float64))}
+    if y_pred_raw is not None:
+        diffs['raw'] = np.abs(np.asarray(y_pred_raw).T - expl_raw)
+    if y_pred_prob is not None:
+        diffs['prob'] = np.abs(np.asarray(y_pred_prob).T - expl_prob)
+    if class_names is None:
+        class_names = list(range(S.shape[0]))
+    report = pd.DataFrame(index=pd.Index(class_names, name='class'))
+    for key, diff in diffs.items():
+        report[f"{key}_max_diff"] = diff.max(axis=1)
+        report[f"{key}_num_above_tol"] = (diff > tol).sum(axis=1)
+        num_above_tol = report[f"{key}_num_above_tol"].sum()
+        if num_above_tol > 0:
+            log.warning(f"Difference between {key} values above {tol} for {num_above_tol} subject-class pairs, max: {diff.max()}")
+
+    return [S_prob[class_id] for class_id in range(S.shape[0])], report
@@ -0,0 +1,106 @@
+"""
+Fold datasets of GBDT models derived from one dataset of the whole feature matrix.
+
+LightGBM: features are binned once into a Dataset of all non-test rows, train and validation
+sets of every fold are its subsets by row index (as in lgb.cv), so binning is not repeated per fold.
+XGBoost: quantiles of all non-test rows are sketched once into a reference QuantileDMatrix,
+train matrices of folds are binned with its cuts and validation/test matrices with the cuts of the
+fold train matrix (xgboost requires the train matrix as reference of evaluation sets), so the sketch
+is not repeated per fold. Boosters without hist support (gblinear, exact/approx trees) use row slices
+of one DMatrix instead.
+
+Datasets are cached in the process by data key, so folds trained in the same process
+(or in the same worker of run_folds) share them. Only the last key of every kind is kept,
+release_fold_data() drops them after the fold loop (workers of run_folds exit with the loop).
+"""
+import numpy as np
+import lightgbm as lgb
+import xgboost as xgb
+
+
+_cache = {}
+
+
+def _get_cached(kind, key, params, build):
+    if key is None:
+        return build()
+    entry = _cache.get(kind)
+    if entry is None or entry[0] != key or entry[1] != params:
+        _cache[kind] = None
+        _cache[kind] = (key, params, build())
+    return _cache[kind][2]
+
+
+def release_fold_data(key=None):
+    """
+    Drops cached datasets of key (all datasets if key is None).
+    """
+    for kind in list(_cache):
+        if key is None or _cache[kind][0] == key:
+            del _cache[kind]
+
+
+def lightgbm_fold_datasets(key, X, y, feature_names, params, ids_trn, ids_val, ids_tst=None):
+    """
+    Train and validation subsets of one binned lgb.Dataset of all rows of X except ids_tst.
+    params must contain all Dataset parameters of training (max_bin, min_data_in_leaf, ...).
+    """
+    X = np.asarray(X)
+    rows = np.arange(X.shape[0])
+    if ids_tst is not None:
+        rows = np.setdiff1d(rows, ids_tst)
+
+    def build():
+        dataset = lgb.Dataset(X[rows], label=y[rows], feature_name=list(feature_names), params=dict(params), free_raw_data=True)
+        return dataset.construct()
+
+    dataset = _get_cached('lightgbm', key, dict(params), build)
+    ds_trn = dataset.subset(np.searchsorted(rows, ids_trn))
+    ds_val = dataset.subset(np.searchsorted(rows, ids_val))
+    return ds_trn, ds_val
+
+
+def is_quantile_dmatrix(params) -> bool:
+    """
+    QuantileDMatrix can be used with params of xgb.train: tree boosters with hist method (default since xgboost 2.0).
+    """
+    if params.get('booster', 'gbtree') not in ['gbtree', 'dart']:
+        return False
+    tree_method = params.get('tree_method', 'auto')
+    if tree_method == 'auto':
+        return int(xgb.__version__.split('.')[0]) >= 2
+    return tree_method == 'hist'
+
+
+def xgboost_fold_dmatrices(key, X, y, feature_names, params, ids_trn, ids_val, ids_tst=None):
+    """
+    Train, validation (and test) matrices of the fold for xgb.train with params.
+    """
+    X = np.asarray(X)
+    nthread = params.get('nthread', -1)
+    feature_names = list(feature_names)
+    if is_quantile_dmatrix(params):
+        max_bin = params.get('max_bin', 256)
+        rows = np.arange(X.shape[0])
+        if ids_tst is not None:
+            rows = np.setdiff1d(rows, ids_tst)
+
+        def build():
+            return xgb.QuantileDMatrix(X[rows], y[rows], feature_names=feature_names, nthread=nthread, max_bin=max_bin)
+
+        ref = _get_cached('xgboost_quantile', key, {'nthread': nthread, 'max_bin': max_bin}, build)
+        dmat_trn = xgb.QuantileDMatrix(X[ids_trn], y[ids_trn], feature_names=feature_names, nthread=nthread, max_bin=max_bin, ref=ref)
+        dmat_val, dmat_tst = [
+            None if ids is None else xgb.QuantileDMatrix(X[ids], y[ids], feature_names=feature_names, nthread=nthread, max_bin=max_bin, ref=dmat_trn)
+            for ids in [ids_val, ids_tst]
+        ]
+        return dmat_trn, dmat_val, dmat_tst
+
+    def build():
+        return xgb.DMatrix(X, y, feature_names=feature_names, nthread=nthread)
+
+    dmat = _get_cached('xgboost', key, {'nthread': nthread}, build)
+    dmat_trn = dmat.slice(ids_trn)
+    dmat_val = dmat.slice(ids_val)
+    dmat_tst = None if ids_tst is None else dmat.slice(ids_tst)
+    return dmat_trn, dmat_val, dmat_tst
@@ -0,0 +1,95 @@
+"""
+Fold assignments and predictions of CV folds kept apart from the data frame of the datamodule.
+
+Writing part labels and prediction columns into the frame of all features on every fold
+makes pandas consolidate (copy) its blocks. Instead, parts of samples are stored as int8 codes
+and predictions as one float32 (samples x columns) matrix per fold, tables for export are built
+from them at the end.
+"""
+import numpy as np
+import pandas as pd
+
+
+class FoldRegistry:
+
+    def __init__(self, index, columns, parts=("train", "val", "test"), dtypes=None):
+        """
+        Args:
+            index: index of the data frame, rows of ids of folds and predictions
+            columns: names of prediction columns
+            parts: labels of train, validation and test parts in cv_ids
+            dtypes: {column: dtype} of exported columns (float32 by default);
+                integer columns (predicted classes) are 0 in rows without predictions
+        """
+        self.index = index
+        self.columns = list(columns)
+        self.parts = list(parts)
+        self.dtypes = {} if dtypes is None else dict(dtypes)
+        self.codes = {}
+        self.predictions = {}
+
+    @staticmethod
+    def fold_column(fold_idx):
+        return f"fold_{fold_idx:04d}"
+
+    def add_fold(self, fold_idx, ids_trn, ids_val, ids_tst=None):
+        codes = np.full(len(self.index), -1, dtype=np.int8)
+        codes[ids_trn] = 0
+        codes[ids_val] = 1
+        if ids_tst is not None:
+            codes[ids_tst] = 2
+        self.codes[fold_idx] = codes
+        self.predictions[fold_idx] = np.full((len(self.index), len(self.columns)), np.nan, dtype=np.float32)
+
+    def set_predictions(self, fold_idx, ids, values):
+        """
+        values: array (len(ids) x columns), a single column can be 1d
+        """
+        values = np.asarray(values, dtype=np.float32)
+        self.predictions[fold_idx][ids, :] = values.reshape(len(ids), len(self.columns))
+
+    def get_cv_ids(self, folds=None):
+        """
+        DataFrame with part labels of samples in columns fold_{fold_idx:04d} (as cv_ids.xlsx).
+        """
+        if folds is None:
+            folds = list(self.codes)
+        cv_ids = pd.DataFrame(
+            {self.fold_column(fold_idx): pd.Categorical.from_codes(self.codes[fold_idx], categories=self.parts) for fold_idx in folds},
+            index=self.index
+        )
+        return cv_ids
+
+    def get_predictions(self, fold_idx, columns=None):
+        """
+        DataFrame of predictions of the fold with dtypes of exported columns.
+        """
+        if columns is None:
+            columns = self.columns
+        values = self.predictions[fold_idx][:, [self.columns.index(col) for col in columns]]
+        predictions = pd.DataFrame(values, index=self.index, columns=columns)
+        for col in columns:
+            dtype = np.dtype(self.dtypes.get(col, np.float32))
+            if np.issubdtype(dtype, np.integer):
+                predictions[col] = predictions[col].fillna(0)
+            predictions[col] = predictions[col].astype(dtype)
+        return predictions
+
+    def get_fold_table(self, fold_idx, df, data_columns, columns=None):
+        """
+        Parts of the fold, columns of df (outcome, ...) and predictions of the fold (as predictions.xlsx).
+        """
+        return pd.concat([
+            self.get_cv_ids([fold_idx]),
+            df.loc[:, data_columns],
+            self.get_predictions(fold_idx, columns),
+        ], axis=1)
+
+    def assign_predictions(self, df, fold_idx):
+        """
+        Writes prediction columns of one fold into df (for evaluation of the best fold and explanations).
+        """
+        predictions = self.get_predictions(fold_idx)
+        for col in predictions.columns:
+            df[col] = predictions[col].values
+        return df
@@ -0,0 +1,79 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.utils import utils
+from src.datamodules.datasets import SharedMatrix
+
+
+log = utils.get_logger(__name__)
+
+
+threads_env_vars = [
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+]
+
+
+def get_fold_threads(n_jobs: int):
+    """
+    Number of threads for every fold, so that n_jobs parallel folds do not oversubscribe the cores.
+    """
+    n_cpus = os.cpu_count() or 1
+    return max(1, n_cpus // max(1, n_jobs))
+
+
+def _init_worker(num_threads: int):
+    for var in threads_env_vars:
+        os.environ[var] = str(num_threads)
+    import torch
+    torch.set_num_threads(num_threads)
+
+
+def run_folds(func, tasks, n_jobs: int = 1):
+    """
+    Runs func(**task) for every task and yields the results in the order of tasks.
+
+    With n_jobs > 1 tasks are executed in a pool of n_jobs spawned processes (spawn, because
+    OpenMP runtimes of xgboost/lightgbm/torch are not fork-safe), every process limited to
+    get_fold_threads(n_jobs) threads. At most 2 * n_jobs tasks are in flight, so fold data is
+    not materialized for all folds at once. Every task gets 'num_threads' key.
+
+    Args:
+        func: module-level (picklable) function
+        tasks: iterable of kwargs dicts
+        n_jobs: number of parallel processes, 1 runs folds in the current process
+    """
+    num_threads = get_fold_threads(n_jobs)
+    if n_jobs <= 1:
+        for task in tasks:
+            yield func(num_threads=num_threads, **task)
+        return
+
+    log.info(f"Running folds in {n_jobs} processes with {num_threads} threads each")
+    ctx = multiprocessing.get_context('spawn')
+    executor = ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx, initializer=_init_worker, initargs=(num_threads,))
+    try:
+        futures = deque()
+        for task in tasks:
+            futures.append(executor.submit(func, num_threads=num_threads, **task))
+            if len(futures) >= 2 * n_jobs:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        # workers exit with the fold loop (also interrupted one, e.g. pruned trial), releasing their cached fold data
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def share_matrix(array, n_jobs: int = 1):
+    """
+    Publishes the matrix in shared memory when folds run in separate processes, so every task
+    pickles only the segment name. The segment is unlinked when the returned object is garbage collected.
+    """
+    if n_jobs <= 1:
+        return array
+    return SharedMatrix(array)
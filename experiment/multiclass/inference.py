@@ -1,7 +1,5 @@
 import numpy as np
-from src.models.tabnet.model import TabNetModel
 import torch
-import lightgbm as lgb
 import pandas as pd
 import hydra
 from omegaconf import DictConfig
@@ -13,10 +11,9 @@ from experiment.logging import log_hyperparameters
 from pytorch_lightning.loggers import LightningLoggerBase
 from src.utils import utils
 from experiment.routines import eval_classification
+from experiment.batch_inference import ServedModel
 from typing import List
 import wandb
-from catboost import CatBoost
-import xgboost as xgb
 from experiment.multiclass.shap import explain_shap
 
 
@@ -49,50 +46,25 @@ def inference(config: DictConfig):
     outcome_name = datamodule.get_outcome_name()
     df = datamodule.get_df()
     df['pred'] = 0
-    X_test = df.loc[:, feature_names].values
     y_test = df.loc[:, outcome_name].values
 
-    if config.model_type == "lightgbm":
-        model = lgb.Booster(model_file=config.ckpt_path)
-        y_test_pred_prob = model.predict(X_test, num_iteration=model.best_iteration)
-        y_test_pred_raw = model.predict(X_test, num_iteration=model.best_iteration, raw_score=True)
-        def shap_kernel(X):
-            y = model.predict(X, num_iteration=model.best_iteration)
-            return y
-    elif config.model_type == "catboost":
-        model = CatBoost()
-        model.load_model(config.ckpt_path)
-        y_test_pred_prob = model.predict(X_test, prediction_type="Probability")
-        y_test_pred_raw = model.predict(X_test, prediction_type="RawFormulaVal")
-        def shap_kernel(X):
-            y = model.predict(X, prediction_type="Probability")
-            return y
-    elif config.model_type == "xgboost":
-        model = xgb.Booster()
-        model.load_model(config.ckpt_path)
-        dmat_test = xgb.DMatrix(X_test, y_test, feature_names=feature_names)
-        y_test_pred_prob = model.predict(dmat_test)
-        y_test_pred_raw = model.predict(dmat_test, output_margin=True)
-        def shap_kernel(X):
-            X = xgb.DMatrix(X, feature_names=feature_names)
-            y = model.predict(X)
-            return y
-    elif config.model_type == "tabnet":
-        model = TabNetModel.load_from_checkpoint(checkpoint_path=f"{config.ckpt_path}")
-        model.produce_probabilities = True
-        model.eval()
-        model.freeze()
-        X_test_pt = torch.from_numpy(X_test)
-        y_test_pred_prob = model(X_test_pt).cpu().detach().numpy()
-        model.produce_probabilities = False
-        y_test_pred_raw = model(torch.from_numpy(X_test)).cpu().detach().numpy()
-        def shap_kernel(X):
-            model.produce_probabilities = True
-            X = torch.from_numpy(X)
-            tmp = model(X)
-            return tmp.cpu().detach().numpy()
-    else:
-        raise ValueError(f"Unsupported sa_model")
+    served = ServedModel(
+        config.model_type,
+        config.ckpt_path,
+        feature_names,
+        "classification",
+        config.get("inference_batch_size", 4096),
+        runtime=config.get("inference_runtime", "native"),
+        num_threads=config.get("inference_num_threads", 0),
+        quantize=config.get("inference_quantize", False),
+    )
+    model = served.model
+    res = served.predict(df)
+    y_test_pred_prob = res.loc[:, [f"pred_prob_{cl_id}" for cl_id, cl in enumerate(class_names)]].values
+    y_test_pred_raw = res.loc[:, [f"pred_raw_{cl_id}" for cl_id, cl in enumerate(class_names)]].values
+
+    def shap_kernel(X):
+        return served.predict_batch(X.astype('float32'))[1]
 
     y_test_pred = np.argmax(y_test_pred_prob, 1)
 
@@ -109,6 +81,7 @@ def inference(config: DictConfig):
         shap_data = {
             'model': model,
             'shap_kernel': shap_kernel,
+            'predict_func': shap_kernel,
             'df': df,
             'feature_names': feature_names,
             'class_names': class_names,
@@ -14,7 +14,7 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import lime
 import lime.lime_tabular
-from tqdm import tqdm
+from experiment.explainers import lime_explanations
 
 
 log = utils.get_logger(__name__)
@@ -187,26 +187,24 @@ def explain_lime(config, expl_data):
 
     ids_all = expl_data[f"ids_all"]
     indexes_all = df.index[ids_all]
-    df_weights = {}
-    for cl_id, cl in enumerate(class_names):
-        df_weights[cl] = pd.DataFrame(index=df.index, columns=feature_names)
-    for ind in tqdm(indexes_all, desc=f'Calculating LIME explanations'):
-        X = df.loc[ind, feature_names].values
+    explanations = lime_explanations(
+        explainer,
+        predict_func,
+        df.loc[indexes_all, feature_names].values,
+        config.get("lime_n_jobs", 1),
+        num_features=num_features,
+        labels=class_names,
+        top_labels=len(class_names)
+    )
+    weights = np.full((len(class_names), df.shape[0], len(feature_names)), np.nan)
+    for row_id, ind, explanation in zip(ids_all, indexes_all, explanations):
         y_real = df.at[ind, outcome_name]
         y_pred = df.at[ind, "pred"]
 
-        explanation = explainer.explain_instance(
-            data_row=X,
-            predict_fn=predict_func,
-            num_features=num_features,
-            labels=class_names,
-            top_labels=len(class_names),
-        )
-
-        exp_map = explanation.as_map()
+        exp_map = explanation['map']
         for cl_id, cl in enumerate(class_names):
-            for elem in exp_map[cl_id]:
-                df_weights[cl].at[ind, feature_names[elem[0]]] = elem[1]
+            feat_ids, feat_weights = zip(*exp_map[cl_id])
+            weights[cl_id, row_id, list(feat_ids)] = feat_weights
 
         if ind in samples_to_plot_mistakes:
             for part in samples_to_plot_mistakes[ind]:
@@ -224,11 +222,12 @@ def explain_lime(config, expl_data):
                 fig = get_figure_for_sample_explanation(exp_map, class_names, feature_names)
                 save_figure(fig, f"{path_curr}/{ind_save}")
 
+    df_weights = {}
     features_common = set(feature_names)
     with pd.ExcelWriter(f"lime/weights.xlsx") as writer:
         for cl_id, cl in enumerate(class_names):
+            df_weights[cl] = pd.DataFrame(weights[cl_id], index=df.index, columns=feature_names)
             df_weights[cl].dropna(axis=1, how='all', inplace=True)
-            df_weights[cl] = df_weights[cl].apply(pd.to_numeric, errors='coerce')
             features_common.intersection(set(df_weights[cl].columns.values))
             if config.lime_save_weights:
                 df_weights[cl].to_excel(writer, sheet_name=f"{cl}")
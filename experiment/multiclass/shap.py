@@ -1,7 +1,6 @@
 import pandas as pd
 import shap
 import numpy as np
-import copy
 import matplotlib.pyplot as plt
 from pathlib import Path
 import torch
@@ -12,6 +11,7 @@ from scripts.python.routines.plot.layout import add_layout
 from scripts.python.routines.plot.scatter import add_scatter_trace
 from scripts.python.routines.plot.violin import add_violin_trace
 import plotly.express as px
+from experiment.explainers import get_kernel_explainer, kernel_shap_values, get_parts_shap_values, raw_to_prob_shap_values
 import plotly.io as pio
 pio.kaleido.scope.mathjax = None
 
@@ -143,15 +143,30 @@ def explain_shap(config, expl_data):
         if config.shap_explainer == 'Tree':
             explainer = shap.TreeExplainer(model, data=X_bkgrd, feature_perturbation='interventional')
         elif config.shap_explainer == "Kernel":
-            explainer = shap.KernelExplainer(predict_func, X_bkgrd)
+            explainer = get_kernel_explainer(config, predict_func, X_bkgrd)
         elif config.shap_explainer == "Deep":
             explainer = shap.DeepExplainer(model, torch.from_numpy(X_bkgrd))
         else:
             raise ValueError(f"Unsupported explainer type: {config.shap_explainer}")
 
-    for part in ['trn', 'val', 'tst', 'all']:
+    def calc_shap_values(ids):
+        X = df.loc[df.index[ids], feature_names].values
+        if config.shap_explainer == "Tree":
+            return explainer.shap_values(X)
+        elif config.shap_explainer == "Kernel":
+            return kernel_shap_values(explainer, X, config.get("shap_n_jobs", 1))
+        elif config.shap_explainer == "Deep":
+            model.produce_probabilities = True
+            return explainer.shap_values(torch.from_numpy(X))
+        else:
+            raise ValueError(f"Unsupported explainer type: {config.shap_explainer}")
+
+    parts = ['trn', 'val', 'tst', 'all']
+    parts_shap_values = get_parts_shap_values(calc_shap_values, {part: expl_data[f"ids_{part}"] for part in parts})
+
+    for part in parts:
         if expl_data[f"ids_{part}"] is not None:
-            log.info(f"Calculating SHAP for {part}")
+            log.info(f"Plotting SHAP for {part}")
             Path(f"shap/{part}/global").mkdir(parents=True, exist_ok=True)
 
             ids = expl_data[f"ids_{part}"]
@@ -160,8 +175,8 @@ def explain_shap(config, expl_data):
             y_pred_prob = df.loc[indexes, [f"pred_prob_{cl_id}" for cl_id, cl in enumerate(class_names)]].values
             y_pred_raw = df.loc[indexes, [f"pred_raw_{cl_id}" for cl_id, cl in enumerate(class_names)]].values
 
+            shap_values = parts_shap_values[part]
             if config.shap_explainer == "Tree":
-                shap_values = explainer.shap_values(X)
 
                 base_prob = list(np.mean(y_pred_prob, axis=0))
 
@@ -176,48 +191,22 @@ def explain_shap(config, expl_data):
                 log.info(f"Base probability check: {np.linalg.norm(np.array(base_prob) - np.array(base_prob_expl))}")
 
                 # Сonvert raw SHAP values to probability SHAP values
-                shap_values_prob = copy.deepcopy(shap_values)
-                for class_id in range(0, len(class_names)):
-                    for subject_id in range(0, y_pred_prob.shape[0]):
-
-                        # Сhecking raw SHAP values
-                        real_raw = y_pred_raw[subject_id, class_id]
-                        expl_raw = explainer.expected_value[class_id] + sum(shap_values[class_id][subject_id])
-                        diff_raw = real_raw - expl_raw
-                        if abs(diff_raw) > 1e-5:
-                            log.warning(f"Difference between raw for subject {subject_id} in class {class_id}: {abs(diff_raw)}")
-
-                        # Checking conversion to probability space
-                        real_prob = y_pred_prob[subject_id, class_id]
-                        expl_prob_num = np.exp(explainer.expected_value[class_id] + sum(shap_values[class_id][subject_id]))
-                        expl_prob_den = 0
-                        for c_id in range(0, len(explainer.expected_value)):
-                            expl_prob_den += np.exp(explainer.expected_value[c_id] + sum(shap_values[c_id][subject_id]))
-                        expl_prob = expl_prob_num / expl_prob_den
-                        delta_prob = expl_prob - base_prob[class_id]
-                        diff_prob = real_prob - expl_prob
-                        if abs(diff_prob) > 1e-5:
-                            log.warning(f"Difference between prediction for subject {subject_id} in class {class_id}: {abs(diff_prob)}")
-
-                        # Сonvert raw SHAP values to probability SHAP values
-                        shap_contrib_logodd = np.sum(shap_values[class_id][subject_id])
-                        shap_contrib_prob = delta_prob
-                        coeff = shap_contrib_prob / shap_contrib_logodd
-                        for feature_id in range(0, X.shape[1]):
-                            shap_values_prob[class_id][subject_id, feature_id] = shap_values[class_id][subject_id, feature_id] * coeff
-                        diff_check = shap_contrib_prob - sum(shap_values_prob[class_id][subject_id])
-                        if abs(diff_check) > 1e-5:
-                            log.warning(f"Difference between SHAP contribution for subject {subject_id} in class {class_id}: {diff_check}")
-
+                shap_values_prob, tol_report = raw_to_prob_shap_values(
+                    shap_values,
+                    explainer.expected_value,
+                    base_prob,
+                    y_pred_raw,
+                    y_pred_prob,
+                    class_names,
+                    tol=1e-5
+                )
+                tol_report.to_excel(f"shap/{part}/tolerance.xlsx", index=True)
                 shap_values = shap_values_prob
                 expected_value = base_prob
             elif config.shap_explainer == "Kernel":
-                shap_values = explainer.shap_values(X)
                 expected_value = explainer.expected_value
                 log.info(f"Base probability check: {np.linalg.norm(np.mean(y_pred_prob, axis=0) - np.array(expected_value))}")
             elif config.shap_explainer == "Deep":
-                model.produce_probabilities = True
-                shap_values = explainer.shap_values(torch.from_numpy(X))
                 expected_value = explainer.expected_value
                 log.info(f"Base probability check: {np.linalg.norm(np.mean(y_pred_prob, axis=0) - np.array(expected_value))}")
             else:
@@ -21,6 +21,8 @@ from src.datamodules.cross_validation import RepeatedStratifiedKFoldCVSplitter
 from experiment.multiclass.shap import explain_shap
 from experiment.multiclass.lime import explain_lime
 from datetime import datetime
+from experiment.pruning import get_trial_reporter, get_lightning_callback
+from experiment.fold_registry import FoldRegistry
 from experiment.routines import eval_classification, save_feature_importance
 from pathlib import Path
 
@@ -57,7 +59,11 @@ def process(config: DictConfig) -> Optional[float]:
     class_names = datamodule.get_class_names()
     outcome_name = datamodule.get_outcome_name()
     df = datamodule.get_df()
-    df['pred'] = 0
+    registry = FoldRegistry(
+        df.index,
+        ["pred"] + [f"pred_prob_{cl_id}" for cl_id, cl in enumerate(class_names)] + [f"pred_raw_{cl_id}" for cl_id, cl in enumerate(class_names)],
+        dtypes={"pred": "int64"}
+    )
     ids_tst = datamodule.ids_tst
     if ids_tst is not None:
         is_test = True
@@ -82,15 +88,14 @@ def process(config: DictConfig) -> Optional[float]:
 
     start_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     ckpt_name = config.callbacks.model_checkpoint.filename
+    # Epochs and folds are reported to the Optuna trial of pruning_optuna sweeps, None otherwise
+    reporter = get_trial_reporter(config, config.trainer.max_epochs)
 
     for fold_idx, (ids_trn, ids_val) in tqdm(enumerate(cv_splitter.split())):
         datamodule.ids_trn = ids_trn
         datamodule.ids_val = ids_val
         datamodule.refresh_datasets()
-        df.loc[df.index[ids_trn], f"fold_{fold_idx:04d}"] = "train"
-        df.loc[df.index[ids_val], f"fold_{fold_idx:04d}"] = "val"
-        if is_test:
-            df.loc[df.index[ids_tst], f"fold_{fold_idx:04d}"] = "test"
+        registry.add_fold(fold_idx, ids_trn, ids_val, ids_tst)
 
         config.callbacks.model_checkpoint.filename = ckpt_name + f"_fold_{fold_idx:04d}"
 
@@ -123,6 +128,8 @@ def process(config: DictConfig) -> Optional[float]:
                 if "_target_" in cb_conf:
                     log.info(f"Instantiating callback <{cb_conf._target_}>")
                     callbacks.append(hydra.utils.instantiate(cb_conf))
+        if reporter is not None and "early_stopping" in config.callbacks:
+            callbacks.append(get_lightning_callback(reporter, fold_idx, config.callbacks.early_stopping.monitor, config.callbacks.early_stopping.mode))
 
         # Init lightning loggers
         loggers: List[LightningLoggerBase] = []
@@ -185,6 +192,10 @@ def process(config: DictConfig) -> Optional[float]:
             y_tst_pred_raw = torch.cat(trainer.predict(model, dataloaders=tst_dataloader, return_predictions=True, ckpt_path="best")).cpu().detach().numpy()
             y_tst_pred = np.argmax(y_tst_pred_prob, 1)
         model.produce_probabilities = True
+        registry.set_predictions(fold_idx, ids_trn, np.column_stack([y_trn_pred, y_trn_pred_prob, y_trn_pred_raw]))
+        registry.set_predictions(fold_idx, ids_val, np.column_stack([y_val_pred, y_val_pred_prob, y_val_pred_raw]))
+        if is_test:
+            registry.set_predictions(fold_idx, ids_tst, np.column_stack([y_tst_pred, y_tst_pred_prob, y_tst_pred_raw]))
 
         if config.model_type == "tabnet":
             feature_importances_raw = np.zeros((len(feature_names)))
@@ -284,27 +295,18 @@ def process(config: DictConfig) -> Optional[float]:
             best['fold'] = fold_idx
             best['ids_trn'] = ids_trn
             best['ids_val'] = ids_val
-            df.loc[df.index[ids_trn], "pred"] = y_trn_pred
-            df.loc[df.index[ids_val], "pred"] = y_val_pred
-            for cl_id, cl in enumerate(class_names):
-                df.loc[df.index[ids_trn], f"pred_prob_{cl_id}"] = y_trn_pred_prob[:, cl_id]
-                df.loc[df.index[ids_val], f"pred_prob_{cl_id}"] = y_val_pred_prob[:, cl_id]
-                df.loc[df.index[ids_trn], f"pred_raw_{cl_id}"] = y_trn_pred_raw[:, cl_id]
-                df.loc[df.index[ids_val], f"pred_raw_{cl_id}"] = y_val_pred_raw[:, cl_id]
-            if is_test:
-                df.loc[df.index[ids_tst], "pred"] = y_tst_pred
-                for cl_id, cl in enumerate(class_names):
-                    df.loc[df.index[ids_tst], f"pred_prob_{cl_id}"] = y_tst_pred_prob[:, cl_id]
-                    df.loc[df.index[ids_tst], f"pred_raw_{cl_id}"] = y_tst_pred_raw[:, cl_id]
 
         cv_progress.at[fold_idx, 'fold'] = fold_idx
         cv_progress.at[fold_idx, 'optimized_metric'] = metrics_main.at[config.optimized_metric, config.optimized_part]
+        if reporter is not None:
+            reporter.report_fold(fold_idx, metrics_main.at[config.optimized_metric, config.optimized_part], config.direction)
 
     cv_progress.to_excel(f"cv_progress.xlsx", index=False)
-    cv_ids = df.loc[:, [f"fold_{fold_idx:04d}" for fold_idx in cv_progress.loc[:, 'fold'].values]]
+    cv_ids = registry.get_cv_ids(cv_progress.loc[:, 'fold'].values)
     cv_ids.to_excel(f"cv_ids.xlsx", index=True)
-    predictions = df.loc[:, [f"fold_{best['fold']:04d}", outcome_name, "pred"] + [f"pred_prob_{cl_id}" for cl_id, cl in enumerate(class_names)]]
+    predictions = registry.get_fold_table(best['fold'], df, [outcome_name], ["pred"] + [f"pred_prob_{cl_id}" for cl_id, cl in enumerate(class_names)])
     predictions.to_excel(f"predictions.xlsx", index=True)
+    registry.assign_predictions(df, best['fold'])
 
     datamodule.ids_trn = best['ids_trn']
     datamodule.ids_val = best['ids_val']
@@ -1,6 +1,7 @@
 import hydra
+import uuid
 import numpy as np
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
 from pytorch_lightning import (
     LightningDataModule,
     seed_everything,
@@ -17,6 +18,12 @@ from catboost import CatBoost
 import lightgbm as lgb
 import wandb
 from src.datamodules.cross_validation import RepeatedStratifiedKFoldCVSplitter
+from experiment.folds import run_folds, share_matrix
+from experiment.n_feats import sweep_n_feats
+from experiment.fold_data import lightgbm_fold_datasets, xgboost_fold_dmatrices, release_fold_data
+from experiment.fold_registry import FoldRegistry
+from experiment.pruning import get_trial_reporter, lightgbm_callback, xgboost_callback, CatBoostCallback
+from src.inference.trees import tree_models, compiled_predict_func
 from experiment.multiclass.shap import explain_shap
 from experiment.multiclass.lime import explain_lime
 from tqdm import tqdm
@@ -26,6 +33,220 @@ from sklearn.linear_model import LogisticRegression
 
 log = utils.get_logger(__name__)
 
+def train_fold(config, feature_names, fold_idx, X, y, ids_trn, ids_val, ids_tst=None, reporter=None, data_key=None, num_threads=1):
+    """
+    Trains config.model_type on one CV fold.
+    Module-level, so that run_folds() can execute it in a separate process.
+    X is the whole feature matrix (ndarray or SharedMatrix), the fold is selected by ids.
+    """
+    X = np.asarray(X)
+    X_trn = X[ids_trn]
+    y_trn = y[ids_trn]
+    X_val = X[ids_val]
+    y_val = y[ids_val]
+    is_test = ids_tst is not None
+    if is_test:
+        X_tst = X[ids_tst]
+
+    if config.model_type == "xgboost":
+        model_params = {
+            'num_class': config.xgboost.output_dim,
+            'booster': config.xgboost.booster,
+            'eta': config.xgboost.learning_rate,
+            'max_depth': config.xgboost.max_depth,
+            'gamma': config.xgboost.gamma,
+            'sampling_method': config.xgboost.sampling_method,
+            'subsample': config.xgboost.subsample,
+            'objective': config.xgboost.objective,
+            'verbosity': config.xgboost.verbosity,
+            'eval_metric': config.xgboost.eval_metric,
+            'nthread': num_threads,
+        }
+
+        # Quantiles of the whole matrix are sketched once and shared by folds of the process
+        dmat_trn, dmat_val, dmat_tst = xgboost_fold_dmatrices(data_key, X, y, feature_names, model_params, ids_trn, ids_val, ids_tst)
+
+        evals_result = {}
+        model = xgb.train(
+            params=model_params,
+            dtrain=dmat_trn,
+            evals=[(dmat_trn, "train"), (dmat_val, "val")],
+            num_boost_round=config.max_epochs,
+            early_stopping_rounds=config.patience,
+            evals_result=evals_result,
+            callbacks=None if reporter is None else [xgboost_callback(reporter, fold_idx, config.xgboost.eval_metric)],
+            verbose_eval=False
+        )
+
+        y_trn_pred_prob = model.predict(dmat_trn)
+        y_val_pred_prob = model.predict(dmat_val)
+        y_trn_pred_raw = model.predict(dmat_trn, output_margin=True)
+        y_val_pred_raw = model.predict(dmat_val, output_margin=True)
+        y_trn_pred = np.argmax(y_trn_pred_prob, 1)
+        y_val_pred = np.argmax(y_val_pred_prob, 1)
+        if is_test:
+            y_tst_pred_prob = model.predict(dmat_tst)
+            y_tst_pred_raw = model.predict(dmat_tst, output_margin=True)
+            y_tst_pred = np.argmax(y_tst_pred_prob, 1)
+
+        loss_info = {
+            'epoch': list(range(len(evals_result['train'][config.xgboost.eval_metric]))),
+            'train/loss': evals_result['train'][config.xgboost.eval_metric],
+            'val/loss': evals_result['val'][config.xgboost.eval_metric]
+        }
+
+        fi = model.get_score(importance_type='weight')
+        feature_importances = pd.DataFrame.from_dict({'feature': list(fi.keys()), 'importance': list(fi.values())})
+
+    elif config.model_type == "catboost":
+        model_params = {
+            'classes_count': config.catboost.output_dim,
+            'loss_function': config.catboost.loss_function,
+            'learning_rate': config.catboost.learning_rate,
+            'depth': config.catboost.depth,
+            'min_data_in_leaf': config.catboost.min_data_in_leaf,
+            'max_leaves': config.catboost.max_leaves,
+            'task_type': config.catboost.task_type,
+            'verbose': config.catboost.verbose,
+            'iterations': config.catboost.max_epochs,
+            'early_stopping_rounds': config.catboost.patience,
+            'thread_count': num_threads,
+            'train_dir': f"catboost_info/fold_{fold_idx:04d}",
+        }
+
+        model = CatBoost(params=model_params)
+        catboost_callbacks = None if reporter is None else [CatBoostCallback(reporter, fold_idx)]
+        model.fit(X_trn, y_trn, eval_set=(X_val, y_val), use_best_model=True, callbacks=catboost_callbacks)
+        if catboost_callbacks is not None:
+            catboost_callbacks[0].check_pruned()
+        model.set_feature_names(feature_names)
+
+        y_trn_pred_prob = model.predict(X_trn, prediction_type="Probability")
+        y_val_pred_prob = model.predict(X_val, prediction_type="Probability")
+        y_trn_pred_raw = model.predict(X_trn, prediction_type="RawFormulaVal")
+        y_val_pred_raw = model.predict(X_val, prediction_type="RawFormulaVal")
+        y_trn_pred = np.argmax(y_trn_pred_prob, 1)
+        y_val_pred = np.argmax(y_val_pred_prob, 1)
+        if is_test:
+            y_tst_pred_prob = model.predict(X_tst, prediction_type="Probability")
+            y_tst_pred_raw = model.predict(X_tst, prediction_type="RawFormulaVal")
+            y_tst_pred = np.argmax(y_tst_pred_prob, 1)
+
+        metrics_trn = pd.read_csv(f"catboost_info/fold_{fold_idx:04d}/learn_error.tsv", delimiter="\t")
+        metrics_val = pd.read_csv(f"catboost_info/fold_{fold_idx:04d}/test_error.tsv", delimiter="\t")
+        loss_info = {
+            'epoch': metrics_trn.iloc[:, 0],
+            'train/loss': metrics_trn.iloc[:, 1],
+            'val/loss': metrics_val.iloc[:, 1]
+        }
+
+        feature_importances = pd.DataFrame.from_dict({'feature': model.feature_names_, 'importance': list(model.feature_importances_)})
+
+    elif config.model_type == "lightgbm":
+        model_params = {
+            'num_class': config.lightgbm.output_dim,
+            'objective': config.lightgbm.objective,
+            'boosting': config.lightgbm.boosting,
+            'learning_rate': config.lightgbm.learning_rate,
+            'num_leaves': config.lightgbm.num_leaves,
+            'device': config.lightgbm.device,
+            'max_depth': config.lightgbm.max_depth,
+            'min_data_in_leaf': config.lightgbm.min_data_in_leaf,
+            'feature_fraction': config.lightgbm.feature_fraction,
+            'bagging_fraction': config.lightgbm.bagging_fraction,
+            'bagging_freq': config.lightgbm.bagging_freq,
+            'verbose': config.lightgbm.verbose,
+            'metric': config.lightgbm.metric,
+            'num_threads': num_threads,
+        }
+
+        # Folds are subsets of one binned Dataset of the train/validation rows, shared by folds of the process
+        ds_trn, ds_val = lightgbm_fold_datasets(data_key, X, y, feature_names, model_params, ids_trn, ids_val, ids_tst)
+
+        evals_result = {}
+        model = lgb.train(
+            params=model_params,
+            train_set=ds_trn,
+            num_boost_round=config.max_epochs,
+            valid_sets=[ds_val, ds_trn],
+            valid_names=['val', 'train'],
+            evals_result=evals_result,
+            early_stopping_rounds=config.patience,
+            callbacks=None if reporter is None else [lightgbm_callback(reporter, fold_idx)],
+            verbose_eval=False
+        )
+
+        y_trn_pred_prob = model.predict(X_trn, num_iteration=model.best_iteration)
+        y_val_pred_prob = model.predict(X_val, num_iteration=model.best_iteration)
+        y_trn_pred_raw = model.predict(X_trn, num_iteration=model.best_iteration, raw_score=True)
+        y_val_pred_raw = model.predict(X_val, num_iteration=model.best_iteration, raw_score=True)
+        y_trn_pred = np.argmax(y_trn_pred_prob, 1)
+        y_val_pred = np.argmax(y_val_pred_prob, 1)
+        if is_test:
+            y_tst_pred_prob = model.predict(X_tst, num_iteration=model.best_iteration)
+            y_tst_pred_raw = model.predict(X_tst, num_iteration=model.best_iteration, raw_score=True)
+            y_tst_pred = np.argmax(y_tst_pred_prob, 1)
+
+        loss_info = {
+            'epoch': list(range(len(evals_result['train'][config.lightgbm.metric]))),
+            'train/loss': evals_result['train'][config.lightgbm.metric],
+            'val/loss': evals_result['val'][config.lightgbm.metric]
+        }
+
+        feature_importances = pd.DataFrame.from_dict({'feature': model.feature_name(), 'importance': list(model.feature_importance())})
+
+    elif config.model_type == "logistic_regression":
+        model = LogisticRegression(
+            penalty=config.logistic_regression.penalty,
+            l1_ratio=config.logistic_regression.l1_ratio,
+            C=config.logistic_regression.C,
+            multi_class=config.logistic_regression.multi_class,
+            max_iter=config.logistic_regression.max_iter,
+            tol=config.logistic_regression.tol,
+            verbose=config.logistic_regression.verbose,
+        ).fit(X_trn, y_trn)
+
+        y_trn_pred_prob = model.predict_proba(X_trn)
+        y_val_pred_prob = model.predict_proba(X_val)
+        y_trn_pred_raw = model.predict_proba(X_trn)
+        y_val_pred_raw = model.predict_proba(X_val)
+        y_trn_pred = model.predict(X_trn)
+        y_val_pred = model.predict(X_val)
+        if is_test:
+            y_tst_pred_prob = model.predict_proba(X_tst)
+            y_tst_pred_raw = model.predict_proba(X_tst)
+            y_tst_pred = model.predict(X_tst)
+
+        loss_info = {
+            'epoch': [0],
+            'train/loss': [0],
+            'val/loss': [0]
+        }
+
+        feature_importances = pd.DataFrame.from_dict(
+            {'feature': ['Intercept'] + feature_names, 'importance': [model.intercept_] + list(model.coef_)})
+
+    else:
+        raise ValueError(f"Model {config.model_type} is not supported")
+
+    fold_res = {
+        'model': model,
+        'y_trn_pred': y_trn_pred,
+        'y_val_pred': y_val_pred,
+        'y_trn_pred_prob': y_trn_pred_prob,
+        'y_val_pred_prob': y_val_pred_prob,
+        'y_trn_pred_raw': y_trn_pred_raw,
+        'y_val_pred_raw': y_val_pred_raw,
+        'loss_info': loss_info,
+        'feature_importances': feature_importances,
+    }
+    if is_test:
+        fold_res['y_tst_pred'] = y_tst_pred
+        fold_res['y_tst_pred_prob'] = y_tst_pred_prob
+        fold_res['y_tst_pred_raw'] = y_tst_pred_raw
+    return fold_res
+
+
 def process(config: DictConfig):
 
     # Set seed for random number generators in pytorch, numpy and python.random
@@ -43,7 +264,11 @@ def process(config: DictConfig):
     class_names = datamodule.get_class_names()
     outcome_name = datamodule.get_outcome_name()
     df = datamodule.get_df()
-    df['pred'] = 0
+    registry = FoldRegistry(
+        df.index,
+        ["pred"] + [f"pred_prob_{cl_id}" for cl_id, cl in enumerate(class_names)] + [f"pred_raw_{cl_id}" for cl_id, cl in enumerate(class_names)],
+        dtypes={"pred": "int64"}
+    )
     ids_tst = datamodule.ids_tst
     if ids_tst is not None:
         is_test = True
@@ -60,7 +285,7 @@ def process(config: DictConfig):
 
     best = {}
     if config.direction == "min":
-        best["optimized_metric"] = np.Inf
+        best["optimized_metric"] = np.inf
     elif config.direction == "max":
         best["optimized_metric"] = 0.0
 
@@ -68,20 +293,82 @@ def process(config: DictConfig):
 
     start_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-    for fold_idx, (ids_trn, ids_val) in tqdm(enumerate(cv_splitter.split())):
+    folds = list(enumerate(cv_splitter.split()))
+
+    if config.get("n_feats") is not None:
+        # Nested subsets of the leading features are trained on the data loaded once
+        y_all = df.loc[:, outcome_name].values
+
+        def eval_fold(fold_res, ids_trn, ids_val):
+            metrics = {
+                'train': eval_classification(config, class_names, y_all[ids_trn], fold_res['y_trn_pred'], fold_res['y_trn_pred_prob'], None, 'train', is_log=False, is_save=False),
+                'val': eval_classification(config, class_names, y_all[ids_val], fold_res['y_val_pred'], fold_res['y_val_pred_prob'], None, 'val', is_log=False, is_save=False),
+            }
+            if is_test:
+                metrics['test'] = eval_classification(config, class_names, y_all[ids_tst], fold_res['y_tst_pred'], fold_res['y_tst_pred_prob'], None, 'test', is_log=False, is_save=False)
+            return metrics
+
+        n_feats_metrics = sweep_n_feats(config, train_fold, eval_fold, df.loc[:, feature_names].values, y_all, feature_names, folds, ids_tst)
+        if config.direction == "min":
+            return n_feats_metrics['optimized_metric'].min()
+        return n_feats_metrics['optimized_metric'].max()
+
+    cv_n_jobs = config.get("cv_n_jobs", 1)
+    # Rounds and folds are reported to the Optuna trial of pruning_optuna sweeps, None otherwise
+    reporter = get_trial_reporter(config, config.max_epochs)
+    fold_config = OmegaConf.create(OmegaConf.to_container(config, resolve=True))
+    # GBDT datasets of the whole matrix are built once per process and cached by this key
+    data_key = uuid.uuid4().hex
+    # Fold processes attach to one shared copy of the features instead of receiving their own
+    X = share_matrix(df.loc[:, feature_names].values, cv_n_jobs)
+    y = df.loc[:, outcome_name].values
+    if is_test:
+        y_tst = y[ids_tst]
+    else:
+        y_tst = None
+    fold_tasks = (
+        {
+            'config': fold_config,
+            'feature_names': feature_names,
+            'fold_idx': fold_idx,
+            'X': X,
+            'y': y,
+            'ids_trn': ids_trn,
+            'ids_val': ids_val,
+            'ids_tst': ids_tst,
+            'reporter': reporter,
+            'data_key': data_key,
+        }
+        for fold_idx, (ids_trn, ids_val) in folds
+    )
+    # Folds can be trained in parallel, metrics, logging and the best fold selection follow the folds order
+    fold_results = run_folds(train_fold, fold_tasks, n_jobs=cv_n_jobs)
+
+    for (fold_idx, (ids_trn, ids_val)), fold_res in tqdm(zip(folds, fold_results), total=len(folds)):
         datamodule.ids_trn = ids_trn
         datamodule.ids_val = ids_val
         datamodule.refresh_datasets()
-        X_trn = df.loc[df.index[ids_trn], feature_names].values
         y_trn = df.loc[df.index[ids_trn], outcome_name].values
-        df.loc[df.index[ids_trn], f"fold_{fold_idx:04d}"] = "train"
-        X_val = df.loc[df.index[ids_val], feature_names].values
         y_val = df.loc[df.index[ids_val], outcome_name].values
-        df.loc[df.index[ids_val], f"fold_{fold_idx:04d}"] = "val"
+        registry.add_fold(fold_idx, ids_trn, ids_val, ids_tst)
+
+        model = fold_res['model']
+        y_trn_pred = fold_res['y_trn_pred']
+        y_val_pred = fold_res['y_val_pred']
+        y_trn_pred_prob = fold_res['y_trn_pred_prob']
+        y_val_pred_prob = fold_res['y_val_pred_prob']
+        y_trn_pred_raw = fold_res['y_trn_pred_raw']
+        y_val_pred_raw = fold_res['y_val_pred_raw']
+        if is_test:
+            y_tst_pred = fold_res['y_tst_pred']
+            y_tst_pred_prob = fold_res['y_tst_pred_prob']
+            y_tst_pred_raw = fold_res['y_tst_pred_raw']
+        registry.set_predictions(fold_idx, ids_trn, np.column_stack([y_trn_pred, y_trn_pred_prob, y_trn_pred_raw]))
+        registry.set_predictions(fold_idx, ids_val, np.column_stack([y_val_pred, y_val_pred_prob, y_val_pred_raw]))
         if is_test:
-            X_tst = df.loc[df.index[ids_tst], feature_names].values
-            y_tst = df.loc[df.index[ids_tst], outcome_name].values
-            df.loc[df.index[ids_tst], f"fold_{fold_idx:04d}"] = "test"
+            registry.set_predictions(fold_idx, ids_tst, np.column_stack([y_tst_pred, y_tst_pred_prob, y_tst_pred_raw]))
+        loss_info = fold_res['loss_info']
+        feature_importances = fold_res['feature_importances']
 
         if 'csv' in config.logger:
             config.logger.csv["version"] = f"fold_{fold_idx}"
@@ -99,180 +386,6 @@ def process(config: DictConfig):
         log.info("Logging hyperparameters!")
         log_hyperparameters(loggers, config)
 
-        if config.model_type == "xgboost":
-            model_params = {
-                'num_class': config.xgboost.output_dim,
-                'booster': config.xgboost.booster,
-                'eta': config.xgboost.learning_rate,
-                'max_depth': config.xgboost.max_depth,
-                'gamma': config.xgboost.gamma,
-                'sampling_method': config.xgboost.sampling_method,
-                'subsample': config.xgboost.subsample,
-                'objective': config.xgboost.objective,
-                'verbosity': config.xgboost.verbosity,
-                'eval_metric': config.xgboost.eval_metric,
-            }
-
-            dmat_trn = xgb.DMatrix(X_trn, y_trn, feature_names=feature_names)
-            dmat_val = xgb.DMatrix(X_val, y_val, feature_names=feature_names)
-            if is_test:
-                dmat_tst = xgb.DMatrix(X_tst, y_tst, feature_names=feature_names)
-
-            evals_result = {}
-            model = xgb.train(
-                params=model_params,
-                dtrain=dmat_trn,
-                evals=[(dmat_trn, "train"), (dmat_val, "val")],
-                num_boost_round=config.max_epochs,
-                early_stopping_rounds=config.patience,
-                evals_result=evals_result,
-                verbose_eval=False
-            )
-
-            y_trn_pred_prob = model.predict(dmat_trn)
-            y_val_pred_prob = model.predict(dmat_val)
-            y_trn_pred_raw = model.predict(dmat_trn, output_margin=True)
-            y_val_pred_raw = model.predict(dmat_val, output_margin=True)
-            y_trn_pred = np.argmax(y_trn_pred_prob, 1)
-            y_val_pred = np.argmax(y_val_pred_prob, 1)
-            if is_test:
-                y_tst_pred_prob = model.predict(dmat_tst)
-                y_tst_pred_raw = model.predict(dmat_tst, output_margin=True)
-                y_tst_pred = np.argmax(y_tst_pred_prob, 1)
-
-            loss_info = {
-                'epoch': list(range(len(evals_result['train'][config.xgboost.eval_metric]))),
-                'train/loss': evals_result['train'][config.xgboost.eval_metric],
-                'val/loss': evals_result['val'][config.xgboost.eval_metric]
-            }
-
-            fi = model.get_score(importance_type='weight')
-            feature_importances = pd.DataFrame.from_dict({'feature': list(fi.keys()), 'importance': list(fi.values())})
-
-        elif config.model_type == "catboost":
-            model_params = {
-                'classes_count': config.catboost.output_dim,
-                'loss_function': config.catboost.loss_function,
-                'learning_rate': config.catboost.learning_rate,
-                'depth': config.catboost.depth,
-                'min_data_in_leaf': config.catboost.min_data_in_leaf,
-                'max_leaves': config.catboost.max_leaves,
-                'task_type': config.catboost.task_type,
-                'verbose': config.catboost.verbose,
-                'iterations': config.catboost.max_epochs,
-                'early_stopping_rounds': config.catboost.patience
-            }
-
-            model = CatBoost(params=model_params)
-            model.fit(X_trn, y_trn, eval_set=(X_val, y_val), use_best_model=True)
-            model.set_feature_names(feature_names)
-
-            y_trn_pred_prob = model.predict(X_trn, prediction_type="Probability")
-            y_val_pred_prob = model.predict(X_val, prediction_type="Probability")
-            y_trn_pred_raw = model.predict(X_trn, prediction_type="RawFormulaVal")
-            y_val_pred_raw = model.predict(X_val, prediction_type="RawFormulaVal")
-            y_trn_pred = np.argmax(y_trn_pred_prob, 1)
-            y_val_pred = np.argmax(y_val_pred_prob, 1)
-            if is_test:
-                y_tst_pred_prob = model.predict(X_tst, prediction_type="Probability")
-                y_tst_pred_raw = model.predict(X_tst, prediction_type="RawFormulaVal")
-                y_tst_pred = np.argmax(y_tst_pred_prob, 1)
-
-            metrics_trn = pd.read_csv(f"catboost_info/learn_error.tsv", delimiter="\t")
-            metrics_val = pd.read_csv(f"catboost_info/test_error.tsv", delimiter="\t")
-            loss_info = {
-                'epoch': metrics_trn.iloc[:, 0],
-                'train/loss': metrics_trn.iloc[:, 1],
-                'val/loss': metrics_val.iloc[:, 1]
-            }
-
-            feature_importances = pd.DataFrame.from_dict({'feature': model.feature_names_, 'importance': list(model.feature_importances_)})
-
-        elif config.model_type == "lightgbm":
-            model_params = {
-                'num_class': config.lightgbm.output_dim,
-                'objective': config.lightgbm.objective,
-                'boosting': config.lightgbm.boosting,
-                'learning_rate': config.lightgbm.learning_rate,
-                'num_leaves': config.lightgbm.num_leaves,
-                'device': config.lightgbm.device,
-                'max_depth': config.lightgbm.max_depth,
-                'min_data_in_leaf': config.lightgbm.min_data_in_leaf,
-                'feature_fraction': config.lightgbm.feature_fraction,
-                'bagging_fraction': config.lightgbm.bagging_fraction,
-                'bagging_freq': config.lightgbm.bagging_freq,
-                'verbose': config.lightgbm.verbose,
-                'metric': config.lightgbm.metric
-            }
-
-            ds_trn = lgb.Dataset(X_trn, label=y_trn, feature_name=feature_names)
-            ds_val = lgb.Dataset(X_val, label=y_val, reference=ds_trn, feature_name=feature_names)
-
-            evals_result = {}
-            model = lgb.train(
-                params=model_params,
-                train_set=ds_trn,
-                num_boost_round=config.max_epochs,
-                valid_sets=[ds_val, ds_trn],
-                valid_names=['val', 'train'],
-                evals_result=evals_result,
-                early_stopping_rounds=config.patience,
-                verbose_eval=False
-            )
-
-            y_trn_pred_prob = model.predict(X_trn, num_iteration=model.best_iteration)
-            y_val_pred_prob = model.predict(X_val, num_iteration=model.best_iteration)
-            y_trn_pred_raw = model.predict(X_trn, num_iteration=model.best_iteration, raw_score=True)
-            y_val_pred_raw = model.predict(X_val, num_iteration=model.best_iteration, raw_score=True)
-            y_trn_pred = np.argmax(y_trn_pred_prob, 1)
-            y_val_pred = np.argmax(y_val_pred_prob, 1)
-            if is_test:
-                y_tst_pred_prob = model.predict(X_tst, num_iteration=model.best_iteration)
-                y_tst_pred_raw = model.predict(X_tst, num_iteration=model.best_iteration, raw_score=True)
-                y_tst_pred = np.argmax(y_tst_pred_prob, 1)
-
-            loss_info = {
-                'epoch': list(range(len(evals_result['train'][config.lightgbm.metric]))),
-                'train/loss': evals_result['train'][config.lightgbm.metric],
-                'val/loss': evals_result['val'][config.lightgbm.metric]
-            }
-
-            feature_importances = pd.DataFrame.from_dict({'feature': model.feature_name(), 'importance': list(model.feature_importance())})
-
-        elif config.model_type == "logistic_regression":
-            model = LogisticRegression(
-                penalty=config.logistic_regression.penalty,
-                l1_ratio=config.logistic_regression.l1_ratio,
-                C=config.logistic_regression.C,
-                multi_class=config.logistic_regression.multi_class,
-                max_iter=config.logistic_regression.max_iter,
-                tol=config.logistic_regression.tol,
-                verbose=config.logistic_regression.verbose,
-            ).fit(X_trn, y_trn)
-
-            y_trn_pred_prob = model.predict_proba(X_trn)
-            y_val_pred_prob = model.predict_proba(X_val)
-            y_trn_pred_raw = model.predict_proba(X_trn)
-            y_val_pred_raw = model.predict_proba(X_val)
-            y_trn_pred = model.predict(X_trn)
-            y_val_pred = model.predict(X_val)
-            if is_test:
-                y_tst_pred_prob = model.predict_proba(X_tst)
-                y_tst_pred_raw = model.predict_proba(X_tst)
-                y_tst_pred = model.predict(X_tst)
-
-            loss_info = {
-                'epoch': [0],
-                'train/loss': [0],
-                'val/loss': [0]
-            }
-
-            feature_importances = pd.DataFrame.from_dict(
-                {'feature': ['Intercept'] + feature_names, 'importance': [model.intercept_] + list(model.coef_)})
-
-        else:
-            raise ValueError(f"Model {config.model_type} is not supported")
-
         metrics_trn = eval_classification(config, class_names, y_trn, y_trn_pred, y_trn_pred_prob, loggers, 'train', is_log=True, is_save=False)
         for m in metrics_trn.index.values:
             cv_progress.at[fold_idx, f"train_{m}"] = metrics_trn.at[m, 'train']
@@ -320,7 +433,9 @@ def process(config: DictConfig):
             best["model"] = model
             best['loss_info'] = loss_info
 
-            if config.model_type == "xgboost":
+            if config.get("compiled_trees", False) and config.model_type in tree_models:
+                predict_func = compiled_predict_func(config.model_type, model)
+            elif config.model_type == "xgboost":
                 def predict_func(X):
                     X = xgb.DMatrix(X, feature_names=feature_names)
                     y = best["model"].predict(X)
@@ -341,27 +456,20 @@ def process(config: DictConfig):
             best['fold'] = fold_idx
             best['ids_trn'] = ids_trn
             best['ids_val'] = ids_val
-            df.loc[df.index[ids_trn], "pred"] = y_trn_pred
-            df.loc[df.index[ids_val], "pred"] = y_val_pred
-            for cl_id, cl in enumerate(class_names):
-                df.loc[df.index[ids_trn], f"pred_prob_{cl_id}"] = y_trn_pred_prob[:, cl_id]
-                df.loc[df.index[ids_val], f"pred_prob_{cl_id}"] = y_val_pred_prob[:, cl_id]
-                df.loc[df.index[ids_trn], f"pred_raw_{cl_id}"] = y_trn_pred_raw[:, cl_id]
-                df.loc[df.index[ids_val], f"pred_raw_{cl_id}"] = y_val_pred_raw[:, cl_id]
-            if is_test:
-                df.loc[df.index[ids_tst], "pred"] = y_tst_pred
-                for cl_id, cl in enumerate(class_names):
-                    df.loc[df.index[ids_tst], f"pred_prob_{cl_id}"] = y_tst_pred_prob[:, cl_id]
-                    df.loc[df.index[ids_tst], f"pred_raw_{cl_id}"] = y_tst_pred_raw[:, cl_id]
 
         cv_progress.at[fold_idx, 'fold'] = fold_idx
         cv_progress.at[fold_idx, 'optimized_metric'] = metrics_main.at[config.optimized_metric, config.optimized_part]
+        if reporter is not None:
+            reporter.report_fold(fold_idx, metrics_main.at[config.optimized_metric, config.optimized_part], config.direction)
+
+    release_fold_data(data_key)
 
     cv_progress.to_excel(f"cv_progress.xlsx", index=False)
-    cv_ids = df.loc[:, [f"fold_{fold_idx:04d}" for fold_idx in cv_progress.loc[:,'fold'].values]]
+    cv_ids = registry.get_cv_ids(cv_progress.loc[:, 'fold'].values)
     cv_ids.to_excel(f"cv_ids.xlsx", index=True)
-    predictions = df.loc[:, [f"fold_{best['fold']:04d}", outcome_name, "pred"] + [f"pred_prob_{cl_id}" for cl_id, cl in enumerate(class_names)]]
+    predictions = registry.get_fold_table(best['fold'], df, [outcome_name], ["pred"] + [f"pred_prob_{cl_id}" for cl_id, cl in enumerate(class_names)])
     predictions.to_excel(f"predictions.xlsx", index=True)
+    registry.assign_predictions(df, best['fold'])
 
     datamodule.ids_trn = best['ids_trn']
     datamodule.ids_val = best['ids_val']
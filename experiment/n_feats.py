@@ -0,0 +1,97 @@
+"""
+Sweep over the number of features within one job: features of the datamodule are ranked
+(for example, by feature_importances.xlsx of a baseline model), the data is loaded once and
+CV folds are trained on the leading n features for every n of config.n_feats.
+Metrics of every n are written into one table, n_feats.xlsx, instead of one run directory per n.
+"""
+import uuid
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig, OmegaConf
+from experiment.folds import run_folds, share_matrix
+from experiment.fold_data import release_fold_data
+from src.utils import utils
+
+
+log = utils.get_logger(__name__)
+
+
+def get_n_feats(config: DictConfig, num_features: int):
+    """
+    Sorted numbers of features from config.n_feats: list of numbers or {start, stop, num} for np.linspace.
+    Numbers greater than the number of features of the datamodule are skipped.
+    """
+    n_feats = config.n_feats
+    if isinstance(n_feats, DictConfig):
+        n_feats = np.linspace(n_feats.start, n_feats.stop, n_feats.num, dtype=int)
+    n_feats = sorted(set(int(n) for n in n_feats))
+    skipped = [n for n in n_feats if n > num_features]
+    if len(skipped) > 0:
+        log.warning(f"Only {num_features} features, skipped n_feats: {skipped}")
+    n_feats = [n for n in n_feats if 0 < n <= num_features]
+    if len(n_feats) == 0:
+        raise ValueError(f"No valid n_feats for {num_features} features: {config.n_feats}")
+    return n_feats
+
+
+def sweep_n_feats(config: DictConfig, train_fold, eval_fold, X, y, feature_names, folds, ids_tst=None):
+    """
+    Trains and evaluates CV folds on the leading n columns of X for every n of config.n_feats.
+    X is converted to Fortran order once, so the leading columns of every n are a contiguous view.
+
+    Args:
+        train_fold: train_fold() of the task module
+        eval_fold: function(fold_res, ids_trn, ids_val) returning {part: metrics DataFrame (metrics x [part])}
+        folds: [(fold_idx, (ids_trn, ids_val)), ...]
+
+    Returns:
+        DataFrame indexed by n_feat with the best fold ('best_fold', 'optimized_metric'),
+        its metrics ('{metric}_{part}') and the means over folds ('{metric}_cv_mean_{part}')
+    """
+    optimized_part = config.get("optimized_part", "val")
+    n_feats = get_n_feats(config, len(feature_names))
+    X = np.asfortranarray(X)
+    cv_n_jobs = config.get("cv_n_jobs", 1)
+    fold_config = OmegaConf.create(OmegaConf.to_container(config, resolve=True))
+
+    rows = []
+    for n_feat in n_feats:
+        log.info(f"Training on {n_feat} features")
+        X_n = share_matrix(X[:, :n_feat], cv_n_jobs)
+        data_key = uuid.uuid4().hex
+        fold_tasks = (
+            {
+                'config': fold_config,
+                'feature_names': list(feature_names[:n_feat]),
+                'fold_idx': fold_idx,
+                'X': X_n,
+                'y': y,
+                'ids_trn': ids_trn,
+                'ids_val': ids_val,
+                'ids_tst': ids_tst,
+                'data_key': data_key,
+            }
+            for fold_idx, (ids_trn, ids_val) in folds
+        )
+        fold_results = run_folds(train_fold, fold_tasks, n_jobs=cv_n_jobs)
+
+        best = None
+        cv_metrics = []
+        for (fold_idx, (ids_trn, ids_val)), fold_res in zip(folds, fold_results):
+            metrics = eval_fold(fold_res, ids_trn, ids_val)
+            cv_metrics.append({f"{m}_{part}": metrics[part].at[m, part] for part in metrics for m in metrics[part].index})
+            value = metrics[optimized_part].at[config.optimized_metric, optimized_part]
+            if best is None or (value < best[1] if config.direction == "min" else value > best[1]):
+                best = (fold_idx, value, cv_metrics[-1])
+        release_fold_data(data_key)
+
+        cv_metrics = pd.DataFrame(cv_metrics)
+        row = {'n_feat': n_feat, 'best_fold': best[0], 'optimized_metric': best[1], **best[2]}
+        for col in cv_metrics.columns:
+            metric, part = col.rsplit('_', 1)
+            row[f"{metric}_cv_mean_{part}"] = cv_metrics[col].mean()
+        rows.append(row)
+        # rewritten after every n, so that an interrupted sweep keeps finished ones
+        pd.DataFrame(rows).set_index('n_feat').to_excel("n_feats.xlsx", index=True)
+
+    return pd.DataFrame(rows).set_index('n_feat')
@@ -0,0 +1,180 @@
+"""
+Intermediate values of Optuna trials launched by the pruning_optuna sweeper (hydra_plugins/pruning_optuna_sweeper).
+
+The sweeper passes ++optuna_trial.{number,study_name,storage} to every job, the job loads its trial
+from the storage and reports validation losses of GBDT rounds / Lightning epochs and the optimized
+metric after every CV fold. Steps of fold i are i * (max_epochs + 1) + epoch, the fold result is
+reported at step i * (max_epochs + 1) + max_epochs, so the pruner compares trials at the same fold and epoch.
+Unpromising trials raise optuna.TrialPruned, which the sweeper records as PRUNED.
+"""
+from typing import Optional
+from omegaconf import DictConfig, OmegaConf
+from src.utils import utils
+
+
+log = utils.get_logger(__name__)
+
+
+class TrialReporter:
+    """
+    Reports values of one trial to the study storage.
+    Picklable (the study is loaded lazily), so it can be passed to fold processes of run_folds().
+
+    Args:
+        number, study_name, storage: trial of the study, from config.optuna_trial
+        pruner: config of optuna pruner (with _target_), None disables pruning, values are still reported
+        steps_per_fold: max_epochs + 1
+    """
+
+    def __init__(self, number: int, study_name: str, storage: str, pruner: Optional[dict], steps_per_fold: int):
+        self.number = number
+        self.study_name = study_name
+        self.storage = storage
+        self.pruner = pruner
+        self.steps_per_fold = steps_per_fold
+        self._trial = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_trial'] = None
+        return state
+
+    def _get_trial(self):
+        if self._trial is None:
+            import optuna
+            import hydra
+            from hydra_plugins.pruning_optuna_sweeper.pruning_optuna_sweeper import get_storage
+            pruner = None if self.pruner is None else hydra.utils.instantiate(self.pruner)
+            study = optuna.load_study(study_name=self.study_name, storage=get_storage(self.storage), pruner=pruner)
+            trial_id = study._storage.get_trial_id_from_study_id_trial_number(study._study_id, self.number)
+            self._trial = optuna.trial.Trial(study, trial_id)
+        return self._trial
+
+    def _to_study_direction(self, value: float, mode: str) -> float:
+        import optuna
+        if mode not in ["min", "max"]:
+            raise ValueError(f"Unsupported mode: {mode}")
+        is_minimize = self._get_trial().study.direction == optuna.study.StudyDirection.MINIMIZE
+        return float(value) if is_minimize == (mode == "min") else -float(value)
+
+    def report(self, value: float, step: int, mode: str = "min"):
+        """
+        Reports value (mode: "min" if lower is better) at step, raises optuna.TrialPruned if the pruner says so.
+        """
+        import optuna
+        trial = self._get_trial()
+        trial.report(self._to_study_direction(value, mode), step)
+        if self.pruner is not None and trial.should_prune():
+            log.info(f"Trial {self.number} pruned at step {step}")
+            raise optuna.TrialPruned(f"Trial {self.number} pruned at step {step}")
+
+    def report_epoch(self, fold_idx: int, epoch: int, value: float, mode: str = "min"):
+        if epoch < self.steps_per_fold - 1:
+            self.report(value, fold_idx * self.steps_per_fold + epoch, mode)
+
+    def report_fold(self, fold_idx: int, value: float, mode: str = "min"):
+        self.report(value, fold_idx * self.steps_per_fold + self.steps_per_fold - 1, mode)
+
+
+def get_trial_reporter(config: DictConfig, max_epochs: int) -> Optional[TrialReporter]:
+    """
+    Reporter of the trial of this job, None if the job is not launched by pruning_optuna sweeper with storage.
+    """
+    optuna_trial = config.get("optuna_trial")
+    if optuna_trial is None or optuna_trial.get("storage") is None:
+        return None
+    from hydra.core.hydra_config import HydraConfig
+    pruner = None
+    if HydraConfig.initialized():
+        pruner = HydraConfig.get().sweeper.get("pruner")
+        if pruner is not None:
+            pruner = OmegaConf.to_container(pruner, resolve=True)
+    return TrialReporter(optuna_trial.number, optuna_trial.study_name, optuna_trial.storage, pruner, max_epochs + 1)
+
+
+def lightgbm_callback(reporter: TrialReporter, fold_idx: int, valid_name: str = "val"):
+    """
+    Callback of lgb.train reporting the first metric of valid_name after every round.
+    """
+    def _callback(env):
+        for item in env.evaluation_result_list:
+            if item[0] == valid_name:
+                reporter.report_epoch(fold_idx, env.iteration, item[2], "max" if item[3] else "min")
+                break
+    _callback.order = 30
+    return _callback
+
+
+# eval metrics of xgboost to maximize, as in xgb.callback.EarlyStopping
+xgboost_maximize_metrics = ('auc', 'aucpr', 'pre', 'map', 'ndcg')
+
+
+def get_xgboost_mode(metric: str) -> str:
+    """
+    "max" for xgboost eval metrics to maximize (auc, ndcg@5, ...), "min" otherwise.
+    """
+    name = metric.split('@')[0]
+    return "max" if name in xgboost_maximize_metrics else "min"
+
+
+def xgboost_callback(reporter: TrialReporter, fold_idx: int, metric: str, valid_name: str = "val", mode: Optional[str] = None):
+    """
+    Callback of xgb.train reporting metric of valid_name after every round.
+    The mode is derived from metric by default.
+    """
+    import xgboost as xgb
+    if mode is None:
+        mode = get_xgboost_mode(metric)
+
+    class _Callback(xgb.callback.TrainingCallback):
+        def after_iteration(self, model, epoch, evals_log):
+            reporter.report_epoch(fold_idx, epoch, evals_log[valid_name][metric][-1], mode)
+            return False
+
+    return _Callback()
+
+
+class CatBoostCallback:
+    """
+    Callback of CatBoost.fit reporting the loss of the eval set after every iteration.
+    CatBoost does not propagate exceptions of callbacks, so training is stopped and
+    check_pruned() raises optuna.TrialPruned after fit.
+    """
+
+    def __init__(self, reporter: TrialReporter, fold_idx: int, mode: str = "min"):
+        self.reporter = reporter
+        self.fold_idx = fold_idx
+        self.mode = mode
+        self.pruned = None
+
+    def after_iteration(self, info):
+        import optuna
+        # the first metric of the eval set is the loss function
+        values = next(iter(info.metrics['validation'].values()))
+        try:
+            self.reporter.report_epoch(self.fold_idx, info.iteration - 1, values[-1], self.mode)
+        except optuna.TrialPruned as e:
+            self.pruned = e
+            return False
+        return True
+
+    def check_pruned(self):
+        if self.pruned is not None:
+            raise self.pruned
+
+
+def get_lightning_callback(reporter: TrialReporter, fold_idx: int, monitor: str, mode: str = "min"):
+    """
+    Lightning callback reporting monitor metric after every validation epoch.
+    """
+    from pytorch_lightning import Callback
+
+    class _Callback(Callback):
+        def on_validation_end(self, trainer, pl_module):
+            if trainer.sanity_checking:
+                return
+            value = trainer.callback_metrics.get(monitor)
+            if value is not None:
+                reporter.report_epoch(fold_idx, trainer.current_epoch, float(value), mode)
+
+    return _Callback()
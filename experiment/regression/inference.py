@@ -1,7 +1,5 @@
 import numpy as np
-from src.models.tabnet.model import TabNetModel
 import torch
-import lightgbm as lgb
 import hydra
 from omegaconf import DictConfig
 from pytorch_lightning import (
@@ -13,14 +11,13 @@ from pytorch_lightning.loggers import LightningLoggerBase
 from src.utils import utils
 import wandb
 import statsmodels.formula.api as smf
-import xgboost as xgb
 from experiment.regression.shap import explain_shap
 import plotly.graph_objects as go
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.layout import add_layout
 from experiment.routines import eval_regression
+from experiment.batch_inference import ServedModel
 from typing import List
-from catboost import CatBoost
 from scripts.python.routines.plot.scatter import add_scatter_trace
 
 
@@ -51,43 +48,23 @@ def inference(config: DictConfig):
     feature_names = datamodule.get_feature_names()
     outcome_name = datamodule.get_outcome_name()
     df = datamodule.get_df()
-    X_test = df.loc[:, feature_names].values
     y_test = df.loc[:, outcome_name].values
 
-    if config.model_type == "lightgbm":
-        model = lgb.Booster(model_file=config.ckpt_path)
-        y_test_pred = model.predict(X_test, num_iteration=model.best_iteration).astype('float32')
-        def shap_kernel(X):
-            y = model.predict(X, num_iteration=model.best_iteration)
-            return y
-    elif config.model_type == "catboost":
-        model = CatBoost()
-        model.load_model(config.ckpt_path)
-        y_test_pred = model.predict(X_test).astype('float32')
-        def shap_kernel(X):
-            y = model.predict(X)
-            return y
-    elif config.model_type == "xgboost":
-        model = xgb.Booster()
-        model.load_model(config.ckpt_path)
-        dmat_test = xgb.DMatrix(X_test, y_test, feature_names=feature_names).astype('float32')
-        y_test_pred = model.predict(dmat_test)
-        def shap_kernel(X):
-            X = xgb.DMatrix(X, feature_names=feature_names)
-            y = model.predict(X)
-            return y
-    elif config.model_type == "tabnet":
-        model = TabNetModel.load_from_checkpoint(checkpoint_path=f"{config.ckpt_path}")
-        model.eval()
-        model.freeze()
-        X_test_pt = torch.from_numpy(X_test)
-        y_test_pred = model(X_test_pt).cpu().detach().numpy()
-        def shap_kernel(X):
-            X = torch.from_numpy(X)
-            tmp = model(X)
-            return tmp.cpu().detach().numpy()
-    else:
-        raise ValueError(f"Unsupported sa_model")
+    served = ServedModel(
+        config.model_type,
+        config.ckpt_path,
+        feature_names,
+        "regression",
+        config.get("inference_batch_size", 4096),
+        runtime=config.get("inference_runtime", "native"),
+        num_threads=config.get("inference_num_threads", 0),
+        quantize=config.get("inference_quantize", False),
+    )
+    model = served.model
+    y_test_pred = served.predict(df).loc[:, "Estimation"].values
+
+    def shap_kernel(X):
+        return served.predict_batch(X.astype('float32'))[0]
 
     eval_regression(config, y_test, y_test_pred, loggers, 'inference', is_log=True, is_save=True)
     df.loc[:, "Estimation"] = y_test_pred
@@ -109,6 +86,7 @@ def inference(config: DictConfig):
         shap_data = {
             'model': model,
             'shap_kernel': shap_kernel,
+            'predict_func': shap_kernel,
             'df': df,
             'feature_names': feature_names,
             'outcome_name': outcome_name,
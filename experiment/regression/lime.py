@@ -12,7 +12,7 @@ from scripts.python.routines.plot.layout import add_layout
 import plotly.express as px
 import lime
 import lime.lime_tabular
-from tqdm import tqdm
+from experiment.explainers import lime_explanations
 
 
 log = utils.get_logger(__name__)
@@ -106,25 +106,25 @@ def explain_lime(config, expl_data):
 
     ids_all = expl_data[f"ids_all"]
     indexes_all = df.index[ids_all]
-    df_weights = pd.DataFrame(index=df.index, columns=feature_names)
-    for ind in tqdm(indexes_all, desc=f'Calculating LIME explanations'):
-        X = df.loc[ind, feature_names].values
+    explanations = lime_explanations(
+        explainer,
+        predict_func,
+        df.loc[indexes_all, feature_names].values,
+        config.get("lime_n_jobs", 1),
+        num_features=num_features
+    )
+    weights = np.full((df.shape[0], len(feature_names)), np.nan)
+    for row_id, ind, explanation in zip(ids_all, indexes_all, explanations):
         y_real = df.at[ind, outcome_name]
         y_pred = df.at[ind, "Estimation"]
         y_diff = y_pred - y_real
 
-        explanation = explainer.explain_instance(
-            data_row=X,
-            predict_fn=predict_func,
-            num_features=num_features
-        )
-
-        if abs(y_pred - explanation.predicted_value) > 1e-5:
-            raise ValueError(f"Wrong model prediction for {ind}: predict_func={explanation.predicted_value}, df={y_pred}")
+        if abs(y_pred - explanation['predicted_value']) > 1e-5:
+            raise ValueError(f"Wrong model prediction for {ind}: predict_func={explanation['predicted_value']}, df={y_pred}")
 
-        exp_map = explanation.as_map()[1]
-        for elem in exp_map:
-            df_weights.at[ind, feature_names[elem[0]]] = elem[1]
+        exp_map = explanation['map'][1]
+        feat_ids, feat_weights = zip(*exp_map)
+        weights[row_id, list(feat_ids)] = feat_weights
 
         if ind in samples_to_plot:
             for part in samples_to_plot[ind]:
@@ -132,14 +132,14 @@ def explain_lime(config, expl_data):
                 fig = get_figure_for_sample_explanation(exp_map, feature_names)
                 fig.update_layout(
                     title_font_size=25,
-                    title_text=f"{ind}: Real: {y_real:0.2f}, Pred: {y_pred:0.2f}, LIME: {explanation.local_pred[0]:0.2f}",
+                    title_text=f"{ind}: Real: {y_real:0.2f}, Pred: {y_pred:0.2f}, LIME: {explanation['local_pred'][0]:0.2f}",
                     title_xanchor="center",
                     title_xref="paper"
                 )
                 save_figure(fig, f"lime/{part}/samples/{ind_save}_{y_diff:0.4f}")
 
+    df_weights = pd.DataFrame(weights, index=df.index, columns=feature_names)
     df_weights.dropna(axis=1, how='all', inplace=True)
-    df_weights = df_weights.apply(pd.to_numeric, errors='coerce')
     if config.lime_save_weights:
         df_weights.to_excel(f"lime/weights.xlsx")
 
@@ -9,6 +9,7 @@ import plotly.graph_objects as go
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.layout import add_layout
 import plotly.express as px
+from experiment.explainers import get_kernel_explainer, kernel_shap_values, get_parts_shap_values
 
 
 log = utils.get_logger(__name__)
@@ -90,33 +91,39 @@ def explain_shap(config, expl_data):
         if config.shap_explainer == 'Tree':
             explainer = shap.TreeExplainer(model, data=X_bkgrd, feature_perturbation='interventional')
         elif config.shap_explainer == "Kernel":
-            explainer = shap.KernelExplainer(predict_func, X_bkgrd)
+            explainer = get_kernel_explainer(config, predict_func, X_bkgrd)
         elif config.shap_explainer == "Deep":
             explainer = shap.DeepExplainer(model, torch.from_numpy(X_bkgrd))
         else:
             raise ValueError(f"Unsupported explainer type: {config.shap_explainer}")
 
-    for part in ['trn', 'val', 'tst', 'all']:
+    def calc_shap_values(ids):
+        X = df.loc[df.index[ids], feature_names].values
+        if config.shap_explainer == "Tree":
+            return explainer.shap_values(X)
+        elif config.shap_explainer == "Kernel":
+            return kernel_shap_values(explainer, X, config.get("shap_n_jobs", 1))[0]
+        elif config.shap_explainer == "Deep":
+            return explainer.shap_values(torch.from_numpy(X))
+        else:
+            raise ValueError(f"Unsupported explainer type: {config.shap_explainer}")
+
+    parts = ['trn', 'val', 'tst', 'all']
+    parts_shap_values = get_parts_shap_values(calc_shap_values, {part: expl_data[f"ids_{part}"] for part in parts})
+    if config.shap_explainer == "Kernel":
+        expected_value = explainer.expected_value[0]
+    else:
+        expected_value = explainer.expected_value
+
+    for part in parts:
         if expl_data[f"ids_{part}"] is not None:
-            log.info(f"Calculating SHAP for {part}")
+            log.info(f"Plotting SHAP for {part}")
             Path(f"shap/{part}/global").mkdir(parents=True, exist_ok=True)
             ids = expl_data[f"ids_{part}"]
             indexes = df.index[ids]
             X = df.loc[indexes, feature_names].values
             y_pred = df.loc[indexes, "Estimation"].values
-
-            if config.shap_explainer == "Tree":
-                shap_values = explainer.shap_values(X)
-                expected_value = explainer.expected_value
-            elif config.shap_explainer == "Kernel":
-                shap_values = explainer.shap_values(X)
-                shap_values = shap_values[0]
-                expected_value = explainer.expected_value[0]
-            elif config.shap_explainer == "Deep":
-                shap_values = explainer.shap_values(torch.from_numpy(X))
-                expected_value = explainer.expected_value
-            else:
-                raise ValueError(f"Unsupported explainer type: {config.shap_explainer}")
+            shap_values = parts_shap_values[part]
 
             if config.is_shap_save:
                 df_shap = pd.DataFrame(index=indexes, columns=feature_names, data=shap_values)
@@ -27,6 +27,8 @@ from scripts.python.routines.plot.save import save_figure
 from scipy.stats import mannwhitneyu
 from scripts.python.routines.plot.p_value import add_p_value_annotation
 from scripts.python.routines.plot.layout import add_layout
+from experiment.pruning import get_trial_reporter, get_lightning_callback
+from experiment.fold_registry import FoldRegistry
 from experiment.routines import eval_regression, save_feature_importance
 from datetime import datetime
 from pathlib import Path
@@ -63,6 +65,7 @@ def process(config: DictConfig) -> Optional[float]:
     con_features_ids, cat_features_ids = datamodule.get_con_cat_feature_ids()
     outcome_name = datamodule.get_outcome_name()
     df = datamodule.get_df()
+    registry = FoldRegistry(df.index, ["Estimation"])
     ids_tst = datamodule.ids_tst
     if ids_tst is not None:
         is_test = True
@@ -87,15 +90,14 @@ def process(config: DictConfig) -> Optional[float]:
 
     start_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     ckpt_name = config.callbacks.model_checkpoint.filename
+    # Epochs and folds are reported to the Optuna trial of pruning_optuna sweeps, None otherwise
+    reporter = get_trial_reporter(config, config.trainer.max_epochs)
 
     for fold_idx, (ids_trn, ids_val) in tqdm(enumerate(cv_splitter.split())):
         datamodule.ids_trn = ids_trn
         datamodule.ids_val = ids_val
         datamodule.refresh_datasets()
-        df.loc[df.index[ids_trn], f"fold_{fold_idx:04d}"] = "train"
-        df.loc[df.index[ids_val], f"fold_{fold_idx:04d}"] = "val"
-        if is_test:
-            df.loc[df.index[ids_tst], f"fold_{fold_idx:04d}"] = "test"
+        registry.add_fold(fold_idx, ids_trn, ids_val, ids_tst)
 
         config.callbacks.model_checkpoint.filename = ckpt_name + f"_fold_{fold_idx:04d}"
 
@@ -128,6 +130,8 @@ def process(config: DictConfig) -> Optional[float]:
                 if "_target_" in cb_conf:
                     log.info(f"Instantiating callback <{cb_conf._target_}>")
                     callbacks.append(hydra.utils.instantiate(cb_conf))
+        if reporter is not None and "early_stopping" in config.callbacks:
+            callbacks.append(get_lightning_callback(reporter, fold_idx, config.callbacks.early_stopping.monitor, config.callbacks.early_stopping.mode))
 
         # Init lightning loggers
         loggers: List[LightningLoggerBase] = []
@@ -182,6 +186,10 @@ def process(config: DictConfig) -> Optional[float]:
         y_val_pred = torch.cat(trainer.predict(model, dataloaders=val_dataloader, return_predictions=True, ckpt_path="best")).cpu().detach().numpy().ravel()
         if is_test:
             y_tst_pred = torch.cat(trainer.predict(model, dataloaders=tst_dataloader, return_predictions=True, ckpt_path="best")).cpu().detach().numpy().ravel()
+        registry.set_predictions(fold_idx, ids_trn, y_trn_pred)
+        registry.set_predictions(fold_idx, ids_val, y_val_pred)
+        if is_test:
+            registry.set_predictions(fold_idx, ids_tst, y_tst_pred)
 
         if config.model_type == "tabnet":
             feature_importances_raw = np.zeros((len(feature_names)))
@@ -277,19 +285,18 @@ def process(config: DictConfig) -> Optional[float]:
             best['fold'] = fold_idx
             best['ids_trn'] = ids_trn
             best['ids_val'] = ids_val
-            df.loc[df.index[ids_trn], "Estimation"] = y_trn_pred
-            df.loc[df.index[ids_val], "Estimation"] = y_val_pred
-            if is_test:
-                df.loc[df.index[ids_tst], "Estimation"] = y_tst_pred
 
         cv_progress.at[fold_idx, 'fold'] = fold_idx
         cv_progress.at[fold_idx, 'optimized_metric'] = metrics_main.at[config.optimized_metric, config.optimized_part]
+        if reporter is not None:
+            reporter.report_fold(fold_idx, metrics_main.at[config.optimized_metric, config.optimized_part], config.direction)
 
     cv_progress.to_excel(f"cv_progress.xlsx", index=False)
-    cv_ids = df.loc[:, [f"fold_{fold_idx:04d}" for fold_idx in cv_progress.loc[:, 'fold'].values]]
+    cv_ids = registry.get_cv_ids(cv_progress.loc[:, 'fold'].values)
     cv_ids.to_excel(f"cv_ids.xlsx", index=True)
-    predictions = df.loc[:, [f"fold_{best['fold']:04d}", outcome_name, "Estimation"]]
+    predictions = registry.get_fold_table(best['fold'], df, [outcome_name])
     predictions.to_excel(f"predictions.xlsx", index=True)
+    registry.assign_predictions(df, best['fold'])
 
     datamodule.ids_trn = best['ids_trn']
     datamodule.ids_val = best['ids_val']
@@ -0,0 +1,24 @@
+from dataclasses import dataclass
+from typing import Any
+from hydra.core.config_store import ConfigStore
+from hydra_plugins.hydra_optuna_sweeper.config import OptunaSweeperConf
+
+
+@dataclass
+class PruningOptunaSweeperConf(OptunaSweeperConf):
+    _target_: str = "hydra_plugins.pruning_optuna_sweeper.pruning_optuna_sweeper.PruningOptunaSweeper"
+
+    # Pruner used by trials to stop unpromising runs, for example {_target_: optuna.pruners.MedianPruner}
+    # Trials report intermediate values only when storage is set
+    pruner: Any = None
+
+    # Seconds to wait for a locked SQLite database, trials of parallel jobs write to it concurrently
+    storage_timeout: float = 60.0
+
+
+ConfigStore.instance().store(
+    group="hydra/sweeper",
+    name="pruning_optuna",
+    node=PruningOptunaSweeperConf,
+    provider="pruning_optuna_sweeper",
+)
@@ -0,0 +1,198 @@
+"""
+Optuna sweeper with persistent studies and pruning of trials.
+
+Differences from hydra_optuna_sweeper:
+    * relative SQLite storage paths are resolved against the launch directory, the study is resumed
+      after a crash: trials left RUNNING are failed, only missing trials are run
+    * every job gets ++optuna_trial.{number,study_name,storage} overrides, so it can report
+      intermediate values of its trial to the storage (see experiment/pruning.py)
+    * jobs raising optuna.TrialPruned are told as PRUNED, not as failures
+Trials of a batch are launched by the configured launcher, with hydra/launcher=joblib in parallel processes.
+"""
+import functools
+import logging
+import os
+from typing import Any, List, Optional
+import optuna
+from optuna.trial import TrialState
+from hydra.plugins.sweeper import Sweeper
+from hydra.types import HydraContext, TaskFunction
+from omegaconf import DictConfig, OmegaConf
+from hydra_plugins.hydra_optuna_sweeper._impl import OptunaSweeperImpl, create_params_from_overrides
+
+
+log = logging.getLogger(__name__)
+
+
+def get_storage_url(storage: Optional[str]) -> Optional[str]:
+    """
+    SQLite URL with absolute path, other URLs are returned as is.
+    """
+    if storage is None or not storage.startswith("sqlite:///"):
+        return storage
+    fn = storage[len("sqlite:///"):]
+    fn = os.path.abspath(fn)
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+    return f"sqlite:///{fn}"
+
+
+def get_storage(storage: Optional[str], timeout: float = 60.0):
+    if storage is None:
+        return None
+    if storage.startswith("sqlite:///"):
+        return optuna.storages.RDBStorage(storage, engine_kwargs={"connect_args": {"timeout": timeout}})
+    return storage
+
+
+class PruningOptunaSweeperImpl(OptunaSweeperImpl):
+    def __init__(self, *args: Any, storage_timeout: float = 60.0, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.storage = get_storage_url(self.storage)
+        self.storage_timeout = storage_timeout
+        self.study: Optional[optuna.Study] = None
+
+    def _configure_trials(self, trials, search_space_distributions, fixed_params):
+        overrides = super()._configure_trials(trials, search_space_distributions, fixed_params)
+        if self.storage is None:
+            return overrides
+        res = []
+        for trial, trial_overrides in zip(trials, overrides):
+            res.append(
+                tuple(trial_overrides)
+                + (
+                    f"++optuna_trial.number={trial.number}",
+                    f"++optuna_trial.study_name='{self.study.study_name}'",
+                    f"++optuna_trial.storage='{self.storage}'",
+                )
+            )
+        return res
+
+    def sweep(self, arguments: List[str]) -> None:
+        assert self.config is not None
+        assert self.launcher is not None
+
+        self._process_searchspace_config()
+        params_conf = self._parse_sweeper_params_config()
+        params_conf.extend(arguments)
+        override_search_space_distributions, fixed_params = create_params_from_overrides(params_conf)
+        search_space_distributions = dict()
+        if self.search_space_distributions:
+            search_space_distributions = self.search_space_distributions.copy()
+        search_space_distributions.update(override_search_space_distributions)
+        for param_name in fixed_params:
+            if param_name in search_space_distributions:
+                del search_space_distributions[param_name]
+        if isinstance(self.sampler, functools.partial) and self.sampler.func == optuna.samplers.GridSampler:
+            raise ValueError("GridSampler is not supported by pruning_optuna sweeper, use optuna sweeper")
+
+        directions = self._get_directions()
+        self.study = optuna.create_study(
+            study_name=self.study_name,
+            storage=get_storage(self.storage, self.storage_timeout),
+            sampler=self.sampler,
+            directions=directions,
+            load_if_exists=True,
+        )
+        study = self.study
+        log.info(f"Study name: {study.study_name}")
+        log.info(f"Storage: {self.storage}")
+        log.info(f"Sampler: {type(self.sampler).__name__}")
+        log.info(f"Directions: {directions}")
+
+        # trials of a crashed sweep are failed, finished ones count towards n_trials
+        for trial in study.get_trials(deepcopy=False, states=(TrialState.RUNNING,)):
+            study.tell(trial.number, state=TrialState.FAIL)
+        num_finished = len(study.get_trials(deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)))
+        if num_finished > 0:
+            log.info(f"Resuming study: {num_finished} finished trials")
+        n_trials_to_go = self.n_trials - num_finished
+
+        while n_trials_to_go > 0:
+            batch_size = min(n_trials_to_go, self.n_jobs)
+            trials = [study.ask() for _ in range(batch_size)]
+            overrides = self._configure_trials(trials, search_space_distributions, fixed_params)
+            returns = self.launcher.launch(overrides, initial_job_idx=self.job_idx)
+            self.job_idx += len(returns)
+            failures = []
+            for trial, ret in zip(trials, returns):
+                try:
+                    value = ret.return_value
+                except optuna.TrialPruned:
+                    study.tell(trial, state=TrialState.PRUNED)
+                    log.info(f"Trial {trial.number} pruned")
+                    continue
+                except Exception as e:
+                    study.tell(trial, state=TrialState.FAIL)
+                    log.warning(f"Failed experiment: {e}")
+                    failures.append(e)
+                    continue
+                try:
+                    values = [float(value)] if len(directions) == 1 else [float(v) for v in value]
+                    study.tell(trial, values=values)
+                except (ValueError, TypeError) as e:
+                    study.tell(trial, state=TrialState.FAIL)
+                    log.warning(f"Failed experiment: {e}")
+                    failures.append(e)
+
+            if len(failures) / len(returns) > self.max_failure_rate:
+                log.error(f"Failed {len(failures)} times out of {len(returns)} with max_failure_rate={self.max_failure_rate}.")
+                raise failures[0]
+            n_trials_to_go -= batch_size
+
+        if len(directions) < 2:
+            best_trial = study.best_trial
+            results_to_serialize = {
+                "name": "optuna",
+                "best_params": best_trial.params,
+                "best_value": best_trial.value,
+            }
+            log.info(f"Best parameters: {best_trial.params}")
+            log.info(f"Best value: {best_trial.value}")
+        else:
+            best_trials = study.best_trials
+            results_to_serialize = {
+                "name": "optuna",
+                "solutions": [{"params": x.params, "values": x.values} for x in best_trials],
+            }
+            log.info(f"Number of Pareto solutions: {len(best_trials)}")
+        OmegaConf.save(OmegaConf.create(results_to_serialize), f"{self.config.hydra.sweep.dir}/optimization_results.yaml")
+
+
+class PruningOptunaSweeper(Sweeper):
+    """Optuna sweeper with persistent studies and trial pruning"""
+
+    def __init__(
+        self,
+        sampler: Any,
+        direction: Any,
+        storage: Optional[Any],
+        study_name: Optional[str],
+        n_trials: int,
+        n_jobs: int,
+        max_failure_rate: float,
+        search_space: Optional[DictConfig],
+        custom_search_space: Optional[str],
+        params: Optional[DictConfig],
+        pruner: Any = None,
+        storage_timeout: float = 60.0,
+    ) -> None:
+        # pruner is instantiated by trials themselves (they load the study from the storage)
+        self.sweeper = PruningOptunaSweeperImpl(
+            sampler,
+            direction,
+            storage,
+            study_name,
+            n_trials,
+            n_jobs,
+            max_failure_rate,
+            search_space,
+            custom_search_space,
+            params,
+            storage_timeout=storage_timeout,
+        )
+
+    def setup(self, *, hydra_context: HydraContext, task_function: TaskFunction, config: DictConfig) -> None:
+        self.sweeper.setup(hydra_context=hydra_context, task_function=task_function, config=config)
+
+    def sweep(self, arguments: List[str]) -> None:
+        return self.sweeper.sweep(arguments)
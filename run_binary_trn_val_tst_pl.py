@@ -15,6 +15,7 @@ def main(config: DictConfig):
     from experiment.binary.trn_val_tst.pl import process
     from src.train_cv import train_cv
     from src.utils import utils
+    from scripts.python.routines.plot.save import wait_figures
     import torch
 
     # A couple of optional utilities:
@@ -39,9 +40,13 @@ def main(config: DictConfig):
     is_cv = config.is_cv
 
     if is_cv:
-        return train_cv(config)
+        result = train_cv(config)
+        wait_figures()
+        return result
     else:
-        return process(config)
+        result = process(config)
+        wait_figures()
+        return result
 
 
 
@@ -15,6 +15,7 @@ def main(config: DictConfig):
     from experiment.multiclass.trn_val_tst.pl import process
     from src.train_cv import train_cv
     from src.utils import utils
+    from scripts.python.routines.plot.save import wait_figures
     import torch
 
     # A couple of optional utilities:
@@ -35,7 +36,11 @@ def main(config: DictConfig):
         print('CUDA Device Name:', torch.cuda.get_device_name(0))
         print('CUDA Device Total Memory [GB]:', torch.cuda.get_device_properties(0).total_memory / 1024**3)
 
-    return process(config)
+    result = process(config)
+
+    wait_figures()
+
+    return result
 
 
 if __name__ == "__main__":
@@ -13,6 +13,7 @@ def main(config: DictConfig):
     # Imports should be nested inside @hydra.main to optimize tab completion
     # Read more here: https://github.com/facebookresearch/hydra/issues/934
     from src.utils import utils
+    from scripts.python.routines.plot.save import wait_figures
     from experiment.regression.inference import inference
     import torch
 
@@ -34,7 +35,11 @@ def main(config: DictConfig):
     if config.get("print_config"):
         utils.print_config(config, resolve=True)
 
-    return inference(config)
+    result = inference(config)
+
+    wait_figures()
+
+    return result
 
 
 if __name__ == "__main__":
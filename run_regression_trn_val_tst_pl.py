@@ -14,6 +14,7 @@ def main(config: DictConfig):
     # Read more here: https://github.com/facebookresearch/hydra/issues/934
     from experiment.regression.trn_val_tst.pl import process
     from src.utils import utils
+    from scripts.python.routines.plot.save import wait_figures
     import torch
 
     # A couple of optional utilities:
@@ -34,7 +35,11 @@ def main(config: DictConfig):
         print('CUDA Device Name:', torch.cuda.get_device_name(0))
         print('CUDA Device Total Memory [GB]:', torch.cuda.get_device_properties(0).total_memory / 1024**3)
 
-    return process(config)
+    result = process(config)
+
+    wait_figures()
+
+    return result
 
 
 if __name__ == "__main__":
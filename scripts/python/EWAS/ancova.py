@@ -1,13 +1,12 @@
 import pandas as pd
 from scripts.python.routines.manifest import get_manifest
-from tqdm import tqdm
 from scripts.python.EWAS.routines.correction import correct_pvalues
+from scripts.python.EWAS.routines.ols import get_design, ols_mass
 import plotly.graph_objects as go
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.scatter import add_scatter_trace
 from scripts.python.routines.plot.layout import add_layout
 import numpy as np
-from pingouin import ancova
 from scripts.python.pheno.datasets.filter import filter_pheno, get_passed_fields
 from scripts.python.pheno.datasets.features import get_column_name, get_status_dict, get_default_statuses, get_default_statuses_ids, get_sex_dict
 from pathlib import Path
@@ -62,16 +61,13 @@ for dataset in datasets:
     cpgs = betas.columns.values
 
     if is_rerun:
+        # Type II ANCOVA for all CpGs at once, same p-values as pingouin.ancova(dv=cpg, covar=age_col, between=status_col)
+        design = get_design(df, f"C({status_col}) + {age_col}")
+        ols = ols_mass(design, df.loc[:, cpgs], anova=True)
         result = {'CpG': cpgs}
-        result['Gene'] = np.zeros(len(cpgs), dtype=object)
-        for t in terms:
-            result[f"{t}_pval"] = np.zeros(len(cpgs))
-
-        for cpg_id, cpg in tqdm(enumerate(cpgs), desc='from_formula', total=len(cpgs)):
-            result['Gene'][cpg_id] = manifest.loc[cpg, 'Gene']
-            res = ancova(data=df, dv=cpg, covar=age_col, between=status_col)
-            for t in terms:
-                result[f"{t}_pval"][cpg_id] = res.loc[res['Source'] == t, 'p-unc'].values[0]
+        result['Gene'] = manifest.loc[cpgs, 'Gene'].values
+        result[f"{status_col}_pval"] = ols[f"C({status_col})_pval"].values
+        result[f"{age_col}_pval"] = ols[f"{age_col}_pval"].values
 
         result = correct_pvalues(result, [f"{t}_pval" for t in terms])
         result = pd.DataFrame(result)
@@ -1,12 +1,10 @@
 import pandas as pd
 from scripts.python.routines.manifest import get_manifest
 import numpy as np
-from tqdm import tqdm
 import plotly.graph_objects as go
 import statsmodels.formula.api as smf
-from scipy.stats import pearsonr
-from scipy.stats import spearmanr
 from scripts.python.EWAS.routines.correction import correct_pvalues
+from scripts.python.EWAS.routines.ols import get_design, ols_mass, corr_mass
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.scatter import add_scatter_trace
 from scripts.python.routines.plot.layout import add_layout
@@ -73,25 +71,19 @@ for dataset in datasets:
         Path(f"{path_curr}").mkdir(parents=True, exist_ok=True)
 
         if is_rerun:
+            design = get_design(df_1_curr, k)
+            ols = ols_mass(design, df_1_curr.loc[:, cpgs])
+            pearson = corr_mass(df_1_curr[k], df_1_curr.loc[:, cpgs], 'pearson')
+            spearman = corr_mass(df_1_curr[k], df_1_curr.loc[:, cpgs], 'spearman')
             result = {'CpG': cpgs}
-            result['Gene'] = np.zeros(len(cpgs), dtype=object)
-            metrics = ['R2', 'R2_adj', f"{v}_pval", 'pearson_r', 'pearson_pval', 'spearman_r', 'spearman_pval']
-            for m in metrics:
-                result[m] = np.zeros(len(cpgs))
-
-            for cpg_id, cpg in tqdm(enumerate(cpgs), desc='Regression', total=len(cpgs)):
-                result['Gene'][cpg_id] = manifest.loc[cpg, 'Gene']
-                reg = smf.ols(formula=f"{cpg} ~ {k}", data=df_1_curr).fit()
-                pvalues = dict(reg.pvalues)
-                result['R2'][cpg_id] = reg.rsquared
-                result['R2_adj'][cpg_id] = reg.rsquared_adj
-                result[f"{v}_pval"][cpg_id] = pvalues[k]
-                pearson_r, pearson_pval = pearsonr(df_1_curr[cpg].values, df_1_curr[k].values)
-                result['pearson_r'][cpg_id] = pearson_r
-                result['pearson_pval'][cpg_id] = pearson_pval
-                spearman_r, spearman_pval = spearmanr(df_1_curr[cpg].values, df_1_curr[k].values)
-                result['spearman_r'][cpg_id] = spearman_r
-                result['spearman_pval'][cpg_id] = spearman_pval
+            result['Gene'] = manifest.loc[cpgs, 'Gene'].values
+            result['R2'] = ols['R2'].values
+            result['R2_adj'] = ols['R2_adj'].values
+            result[f"{v}_pval"] = ols[f"{k}_pvalue"].values
+            result['pearson_r'] = pearson['pearson_r'].values
+            result['pearson_pval'] = pearson['pearson_pval'].values
+            result['spearman_r'] = spearman['spearman_r'].values
+            result['spearman_pval'] = spearman['spearman_pval'].values
 
             result = correct_pvalues(result, [f"{v}_pval", 'pearson_pval', 'spearman_pval'])
             result = pd.DataFrame(result)
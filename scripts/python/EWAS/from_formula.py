@@ -1,8 +1,8 @@
 import pandas as pd
 from scripts.python.routines.manifest import get_manifest
 from scripts.python.routines.betas import betas_drop_na
-from tqdm import tqdm
 from scripts.python.EWAS.routines.correction import correct_pvalues
+from scripts.python.EWAS.routines.ols import get_design, ols_mass
 import statsmodels.formula.api as smf
 import plotly.graph_objects as go
 from scripts.python.routines.plot.save import save_figure
@@ -63,22 +63,14 @@ for dataset in datasets:
     cpgs = betas.columns.values
 
     if is_rerun:
+        design = get_design(df, formula)
+        ols = ols_mass(design, df.loc[:, cpgs])
         result = {'CpG': cpgs}
-        result['Gene'] = np.zeros(len(cpgs), dtype=object)
-        metrics = ['R2', 'R2_adj']
-        for m in metrics:
-            result[m] = np.zeros(len(cpgs))
+        result['Gene'] = manifest.loc[cpgs, 'Gene'].values
+        result['R2'] = ols['R2'].values
+        result['R2_adj'] = ols['R2_adj'].values
         for t in terms:
-            result[f"{t}_pvalue"] = np.zeros(len(cpgs))
-
-        for cpg_id, cpg in tqdm(enumerate(cpgs), desc='from_formula', total=len(cpgs)):
-            result['Gene'][cpg_id] = manifest.loc[cpg, 'Gene']
-            reg = smf.ols(formula=f"{cpg} ~ {formula}", data=df).fit()
-            pvalues = dict(reg.pvalues)
-            result['R2'][cpg_id] = reg.rsquared
-            result['R2_adj'][cpg_id] = reg.rsquared_adj
-            for t in terms:
-                result[f"{t}_pvalue"][cpg_id] = pvalues[t]
+            result[f"{t}_pvalue"] = ols[f"{t}_pvalue"].values
 
         result = correct_pvalues(result, [f"{t}_pvalue" for t in terms])
         result = pd.DataFrame(result)
@@ -2,9 +2,8 @@ import pandas as pd
 from scripts.python.routines.manifest import get_manifest
 import plotly.graph_objects as go
 import numpy as np
-from tqdm import tqdm
-from scipy.stats import mannwhitneyu
 from scripts.python.EWAS.routines.correction import correct_pvalues
+from scripts.python.EWAS.routines.rank_tests import mannwhitneyu_mass
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.layout import add_layout
 from scripts.python.routines.plot.box import add_box_trace
@@ -58,19 +57,11 @@ df_2 = df.loc[df[status_col].isin(status_2_cols), :]
 cpgs = betas.columns.values
 
 if is_rerun:
+    mw = mannwhitneyu_mass(df_1.loc[:, cpgs], df_2.loc[:, cpgs])
     result = {'CpG': cpgs}
-    result['Gene'] = np.zeros(len(cpgs), dtype=object)
-    metrics = ['statistic', 'pval']
-    for m in metrics:
-        result[m] = np.zeros(len(cpgs))
-
-    for cpg_id, cpg in tqdm(enumerate(cpgs), desc='Mann-Whitney U test', total=len(cpgs)):
-        result['Gene'][cpg_id] = manifest.loc[cpg, 'Gene']
-        data_1 = df_1[cpg].values
-        data_2 = df_2[cpg].values
-        statistic, pvalue = mannwhitneyu(data_1, data_2)
-        result['statistic'][cpg_id] = statistic
-        result['pval'][cpg_id] = pvalue
+    result['Gene'] = manifest.loc[cpgs, 'Gene'].values
+    result['statistic'] = mw['statistic'].values
+    result['pval'] = mw['pval'].values
 
     result = correct_pvalues(result, ['pval'])
     result = pd.DataFrame(result)
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+from patsy import dmatrix
+from scipy import stats
+from tqdm import tqdm
+
+
+def get_design(df: pd.DataFrame, formula: str):
+    """
+    Builds the design matrix for the right-hand side of the formula once for all CpGs.
+    Rows with missing covariates are dropped, as statsmodels does for `cpg ~ formula`.
+    """
+    design = dmatrix(formula, df, return_type='dataframe', NA_action='drop')
+    return design
+
+
+def _has_constant(X: np.ndarray):
+    return bool(np.any(np.all(X == X[0, :], axis=0) & (X[0, :] != 0)))
+
+
+def _fit_block(X: np.ndarray, Y: np.ndarray, k_constant: int):
+    n, p = X.shape
+    Q, R = np.linalg.qr(X)
+    R_inv = np.linalg.inv(R)
+    coef = R_inv @ (Q.T @ Y)
+    resid = Y - X @ coef
+    ssr = np.einsum('ij,ij->j', resid, resid)
+    df_resid = n - p
+    scale = ssr / df_resid
+    xtx_inv_diag = np.einsum('ij,ij->i', R_inv, R_inv)
+    bse = np.sqrt(np.outer(xtx_inv_diag, scale))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tvalues = coef / bse
+    pvalues = 2.0 * stats.t.sf(np.abs(tvalues), df_resid)
+    if k_constant:
+        centered = Y - Y.mean(axis=0)
+        tss = np.einsum('ij,ij->j', centered, centered)
+    else:
+        tss = np.einsum('ij,ij->j', Y, Y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = 1.0 - ssr / tss
+    r2_adj = 1.0 - (n - k_constant) / df_resid * (1.0 - r2)
+    return coef, tvalues, pvalues, r2, r2_adj, ssr
+
+
+def _fit_reduced_ssr(X: np.ndarray, Y: np.ndarray):
+    Q, _ = np.linalg.qr(X)
+    fitted = Q @ (Q.T @ Y)
+    resid = Y - fitted
+    return np.einsum('ij,ij->j', resid, resid)
+
+
+def ols_mass(design: pd.DataFrame, betas: pd.DataFrame, chunk_size: int = 20000, anova: bool = False, is_progress: bool = True):
+    """
+    Mass-univariate OLS `cpg ~ design` for every CpG column of betas, solved as one matrix problem
+    per chunk of CpGs (QR of the design times the betas block).
+
+    Args:
+        design: design matrix from get_design(); its index selects and orders subjects in betas
+        betas: subjects x CpGs frame
+        chunk_size: number of CpGs processed at once, bounds memory
+        anova: also compute type II F-tests for every model term (as pingouin.ancova / anova_lm(typ=2)
+            for additive models)
+
+    Returns:
+        DataFrame indexed by CpG with 'R2', 'R2_adj' and '{term}_coef', '{term}_tvalue', '{term}_pvalue'
+        for every design column (statsmodels names), plus '{term}_F', '{term}_pval' for every formula
+        term if anova is True.
+    """
+    X = design.values.astype(np.float64)
+    n, p = X.shape
+    if np.linalg.matrix_rank(X) < p:
+        raise ValueError(f"Design matrix is rank deficient: rank < {p}")
+    k_constant = int(_has_constant(X))
+    params_names = list(design.columns)
+
+    terms_slices = {}
+    if anova:
+        for term_name, term_slice in design.design_info.term_name_slices.items():
+            if term_name != 'Intercept':
+                terms_slices[term_name] = term_slice
+
+    cpgs = betas.columns.values
+    Y_all = betas.loc[design.index, :]
+
+    columns = ['R2', 'R2_adj']
+    for t in params_names:
+        columns += [f"{t}_coef", f"{t}_tvalue", f"{t}_pvalue"]
+    for t in terms_slices:
+        columns += [f"{t}_F", f"{t}_pval"]
+    result = np.full((len(cpgs), len(columns)), np.nan)
+
+    col_r2 = 0
+    col_r2_adj = 1
+    col_params = 2
+    col_terms = 2 + 3 * p
+
+    chunks = range(0, len(cpgs), chunk_size)
+    for start in tqdm(chunks, desc='OLS', disable=not is_progress):
+        stop = min(start + chunk_size, len(cpgs))
+        Y = Y_all.iloc[:, start:stop].to_numpy(dtype=np.float64)
+        is_complete = ~np.isnan(Y).any(axis=0)
+
+        blocks = []
+        if np.all(is_complete):
+            blocks.append((np.arange(stop - start), np.ones(n, dtype=bool)))
+        else:
+            blocks.append((np.where(is_complete)[0], np.ones(n, dtype=bool)))
+            # CpGs with missing values are solved against their own subjects subset
+            for col_id in np.where(~is_complete)[0]:
+                blocks.append((np.array([col_id]), ~np.isnan(Y[:, col_id])))
+
+        for cols, rows in blocks:
+            if len(cols) == 0 or rows.sum() <= p:
+                continue
+            X_curr = X[rows, :]
+            Y_curr = Y[np.ix_(rows, cols)]
+            coef, tvalues, pvalues, r2, r2_adj, ssr = _fit_block(X_curr, Y_curr, k_constant)
+            ids = start + cols
+            result[ids, col_r2] = r2
+            result[ids, col_r2_adj] = r2_adj
+            result[ids, col_params:col_terms:3] = coef.T
+            result[ids, col_params + 1:col_terms:3] = tvalues.T
+            result[ids, col_params + 2:col_terms:3] = pvalues.T
+            df_resid = X_curr.shape[0] - p
+            for term_id, (term_name, term_slice) in enumerate(terms_slices.items()):
+                mask = np.ones(p, dtype=bool)
+                mask[term_slice] = False
+                df_term = p - mask.sum()
+                ssr_reduced = _fit_reduced_ssr(X_curr[:, mask], Y_curr)
+                F = ((ssr_reduced - ssr) / df_term) / (ssr / df_resid)
+                result[ids, col_terms + 2 * term_id] = F
+                result[ids, col_terms + 2 * term_id + 1] = stats.f.sf(F, df_term, df_resid)
+
+    result = pd.DataFrame(result, index=cpgs, columns=columns)
+    result.index.name = 'CpG'
+    return result
+
+
+def corr_mass(x: pd.Series, betas: pd.DataFrame, method: str = 'pearson', chunk_size: int = 20000):
+    """
+    Pearson or Spearman correlation of x with every CpG column of betas, with the same
+    two-sided t-distribution p-values as scipy.stats.pearsonr / spearmanr.
+    Subjects with missing x are dropped; betas must not contain NaNs.
+
+    Returns:
+        DataFrame indexed by CpG with '{method}_r' and '{method}_pval'.
+    """
+    x = x.dropna()
+    x_vals = x.values.astype(np.float64)
+    if method == 'spearman':
+        x_vals = stats.rankdata(x_vals)
+    elif method != 'pearson':
+        raise ValueError(f"Unsupported method: {method}")
+    n = len(x_vals)
+    x_c = x_vals - x_vals.mean()
+    x_c = x_c / np.sqrt(np.dot(x_c, x_c))
+
+    cpgs = betas.columns.values
+    Y_all = betas.loc[x.index, :]
+    r = np.zeros(len(cpgs))
+    for start in range(0, len(cpgs), chunk_size):
+        stop = min(start + chunk_size, len(cpgs))
+        Y = Y_all.iloc[:, start:stop].to_numpy(dtype=np.float64)
+        if method == 'spearman':
+            Y = stats.rankdata(Y, axis=0)
+        Y_c = Y - Y.mean(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r[start:stop] = (x_c @ Y_c) / np.sqrt(np.einsum('ij,ij->j', Y_c, Y_c))
+    r = np.clip(r, -1.0, 1.0)
+    df = n - 2
+    with np.errstate(divide='ignore'):
+        t = r * np.sqrt(df / ((1.0 - r) * (1.0 + r)))
+    pval = 2.0 * stats.t.sf(np.abs(t), df)
+
+    result = pd.DataFrame({f"{method}_r": r, f"{method}_pval": pval}, index=cpgs)
+    result.index.name = 'CpG'
+    return result
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _ranks_and_ties(Y: np.ndarray):
+    """
+    Column-wise average ranks of a subjects x CpGs block and the tie term sum(t^3 - t) of every column.
+    For an element in a tie group of size t: t = max_rank - min_rank + 1, and summing (t^2 - 1)
+    over elements gives sum(t^3 - t) over groups.
+    """
+    rank_min = stats.rankdata(Y, method='min', axis=0)
+    rank_max = stats.rankdata(Y, method='max', axis=0)
+    ranks = 0.5 * (rank_min + rank_max)
+    t = rank_max - rank_min + 1.0
+    ties = np.sum(t * t - 1.0, axis=0)
+    return ranks, ties
+
+
+def _mannwhitneyu_block(Y: np.ndarray, n1: int, use_continuity: bool):
+    n = Y.shape[0]
+    n2 = n - n1
+    ranks, ties = _ranks_and_ties(Y)
+    r1 = ranks[:n1, :].sum(axis=0)
+    u1 = r1 - n1 * (n1 + 1) / 2.0
+    u2 = n1 * n2 - u1
+    u = np.maximum(u1, u2)
+    mu = n1 * n2 / 2.0
+    sigma = np.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1))))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (u - mu - (0.5 if use_continuity else 0.0)) / sigma
+    pval = np.clip(2.0 * stats.norm.sf(z), 0.0, 1.0)
+    return u1, pval
+
+
+def _kruskal_block(Y: np.ndarray, sizes: np.ndarray):
+    n = Y.shape[0]
+    ranks, ties = _ranks_and_ties(Y)
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+    h = np.zeros(Y.shape[1])
+    for g_id in range(len(sizes)):
+        r_g = ranks[bounds[g_id]:bounds[g_id + 1], :].sum(axis=0)
+        h += r_g * r_g / sizes[g_id]
+    h = 12.0 / (n * (n + 1)) * h - 3.0 * (n + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = h / (1.0 - ties / (n ** 3 - n))
+    pval = stats.chi2.sf(h, len(sizes) - 1)
+    return h, pval
+
+
+def _run_chunk(args):
+    test, Y, params = args
+    if test == 'mannwhitneyu':
+        return _mannwhitneyu_block(Y, **params)
+    elif test == 'kruskal':
+        return _kruskal_block(Y, **params)
+    else:
+        raise ValueError(f"Unsupported test: {test}")
+
+
+def _run(test: str, Y: np.ndarray, params: dict, chunk_size: int, n_jobs: int):
+    chunks = [(test, Y[:, start:start + chunk_size], params) for start in range(0, Y.shape[1], chunk_size)]
+    if n_jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_run_chunk, chunks))
+    else:
+        results = [_run_chunk(chunk) for chunk in chunks]
+    statistic = np.concatenate([r[0] for r in results])
+    pval = np.concatenate([r[1] for r in results])
+    nan_cols = np.isnan(Y).any(axis=0)
+    statistic[nan_cols] = np.nan
+    pval[nan_cols] = np.nan
+    return statistic, pval
+
+
+def mannwhitneyu_mass(data_1: pd.DataFrame, data_2: pd.DataFrame, use_continuity: bool = True, chunk_size: int = 20000, n_jobs: int = 1):
+    """
+    Two-sided Mann-Whitney U test for every CpG column at once, with tie correction and asymptotic
+    p-values (scipy.stats.mannwhitneyu(x, y, alternative='two-sided', method='asymptotic')).
+    The statistic is U of the first sample. Columns with NaNs get NaN.
+
+    Args:
+        data_1, data_2: subjects x CpGs frames of two groups with the same columns
+        chunk_size: number of CpGs ranked at once
+        n_jobs: number of processes the CpG chunks are split across
+
+    Returns:
+        DataFrame indexed by CpG with 'statistic' and 'pval'.
+    """
+    cpgs = data_1.columns.values
+    Y = np.concatenate([data_1.loc[:, cpgs].to_numpy(dtype=np.float64), data_2.loc[:, cpgs].to_numpy(dtype=np.float64)])
+    params = {'n1': data_1.shape[0], 'use_continuity': use_continuity}
+    statistic, pval = _run('mannwhitneyu', Y, params, chunk_size, n_jobs)
+    result = pd.DataFrame({'statistic': statistic, 'pval': pval}, index=cpgs)
+    result.index.name = 'CpG'
+    return result
+
+
+def kruskal_mass(groups: list, chunk_size: int = 20000, n_jobs: int = 1):
+    """
+    Kruskal-Wallis H test for every CpG column at once, with tie correction
+    (scipy.stats.kruskal(*groups)). Columns with NaNs get NaN.
+
+    Args:
+        groups: list of subjects x CpGs frames with the same columns, one per group
+        chunk_size: number of CpGs ranked at once
+        n_jobs: number of processes the CpG chunks are split across
+
+    Returns:
+        DataFrame indexed by CpG with 'statistic' and 'pval'.
+    """
+    if len(groups) < 2:
+        raise ValueError("Need at least two groups")
+    cpgs = groups[0].columns.values
+    Y = np.concatenate([g.loc[:, cpgs].to_numpy(dtype=np.float64) for g in groups])
+    params = {'sizes': np.array([g.shape[0] for g in groups])}
+    statistic, pval = _run('kruskal', Y, params, chunk_size, n_jobs)
+    result = pd.DataFrame({'statistic': statistic, 'pval': pval}, index=cpgs)
+    result.index.name = 'CpG'
+    return result
+
+
+def groups_test_mass(groups: list, chunk_size: int = 20000, n_jobs: int = 1):
+    """
+    Mann-Whitney U for two groups, Kruskal-Wallis for more.
+    """
+    if len(groups) > 2:
+        return kruskal_mass(groups, chunk_size=chunk_size, n_jobs=n_jobs)
+    elif len(groups) == 2:
+        return mannwhitneyu_mass(groups[0], groups[1], chunk_size=chunk_size, n_jobs=n_jobs)
+    else:
+        raise ValueError("Number of groups less than 2")
@@ -1,5 +1,5 @@
 import pandas as pd
-from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.manifest import get_manifest, get_manifest_index
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.scatter import add_scatter_trace
 from scripts.python.routines.plot.layout import add_layout
@@ -35,6 +35,7 @@ df = pd.merge(pheno, betas, left_index=True, right_index=True)
 df = df[df[age_pair[0]].notnull()]
 
 manifest = get_manifest(platform)
+manifest_index = get_manifest_index(platform)
 
 
 ages_types = ["DNAmAge", "DNAmAgeHannum", "DNAmPhenoAge", "DNAmGrimAge"]
@@ -59,7 +60,7 @@ for k, v in metrics.items():
         os.makedirs(save_path)
 
     result = {'CpG': cpgs}
-    result['Gene'] = np.zeros(len(cpgs), dtype=object)
+    result['Gene'] = manifest_index.annotate(cpgs)['Gene'].values
     metrics = ['R2', 'R2_adj', 'pearson_r', 'pearson_pval', 'spearman_r', 'spearman_pval']
     for m in metrics:
         result[m] = np.zeros(len(cpgs))
@@ -67,7 +68,6 @@ for k, v in metrics.items():
         result[f"{t}_pvalue"] = np.zeros(len(cpgs))
 
     for cpg_id, cpg in tqdm(enumerate(cpgs), desc='Regression', total=len(cpgs)):
-        result['Gene'][cpg_id] = manifest.loc[cpg, 'Gene']
         reg = smf.ols(formula=f"{cpg} ~ {formula}", data=df).fit()
         pvalues = dict(reg.pvalues)
         result['R2'][cpg_id] = reg.rsquared
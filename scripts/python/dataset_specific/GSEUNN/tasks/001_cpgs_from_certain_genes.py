@@ -1,5 +1,5 @@
 import pandas as pd
-from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.manifest import get_manifest, get_manifest_index
 import numpy as np
 import statsmodels.formula.api as smf
 from scripts.python.pheno.datasets.filter import filter_pheno, get_passed_fields
@@ -68,10 +68,11 @@ df_ctrl = df.loc[(df[status_col] == 'Control'), :]
 df_case = df.loc[(df[status_col] == 'ESRD'), :]
 
 manifest = get_manifest(platform)
-missed_genes = list(set(genes) - set(manifest['Gene'].to_list()))
+manifest_index = get_manifest_index(platform)
+missed_genes = list(set(genes) - set(manifest_index.get_values('Gene')))
 np.savetxt(f"{path_save}/missed_genes.txt", missed_genes, delimiter="\n", fmt="%s", encoding="utf-8")
 
-manifest_trgt = manifest.loc[manifest['Gene'].isin(genes), :]
+manifest_trgt = manifest.loc[manifest_index.get_cpgs(genes), :]
 cpgs = list(set(manifest_trgt.index.values).intersection(set(betas.columns.values)))
 manifest_trgt = manifest_trgt.loc[manifest_trgt.index.isin(cpgs), :]
 cpgs = list(manifest_trgt.index.values)
@@ -1,5 +1,5 @@
 import pandas as pd
-from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.manifest import get_manifest, get_manifest_index
 import numpy as np
 from scipy.stats import mannwhitneyu
 import plotly.graph_objects as go
@@ -30,6 +30,7 @@ np.savetxt(f"{path}/lists/genes/covid/Balnis2021.txt", list(covid_genes), fmt="%
 datasets_info = pd.read_excel(f"{path}/datasets.xlsx", index_col='dataset')
 platform = datasets_info.loc[dataset, 'platform']
 manifest = get_manifest(platform, path=path)
+manifest_index = get_manifest_index(platform, path=path)
 
 path_save = f"{path}/{platform}/{dataset}/special/005_covid_before_after"
 Path(f"{path_save}/cpgs").mkdir(parents=True, exist_ok=True)
@@ -86,14 +87,12 @@ for f_id, (f, row) in enumerate(result.iterrows()):
 
 cpgs = betas.columns.values
 result = {'CpG': cpgs}
-result['Gene'] = np.zeros(len(cpgs), dtype=object)
-result['Region'] = np.zeros(len(cpgs), dtype=object)
+result['Gene'] = manifest_index.annotate(cpgs)['Gene'].values
+result['Region'] = manifest_index.annotate(cpgs, ['UCSC_RefGene_Group'])['UCSC_RefGene_Group'].values
 metrics = ['mw_stat', 'mw_pval']
 for m in metrics:
     result[m] = np.zeros(len(cpgs))
 for cpg_id, cpg in tqdm(enumerate(cpgs), desc='Progress', total=len(cpgs)):
-    result['Gene'][cpg_id] = manifest.loc[cpg, 'Gene']
-    result['Region'][cpg_id] = manifest.loc[cpg, 'UCSC_RefGene_Group']
     mw_stat, mw_pval = mannwhitneyu(df_bef[cpg].values, df_aft[cpg].values)
     result['mw_stat'][cpg_id] = mw_stat
     result['mw_pval'][cpg_id] = mw_pval
@@ -1,5 +1,5 @@
 import pandas as pd
-from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.manifest import get_manifest, get_manifest_index
 import numpy as np
 import statsmodels.formula.api as smf
 from scripts.python.pheno.datasets.filter import filter_pheno, get_passed_fields
@@ -28,6 +28,7 @@ dataset = "GSEUNN"
 datasets_info = pd.read_excel(f"{path}/datasets.xlsx", index_col='dataset')
 platform = datasets_info.loc[dataset, 'platform']
 manifest = get_manifest(platform)
+manifest_index = get_manifest_index(platform)
 
 intxn_files = {
     "Alzheimer: Roubroeks (2020)": f"{path}/lists/cpgs/neurodegenerative/Blood/Alzheimer/Roubroeks_2020.xlsx",
@@ -70,10 +71,10 @@ betas = betas_drop_na(betas)
 
 df = pd.merge(pheno, betas, left_index=True, right_index=True)
 
-missed_genes = list(set(genes) - set(manifest['Gene'].to_list()))
+missed_genes = list(set(genes) - set(manifest_index.get_values('Gene')))
 np.savetxt(f"{path_save}/missed_genes.txt", missed_genes, delimiter="\n", fmt="%s", encoding="utf-8")
 
-manifest_trgt = manifest.loc[manifest['Gene'].isin(genes), :]
+manifest_trgt = manifest.loc[manifest_index.get_cpgs(genes), :]
 cpgs = list(set(manifest_trgt.index.values).intersection(set(betas.columns.values)))
 manifest_trgt = manifest_trgt.loc[manifest_trgt.index.isin(cpgs), :]
 cpgs = list(manifest_trgt.index.values)
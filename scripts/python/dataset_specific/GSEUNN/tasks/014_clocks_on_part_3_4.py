@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import OrdinalEncoder
 from sklearn.linear_model import ElasticNet, ElasticNetCV
-from sklearn.model_selection import RepeatedKFold, GridSearchCV
+from sklearn.model_selection import RepeatedKFold
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import pickle
 import random
@@ -16,6 +16,7 @@ from scipy.stats import mannwhitneyu
 import plotly.graph_objects as go
 import pathlib
 from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.clock_training import search_elastic_net, save_clock
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.layout import add_layout, get_axis
 from scripts.python.routines.plot.p_value import add_p_value_annotation
@@ -195,7 +196,6 @@ X_train = part_3_4[features].to_numpy()
 y_train = part_3_4[target].to_numpy()
 
 cv = RepeatedKFold(n_splits=3, n_repeats=10, random_state=1)
-model_type = ElasticNet(max_iter=10000, tol=0.01)
 
 #alphas = np.logspace(-5, np.log10(2.3 + 0.7 * random.uniform(0, 1)), 51)
 #alphas = np.logspace(-5, 1, 101)
@@ -203,35 +203,17 @@ alphas = [10]
 # l1_ratios = np.linspace(0.0, 1.0, 11)
 l1_ratios = [0.5]
 
-grid = dict()
-grid['alpha'] = alphas
-grid['l1_ratio'] = l1_ratios
-
-search = GridSearchCV(estimator=model_type, scoring=scoring, param_grid=grid, cv=cv, verbose=3)
-results = search.fit(X_train, y_train)
-
-model = results.best_estimator_
+# warm-started ElasticNet paths instead of GridSearchCV
+model, best_params, searching_process = search_elastic_net(X_train, y_train, alphas, l1_ratios, cv, scoring, max_iter=10000, tol=0.01)
 
 score = model.score(X_train, y_train)
-params = copy.deepcopy(results.best_params_)
+params = copy.deepcopy(best_params)
 
-searching_process = pd.DataFrame(results.cv_results_)
 searching_process.to_excel(f'{path_save}/searching_process_{scoring}.xlsx', index=False)
 
-model_dict = {'feature': ['Intercept'], 'coef': [model.intercept_]}
-num_features = 0
-for f_id, f in enumerate(features):
-    coef = model.coef_[f_id]
-    if abs(coef) > 0:
-        model_dict['feature'].append(f)
-        if f == 'Sex_ord_enc':
-            print("Sex included!")
-        model_dict['coef'].append(coef)
-        num_features += 1
-model_df = pd.DataFrame(model_dict)
-model_df.to_excel(f'{path_save}/clock.xlsx', index=False)
-with open(f'{path_save}/clock.pkl', 'wb') as handle:
-    pickle.dump(model, handle, protocol=pickle.HIGHEST_PROTOCOL)
+if 'Sex_ord_enc' in features and model.coef_[features.index('Sex_ord_enc')] != 0:
+    print("Sex included!")
+num_features = save_clock(model, features, path_save)
 
 y_pred_ctrl = calc_metrics(model, ctrl[features].to_numpy(), ctrl[target].to_numpy(), 'Control', params)
 y_pred_esrd = calc_metrics(model, esrd[features].to_numpy(), esrd[target].to_numpy(), 'ESRD', params)
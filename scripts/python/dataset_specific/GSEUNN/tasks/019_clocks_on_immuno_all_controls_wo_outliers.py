@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import ElasticNet, ElasticNetCV
-from sklearn.model_selection import RepeatedKFold, GridSearchCV
+from sklearn.model_selection import RepeatedKFold
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import pickle
 import random
@@ -15,6 +15,7 @@ from scipy.stats import mannwhitneyu
 import plotly.graph_objects as go
 import pathlib
 from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.clock_training import train_clock_repeated, save_clock
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.layout import add_layout, get_axis
 from scripts.python.routines.plot.p_value import add_p_value_annotation
@@ -82,63 +83,37 @@ n_repeats = 2
 random_state = 1
 k_fold = RepeatedKFold(n_splits=k, n_repeats=n_repeats, random_state=1)
 
-best_error = np.PINF
-best_model = None
-best_params = None
-best_train_idx = None
-best_val_idx = None
-for train_idx, val_idx in k_fold.split(range(ctrl.shape[0])):
-    X_train = ctrl.loc[ctrl.index[train_idx], features].to_numpy()
-    y_train = ctrl.loc[ctrl.index[train_idx], target].to_numpy()
-    X_val = ctrl.loc[ctrl.index[val_idx], features].to_numpy()
-    y_val = ctrl.loc[ctrl.index[val_idx], target].to_numpy()
-
-    # CV for detecting best params for ElasticNet
-    cv = RepeatedKFold(n_splits=5, n_repeats=3, random_state=1)
-    model_type = ElasticNet(max_iter=10000, tol=0.01)
-
-    alphas = np.logspace(-5, np.log10(2.3 + 0.7 * random.uniform(0, 1)), 11)
-    # alphas = np.logspace(-5, 1, 101)
-    # alphas = [10]
-    # l1_ratios = np.linspace(0.0, 1.0, 11)
-    l1_ratios = [0.5]
-
-    grid = dict()
-    grid['alpha'] = alphas
-    grid['l1_ratio'] = l1_ratios
-
-    search = GridSearchCV(estimator=model_type, scoring=scoring, param_grid=grid, cv=cv, verbose=0)
-    results = search.fit(X_train, y_train)
-
-    model = results.best_estimator_
-    score = model.score(X_train, y_train)
-
-    y_val_pred = model.predict(X_val)
-    rmse = np.sqrt(mean_squared_error(y_val, y_val_pred))
-    mae = mean_absolute_error(y_val, y_val_pred)
-
-    if best_error > rmse:
-        best_model = model
-        best_error = rmse
-        best_params = results.best_params_
-        best_train_idx = train_idx
-        best_val_idx = val_idx
+# CV for detecting best params for ElasticNet
+cv = RepeatedKFold(n_splits=5, n_repeats=3, random_state=1)
+# alphas = np.logspace(-5, 1, 101)
+# alphas = [10]
+# l1_ratios = np.linspace(0.0, 1.0, 11)
+l1_ratios = [0.5]
+n_jobs = 4
+
+# warm-started ElasticNet paths for inner folds, outer splits in parallel
+best = train_clock_repeated(
+    ctrl.loc[:, features].to_numpy(),
+    ctrl.loc[:, target].to_numpy(),
+    k_fold,
+    alphas=lambda: np.logspace(-5, np.log10(2.3 + 0.7 * random.uniform(0, 1)), 11),
+    l1_ratios=l1_ratios,
+    inner_cv=cv,
+    scoring=scoring,
+    max_iter=10000,
+    tol=0.01,
+    n_jobs=n_jobs,
+)
+best_model = best['model']
+best_error = best['rmse']
+best_params = best['params']
+best_train_idx = best['train_idx']
+best_val_idx = best['val_idx']
 
 print(f"Best RMSE in test: {best_error}")
 
 params = copy.deepcopy(best_params)
-model_dict = {'feature': ['Intercept'], 'coef': [best_model.intercept_]}
-num_features = 0
-for f_id, f in enumerate(features):
-    coef = best_model.coef_[f_id]
-    if abs(coef) > 0:
-        model_dict['feature'].append(f)
-        model_dict['coef'].append(coef)
-        num_features += 1
-model_df = pd.DataFrame(model_dict)
-model_df.to_excel(f'{path_save}/clock.xlsx', index=False)
-with open(f'{path_save}/clock.pkl', 'wb') as handle:
-    pickle.dump(best_model, handle, protocol=pickle.HIGHEST_PROTOCOL)
+num_features = save_clock(best_model, features, path_save)
 
 y_pred_ctrl_train = calc_metrics(best_model, ctrl.loc[ctrl.index[best_train_idx], features].to_numpy(), ctrl.loc[ctrl.index[best_train_idx], target].to_numpy(), 'Control_train', params)
 y_pred_ctrl_val = calc_metrics(best_model, ctrl.loc[ctrl.index[best_val_idx], features].to_numpy(), ctrl.loc[ctrl.index[best_val_idx], target].to_numpy(), 'Control_val', params)
@@ -16,7 +16,7 @@ from scripts.python.routines.plot.scatter import add_scatter_trace
 from scipy.stats import mannwhitneyu
 import plotly.graph_objects as go
 import pathlib
-from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.manifest import get_manifest, get_manifest_index
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.layout import add_layout, get_axis
 from scripts.python.routines.plot.p_value import add_p_value_annotation
@@ -36,6 +36,7 @@ path = f"E:/YandexDisk/Work/pydnameth/datasets"
 datasets_info = pd.read_excel(f"{path}/datasets.xlsx", index_col='dataset')
 platform = datasets_info.loc[dataset, 'platform']
 manifest = get_manifest(platform)
+manifest_index = get_manifest_index(platform)
 
 path_save = f"{path}/{platform}/{dataset}/special/023_dnam_dmps_for_clock_biomarkers_stat_tests"
 pathlib.Path(f"{path_save}/figs/by_gene/").mkdir(parents=True, exist_ok=True)
@@ -59,7 +60,7 @@ genes = pd.read_excel(f"{path}/{platform}/{dataset}/special/021_ml_data/immuno/m
 
 df_res = pd.DataFrame()
 for g_idx, g in enumerate(genes):
-    manifest_g = manifest.loc[manifest['Gene'] == g, :]
+    manifest_g = manifest.loc[manifest_index.get_cpgs(g), :]
 
     fig_group = go.Figure()
     fig_sex = go.Figure()
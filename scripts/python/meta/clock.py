@@ -1,7 +1,9 @@
 import pandas as pd
 from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.cohort import CohortSource, assemble_cohort
+from scripts.python.routines.clock import clock_from_model, apply_clocks
+from scripts.python.routines.clock_training import get_alpha_grid, search_elastic_net
 import numpy as np
-from sklearn.linear_model import ElasticNetCV
 from sklearn.model_selection import RepeatedKFold
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 from scipy.stats import mannwhitneyu
@@ -32,8 +34,8 @@ path_save = f"{path}/meta/EWAS/{target}"
 if not os.path.exists(f"{path_save}/clock"):
     os.makedirs(f"{path_save}/clock")
 
-pheno_all = pd.DataFrame(columns=['Age', 'Status'])
-pheno_all.index.name = 'subject_id'
+phenos = []
+sources = {}
 for d_id, dataset in enumerate(datasets_train):
 
     platform = datasets_info.loc[dataset, 'platform']
@@ -52,71 +54,50 @@ for d_id, dataset in enumerate(datasets_train):
     categorical_vars = {status_col: status_dict, sex_col: sex_dict}
     pheno = pd.read_pickle(f"{path}/{platform}/{dataset}/pheno_xtd.pkl")
     pheno = filter_pheno(dataset, pheno, continuous_vars, categorical_vars)
-    betas = pd.read_pickle(f"{path}/{platform}/{dataset}/betas.pkl")
-    na_cols = betas.columns[betas.isna().any()].tolist()
-    if len(na_cols) > 0:
-        print(f"CpGs with NaNs in {dataset}: {na_cols}")
-        s = betas.stack(dropna=False)
-        na_pairs = [list(x) for x in s.index[s.isna()]]
-        print(*na_pairs, sep='\n')
-    betas.dropna(axis='columns', how='any', inplace=True)
-    df = pd.merge(pheno, betas, left_index=True, right_index=True)
-
-    pheno = df[[age_col, status_col]]
+
+    pheno = pheno[[age_col, status_col]]
     status_dict_inverse = dict((v, k) for k, v in status_dict.items())
     pheno.replace({status_col:status_dict_inverse}, inplace=True)
     pheno.rename(columns={age_col: 'Age', status_col: 'Status'}, inplace=True)
-    pheno_all = pheno_all.append(pheno, verify_integrity=True)
-
-    cpgs = betas.columns.values
-    betas = df[cpgs].T
-    if d_id == 0:
-        betas_all = betas
-    else:
-        betas_all = betas_all.merge(betas, how='inner', left_index=True, right_index=True)
-
-betas_all = betas_all.T
-betas_all.index.name = "subject_id"
-df_all = pd.merge(pheno_all, betas_all, left_index=True, right_index=True)
+    phenos.append(pheno)
+    sources[dataset] = CohortSource.from_betas(f"{path}/{platform}/{dataset}", pheno.index)
 
 with open(f"cpgs.txt") as f:
     cpgs_target = f.read().splitlines()
-cpgs_target = list(set.intersection(set(betas_all.columns.values), set(cpgs_target)))
 
-X_target = df_all.loc[df_all['Status'] == 'Control', cpgs_target].to_numpy()
-y_target = df_all.loc[df_all['Status'] == 'Control', 'Age'].to_numpy()
+# only target CpGs common for all datasets and without NaNs are read, once, into one float32 matrix
+betas_all, _ = assemble_cohort(sources, cpgs=cpgs_target, dropna=True)
+pheno_all = pd.concat(phenos, axis=0, verify_integrity=True).loc[betas_all.index, :]
+pheno_all.index.name = 'subject_id'
+cpgs_target = list(betas_all.columns.values)
+
+is_control = (pheno_all['Status'] == 'Control').values
+X_target = betas_all.loc[is_control, cpgs_target].to_numpy()
+y_target = pheno_all.loc[is_control, 'Age'].to_numpy()
 
 cv = RepeatedKFold(n_splits=5, n_repeats=5, random_state=1337)
 
-clock = ElasticNetCV(n_alphas=20, cv=cv, n_jobs=2, verbose=1)
-clock.fit(X_target, y_target)
-
-clock_dict = {'feature': ['Intercept'], 'coef': [clock.intercept_], 'default': [0.0]}
-num_features = 0
-for cpg_id, cpg in enumerate(cpgs_target):
-    coef = clock.coef_[cpg_id]
-    if abs(coef) > 0:
-        clock_dict['feature'].append(cpg)
-        clock_dict['coef'].append(coef)
-        cpg_values = df_all.loc[df_all['Status'] == 'Control', cpg].to_numpy()
-        mean_value = np.mean(cpg_values)
-        clock_dict['default'].append(mean_value)
-        num_features += 1
-clock_df = pd.DataFrame(clock_dict)
-clock_df.set_index('feature', inplace=True)
+# same alphas as ElasticNetCV(n_alphas=20), folds are shared between threads without copying betas
+alphas = get_alpha_grid(X_target, y_target, l1_ratio=0.5, n_alphas=20)
+clock, clock_params, searching_process = search_elastic_net(X_target, y_target, alphas, [0.5], cv, scoring='neg_mean_squared_error', max_iter=1000, tol=1e-4, n_jobs=2)
+
+clock_linear = clock_from_model(clock, cpgs_target, X_target)
+clock_df = clock_linear.to_frame()
+num_features = len(clock_linear.features)
 if not os.path.exists(f"{path_save}/clock/{num_features}"):
     os.makedirs(f"{path_save}/clock/{num_features}")
 clock_df.to_excel(f"{path_save}/clock/{num_features}/clock.xlsx", index=True)
 pickle.dump(clock, open(f"{path_save}/clock/{num_features}/clock.sav", 'wb'))
 np.savetxt(f"{path_save}/clock/{num_features}/clock_cpgs.txt", cpgs_target, fmt='%s')
+searching_process.to_excel(f"{path_save}/clock/{num_features}/searching_process.xlsx", index=False)
 
-metrics_dict = {'alpha': clock.alpha_, 'l1_ratio': clock.l1_ratio_, 'num_features': num_features}
+metrics_dict = {'alpha': clock_params['alpha'], 'l1_ratio': clock_params['l1_ratio'], 'num_features': num_features}
 y_target_pred = clock.predict(X_target)
 metrics_dict['R2_Control'] = clock.score(X_target, y_target)
 metrics_dict['RMSE_Control'] = np.sqrt(mean_squared_error(y_target, y_target_pred))
 metrics_dict['MAE_Control'] = mean_absolute_error(y_target, y_target_pred)
-X_all = df_all.loc[:, cpgs_target].to_numpy()
-y_all = df_all.loc[:, 'Age'].to_numpy()
+X_all = betas_all.loc[:, cpgs_target].to_numpy()
+y_all = pheno_all.loc[:, 'Age'].to_numpy()
 y_all_pred = clock.predict(X_all)
 metrics_dict['R2_All'] = clock.score(X_all, y_all)
 metrics_dict['RMSE_All'] = np.sqrt(mean_squared_error(y_all, y_all_pred))
@@ -156,11 +137,15 @@ add_layout(box, "", 'Acceleration', f"p-val = {pvalue:0.4e}")
 box.update_layout({'colorway': ['blue', 'red']})
 save_figure(box, f"{path_save}/clock/{num_features}/box_Acceleration")
 
+ages_test = apply_clocks(
+    {'AgeEST': clock_linear},
+    {dataset: f"{path}/{datasets_info.loc[dataset, 'platform']}/{dataset}" for dataset in datasets_test}
+)
+
 for d_id, dataset in enumerate(datasets_test):
     print(dataset)
 
     platform = datasets_info.loc[dataset, 'platform']
-    manifest = get_manifest(platform)
 
     status_col = get_column_name(dataset, 'Status').replace(' ', '_')
     age_col = get_column_name(dataset, 'Age').replace(' ', '_')
@@ -174,25 +159,8 @@ for d_id, dataset in enumerate(datasets_test):
     categorical_vars = {status_col: status_dict, sex_col: sex_dict}
     pheno = pd.read_pickle(f"{path}/{platform}/{dataset}/pheno_xtd.pkl")
     pheno = filter_pheno(dataset, pheno, continuous_vars, categorical_vars)
-    betas = pd.read_pickle(f"{path}/{platform}/{dataset}/betas.pkl")
-    na_cols = betas.columns[betas.isna().any()].tolist()
-    if len(na_cols) > 0:
-        print(f"CpGs with NaNs in {dataset}: {na_cols}")
-        s = betas.stack(dropna=False)
-        na_pairs = [list(x) for x in s.index[s.isna()]]
-        print(*na_pairs, sep='\n')
-    betas.dropna(axis='columns', how='any', inplace=True)
-    df = pd.merge(pheno, betas, left_index=True, right_index=True)
-
-    df_for_clock = df.reindex(columns=cpgs_target, fill_value=0.0)
-    missing_cpgs = list(set(cpgs_target) - set(df.columns))
-    for cpg in missing_cpgs:
-        if cpg in clock_df.index:
-            df_for_clock[cpg] = clock_df.loc[cpg, 'default']
-        else:
-            df_for_clock[cpg] = 0
-
-    df[f'AgeEST'] = clock.predict(df_for_clock.to_numpy())
+    ages = ages_test.loc[ages_test['dataset'] == dataset, ['AgeEST']]
+    df = pd.merge(pheno, ages, left_index=True, right_index=True)
 
     df_1 = df.loc[(df[status_col] == status_dict['Control']), :]
     formula = f"AgeEST ~ {age_col}"
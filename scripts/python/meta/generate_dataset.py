@@ -7,10 +7,8 @@ import os
 import matplotlib.pyplot as plt
 from scripts.python.pheno.datasets.filter import filter_pheno, get_passed_fields
 from scripts.python.pheno.datasets.features import get_column_name, get_status_dict, get_statuses_datasets_dict
-from sklearn.feature_selection import VarianceThreshold
-from scripts.python.preprocessing.serialization.routines.pheno_betas_checking import get_pheno_betas_with_common_subjects
 from scripts.python.preprocessing.serialization.routines.save import save_pheno_betas_to_pkl
-from scripts.python.routines.betas import betas_drop_na
+from scripts.python.routines.cohort import CohortSource, assemble_cohort, get_variances
 import hashlib
 import pickle
 import json
@@ -38,6 +36,7 @@ datasets_control = ['GSE87571']
 target_features = ['Status']
 metric = 'variance' # 'list' 'variance'
 thld = 0.0
+betas_format = "pkl" # 'pkl' 'columnar'
 
 statuses_datasets_dict = get_statuses_datasets_dict()
 datasets = {}
@@ -65,11 +64,13 @@ if not os.path.exists(f"{path_save}/figs"):
 with open(f"{path_save}/info.json", 'w', encoding='utf-8') as f:
     json.dump(info, f, ensure_ascii=False, indent=4)
 
-pheno_all = pd.DataFrame(columns=target_features + ['Dataset'])
-pheno_all.index.name = 'subject_id'
+phenos = []
+sources = {}
 for d_id, dataset in enumerate(datasets):
     print(dataset)
     platform = datasets_info.loc[dataset, 'platform']
+    if d_id == 0:
+        manifest = get_manifest(platform)
 
     curr_statuses = datasets[dataset]
 
@@ -80,39 +81,24 @@ for d_id, dataset in enumerate(datasets):
     categorical_vars = {status_col: [x.column for x in status_passed_fields]}
     pheno = pd.read_pickle(f"{path}/{platform}/{dataset}/pheno.pkl")
     pheno = filter_pheno(dataset, pheno, continuous_vars, categorical_vars)
-    betas = pd.read_pickle(f"{path}/{platform}/{dataset}/betas.pkl")
-    betas = betas_drop_na(betas)
-    df = pd.merge(pheno, betas, left_index=True, right_index=True)
 
-    pheno = df.loc[:, [status_col]]
+    pheno = pheno.loc[:, [status_col]]
     status_dict_inverse = dict((x.column, x.label) for x in status_passed_fields)
     pheno[status_col].replace(status_dict_inverse, inplace=True)
     pheno.rename(columns={status_col: 'Status'}, inplace=True)
     pheno.loc[:, 'Dataset'] = dataset
-    pheno_all = pheno_all.append(pheno, verify_integrity=True)
-
-    cpgs = betas.columns.values
-    betas = df[cpgs].T
-    if d_id == 0:
-        betas_all = betas
-        manifest = get_manifest(platform)
-    else:
-        betas_all = betas_all.merge(betas, how='inner', left_index=True, right_index=True)
+    phenos.append(pheno)
+    sources[dataset] = CohortSource.from_betas(f"{path}/{platform}/{dataset}", pheno.index)
 
+# common CpGs without NaNs are read once from every dataset into one float32 matrix,
+# with columnar format it is written straight to {path_save}/betas
+betas_all, _ = assemble_cohort(sources, dropna=True, path=f"{path_save}/betas" if betas_format == "columnar" else None)
+pheno_all = pd.concat(phenos, axis=0, verify_integrity=True).loc[betas_all.index, :]
+pheno_all.index.name = 'subject_id'
 print(f"Number of remaining subjects: {pheno_all.shape[0]}")
 
-betas_all = betas_all.T
-betas_all.index.name = "subject_id"
-betas_all = betas_all.astype('float32')
-
-cpgs_metrics_dict = {'CpG': betas_all.columns.values}
-vt = VarianceThreshold(thld)
-vt.fit(betas_all)
-vt_metrics = vt.variances_
-vt_bool = vt.get_support()
-cpgs_metrics_dict['variance'] = vt_metrics
-cpgs_metrics_df = pd.DataFrame(cpgs_metrics_dict)
-cpgs_metrics_df.set_index('CpG', inplace=True)
+cpgs_metrics_df = get_variances(betas_all).to_frame()
+cpgs_metrics_df.index.name = 'CpG'
 cpgs_metrics_df.to_excel(f"{path_save}/cpgs_metrics.xlsx", index=True)
 plot = cpgs_metrics_df['variance'].plot.kde(ind=np.logspace(-5, 0, 501))
 plt.xlabel("Values", fontsize=15)
@@ -127,8 +113,12 @@ plt.close()
 path_save = f"{path}/meta/{folder_name}"
 if not os.path.exists(f"{path_save}"):
     os.makedirs(f"{path_save}")
-print(f"Number of remaining CpGs: {betas_all.shape[1]}")
+print(f"Number of remaining CpGs: {cpgs_metrics_df.shape[0]}")
 manifest.to_excel(f"{path_save}/manifest.xlsx", index=True)
 
-pheno_all, betas_all = get_pheno_betas_with_common_subjects(pheno_all, betas_all)
-save_pheno_betas_to_pkl(pheno_all, betas_all, f"{path_save}")
+# subjects of pheno and betas are the same and in the same order
+if betas_format == "columnar":
+    pheno_all.to_pickle(f"{path_save}/pheno.pkl")
+    pheno_all.to_excel(f"{path_save}/pheno.xlsx", index=True)
+else:
+    save_pheno_betas_to_pkl(pheno_all, betas_all, f"{path_save}")
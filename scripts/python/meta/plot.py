@@ -1,5 +1,6 @@
 import pandas as pd
 from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.betas import load_betas
 import statsmodels.formula.api as smf
 import plotly.graph_objects as go
 from scripts.python.routines.plot.save import save_figure
@@ -45,7 +46,7 @@ for dataset in datasets:
     categorical_vars = {status_col: status_dict, sex_col: sex_dict}
     pheno = pd.read_pickle(f"{path}/{platform}/{dataset}/pheno_xtd.pkl")
     pheno = filter_pheno(dataset, pheno, continuous_vars, categorical_vars)
-    betas = pd.read_pickle(f"{path}/{platform}/{dataset}/betas.pkl")
+    betas = load_betas(f"{path}/{platform}/{dataset}", cpgs=cpgs)
     df = pd.merge(pheno, betas, left_index=True, right_index=True)
 
     for cpg_id, cpg in enumerate(cpgs):
@@ -1,6 +1,6 @@
 import pandas as pd
 from scripts.python.routines.manifest import get_manifest
-from scripts.python.preprocessing.serialization.routines.pheno_betas_checking import get_pheno_betas_with_common_subjects
+from scripts.python.routines.cohort import CohortSource, assemble_cohort, get_common_cpgs
 import pathlib
 from scripts.python.meta.tasks.GPL13534_Blood.routines import perform_test_for_controls
 from tqdm import tqdm
@@ -47,53 +47,36 @@ pathlib.Path(f"{path_wd}/harmonized/cpgs/figs").mkdir(parents=True, exist_ok=Tru
 pathlib.Path(f"{path_wd}/harmonized/cpgs/diffs").mkdir(parents=True, exist_ok=True)
 
 # Train/Val data =======================================================================================================
-pheno_trn_val = pd.DataFrame()
-pheno_trn_val.index.name = 'subject_id'
-mvals_trn_val = pd.DataFrame()
-origin_df = pd.DataFrame()
+phenos = []
+sources = {}
+origin_sources = {}
 for d_id, dataset in enumerate(datasets_trn_val):
     print(dataset)
     pheno_i = pd.read_pickle(f"{path_wd}/origin/pheno_trn_val_{dataset}.pkl")
-    pheno_cols = pheno_i.columns.values
-    mvals_i = pd.read_csv(f"{path_wd}/harmonized/r/mvalsT_trn_val_{dataset}_regRCPqn.txt", delimiter="\t", index_col='ID_REF')
-    mvals_i = mvals_i.T
-    mvals_cols = mvals_i.columns.values
-    df_i = pd.merge(pheno_i, mvals_i, left_index=True, right_index=True)
-    pheno_i = df_i.loc[:, pheno_cols]
-    mvals_i = df_i.loc[:, mvals_cols]
-
-    pheno_trn_val = pheno_trn_val.append(pheno_i, verify_integrity=True)
-
-    mvals_i = mvals_i.T
-    if d_id == 0:
-        mvals_trn_val = mvals_i
-    else:
-        mvals_trn_val = mvals_trn_val.merge(mvals_i, how='inner', left_index=True, right_index=True)
+    phenos.append(pheno_i)
+    sources[dataset] = CohortSource(f"{path_wd}/harmonized/r/mvalsT_trn_val_{dataset}_regRCPqn.txt", pheno_i.index, index_col='ID_REF')
+    origin_sources[dataset] = CohortSource(f"{path_wd}/origin/mvalsT_trn_val_{dataset}.pkl", pheno_i.index, transposed=True)
 
-    pheno_origin = pd.read_pickle(f"{path_wd}/origin/pheno_trn_val_{dataset}.pkl")
-    mvals_origin = pd.read_pickle(f"{path_wd}/origin/mvalsT_trn_val_{dataset}.pkl")
-    mvals_origin = mvals_origin.T
-    origin_df_i = pd.merge(pheno_origin, mvals_origin, left_index=True, right_index=True)
-    origin_df = origin_df.append(origin_df_i, verify_integrity=True)
-
-mvals_trn_val = mvals_trn_val.T
-mvals_trn_val.index.name = "subject_id"
-mvals_trn_val = mvals_trn_val.astype('float32')
+# common CpGs are read once from every dataset into one float32 matrix, subjects are in the order of pheno
+mvals_trn_val, _ = assemble_cohort(sources)
+pheno_trn_val = pd.concat(phenos, axis=0, verify_integrity=True).loc[mvals_trn_val.index, :]
+pheno_trn_val.index.name = 'subject_id'
 print(f"Number of total subjects: {mvals_trn_val.shape[0]}")
 print(f"Number of total CpGs: {mvals_trn_val.shape[1]}")
-pheno_trn_val, mvals_trn_val = get_pheno_betas_with_common_subjects(pheno_trn_val, mvals_trn_val)
 feats = pheno_trn_val.columns.values
 cpgs = mvals_trn_val.columns.values
-df_trn_val = pd.merge(pheno_trn_val, mvals_trn_val, left_index=True, right_index=True)
-pheno_trn_val = df_trn_val.loc[:, feats]
-mvals_trn_val = df_trn_val.loc[:, cpgs]
+df_trn_val = pd.concat([pheno_trn_val, mvals_trn_val], axis=1)
+del mvals_trn_val
 df_trn_val.to_pickle(f"{path_wd}/harmonized/data_trn_val.pkl")
 pheno_trn_val.to_excel(f"{path_wd}/harmonized/pheno_trn_val.xlsx", index=True)
 
 # Check harmonization ==================================================================================================
-if origin_df.shape != df_trn_val.shape:
+# origin values are not loaded here, only CpGs and subjects are compared
+origin_cpgs = get_common_cpgs(origin_sources)
+origin_subjects = pd.Index(np.concatenate([x.get_subjects().values for x in origin_sources.values()]))
+if len(origin_subjects) != df_trn_val.shape[0] or len(origin_cpgs) != len(cpgs) or not origin_cpgs.isin(cpgs).all():
     raise ValueError(f"Wrong shape")
-if not origin_df.index.equals(df_trn_val.index):
+if not origin_subjects.equals(df_trn_val.index):
     raise ValueError(f"Wrong indexes")
 
 cpgs_metrics_harmonized_df = perform_test_for_controls(datasets_trn_val, manifest, df_trn_val, cpgs, f"{path_wd}/harmonized/cpgs/figs", "M value")
@@ -110,6 +93,9 @@ cpgs_changed.to_excel(f"{path_wd}/harmonized/cpgs/cpgs_changed_{thld_above}_{thl
 
 # Plot harmonization ===================================================================================================
 cpgs_to_plot_df = cpgs_changed.head(20)
+# origin values are read only for plotted CpGs
+origin_mvals, _ = assemble_cohort(origin_sources, cpgs=cpgs_to_plot_df.index)
+origin_df = pd.concat([pheno_trn_val, origin_mvals], axis=1)
 for cpg_id, (cpg, row) in enumerate(cpgs_to_plot_df.iterrows()):
     dist_num_bins = 25
     pval = row['pval_fdr_bh_origin']
@@ -201,16 +187,13 @@ for cpg_id, (cpg, row) in enumerate(cpgs_to_plot_df.iterrows()):
 # Test data ============================================================================================================
 for d_id, dataset in enumerate(datasets_tst):
     print(dataset)
-    mvals = pd.read_csv(f"{path_wd}/harmonized/r/mvalsT_tst_{dataset}_regRCPqn.txt", delimiter="\t", index_col='ID_REF')
-    mvals = mvals.T
-    mvals.index.name = "subject_id"
-    mvals = mvals.astype('float32')
     pheno = pd.read_pickle(f"{path_wd}/origin/pheno_tst_{dataset}.pkl")
+    source = CohortSource(f"{path_wd}/harmonized/r/mvalsT_tst_{dataset}_regRCPqn.txt", pheno.index, index_col='ID_REF')
+    mvals, _ = assemble_cohort({dataset: source})
     print(f"Number of total subjects: {pheno.shape[0]}")
     print(f"Number of total CpGs: {mvals.shape[1]}")
-    cpgs = mvals.columns.values
     feats = pheno.columns.values
-    df = pd.merge(pheno, mvals, left_index=True, right_index=True)
+    df = pd.concat([pheno.loc[mvals.index, :], mvals], axis=1)
     df.to_pickle(f"{path_wd}/harmonized/data_tst_{dataset}.pkl")
     pheno_test = df.loc[:, feats]
     pheno_test.to_excel(f"{path_wd}/harmonized/pheno_tst_{dataset}.xlsx", index=True)
@@ -1,29 +1,18 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import kruskal, mannwhitneyu
+from scripts.python.EWAS.routines.rank_tests import groups_test_mass
 from statsmodels.stats.multitest import multipletests
 from scripts.python.routines.plot.layout import add_layout
 from scripts.python.routines.plot.save import save_figure
 import plotly.graph_objects as go
-from tqdm import tqdm
 import plotly.express as px
 
 
-def perform_test_for_controls(datasets, manifest, df, cpgs, path, y_label, n_plot=20):
+def perform_test_for_controls(datasets, manifest, df, cpgs, path, y_label, n_plot=20, n_jobs=1):
+    df_controls = df.loc[df['Status'] == 'Control', :]
+    groups = [df_controls.loc[df_controls['Dataset'] == dataset, cpgs] for dataset in datasets]
     cpgs_metrics_dict = {'CpG': cpgs}
-    cpgs_metrics_dict['pval'] = []
-    for cpg_id, cpg in enumerate(tqdm(cpgs)):
-        vals = {}
-        for dataset in datasets:
-            vals_i = df.loc[(df['Status'] == 'Control') & (df['Dataset'] == dataset), cpg].values
-            vals[dataset] = vals_i
-        if len(datasets) > 2:
-            stat, pval = kruskal(*vals.values())
-        elif len(datasets) == 2:
-            stat, pval = mannwhitneyu(*vals.values(), alternative='two-sided')
-        else:
-            raise ValueError("Number of datasets less than 2")
-        cpgs_metrics_dict['pval'].append(pval)
+    cpgs_metrics_dict['pval'] = groups_test_mass(groups, n_jobs=n_jobs)['pval'].values
     _, pvals_corr, _, _ = multipletests(cpgs_metrics_dict['pval'], 0.05, method='fdr_bh')
     cpgs_metrics_dict['pval_fdr_bh'] = pvals_corr
     _, pvals_corr, _, _ = multipletests(cpgs_metrics_dict['pval'], 0.05, method='bonferroni')
@@ -1,27 +1,20 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import kruskal
+from scripts.python.EWAS.routines.rank_tests import kruskal_mass
 from scripts.python.routines.manifest import get_manifest
 import pathlib
 from statsmodels.stats.multitest import multipletests
 from scripts.python.routines.plot.layout import add_layout, get_axis
 from scripts.python.routines.plot.save import save_figure
 import plotly.graph_objects as go
-from tqdm import tqdm
 from scripts.python.routines.mvals import logit2, expit2
 
 
-def KW_Control(datasets, manifest, df, cpgs, path, y_label):
+def KW_Control(datasets, manifest, df, cpgs, path, y_label, n_jobs=1):
+    df_controls = df.loc[df['Status'] == 'Control', :]
+    kw_vals = [df_controls.loc[df_controls['Dataset'] == dataset, cpgs] for dataset in datasets]
     cpgs_metrics_dict = {'CpG': cpgs}
-
-    cpgs_metrics_dict['KW_Controls_pval'] = []
-    for cpg_id, cpg in enumerate(tqdm(cpgs)):
-        kw_vals = {}
-        for dataset in datasets:
-            vals_i = df.loc[(df['Status'] == 'Control') & (df['Dataset'] == dataset), cpg].values
-            kw_vals[dataset] = vals_i
-        stat, pval = kruskal(*kw_vals.values())
-        cpgs_metrics_dict['KW_Controls_pval'].append(pval)
+    cpgs_metrics_dict['KW_Controls_pval'] = kruskal_mass(kw_vals, n_jobs=n_jobs)['pval'].values
     _, pvals_corr, _, _ = multipletests(cpgs_metrics_dict['KW_Controls_pval'], 0.05, method='fdr_bh')
     cpgs_metrics_dict['KW_Controls_pval_fdr_bh'] = pvals_corr
     _, pvals_corr, _, _ = multipletests(cpgs_metrics_dict['KW_Controls_pval'], 0.05, method='bonferroni')
@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
 from scipy.stats import pearsonr, spearmanr, mannwhitneyu
-from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.manifest import get_manifest, get_manifest_index
 from scripts.python.EWAS.routines.correction import correct_pvalues
 from tqdm import tqdm
 
@@ -16,6 +16,7 @@ tissues = ['Brain', 'Liver', 'Blood']
 
 platform = 'GPL13534'
 manifest = get_manifest(platform)
+manifest_index = get_manifest_index(platform)
 
 for tissue in tissues:
     tmp_path = f"{path_save}/{tissue}"
@@ -29,13 +30,12 @@ for tissue in tissues:
     cpgs = betas.columns.values
 
     result = {'CpG': cpgs}
-    result['Gene'] = np.zeros(len(cpgs), dtype=object)
+    result['Gene'] = manifest_index.annotate(cpgs)['Gene'].values
     metrics = ['pearson_r', 'pearson_pval', 'spearman_r', 'spearman_pval', 'mannwhitney_stat', 'mannwhitney_pval']
     for m in metrics:
         result[m] = np.zeros(len(cpgs))
 
     for cpg_id, cpg in tqdm(enumerate(cpgs), desc=f'{tissue}', total=len(cpgs)):
-        result['Gene'][cpg_id] = manifest.loc[cpg, 'Gene']
         pearson_r, pearson_pval = pearsonr(df[cpg].values, df['Age'].values)
         result['pearson_r'][cpg_id] = pearson_r
         result['pearson_pval'][cpg_id] = pearson_pval
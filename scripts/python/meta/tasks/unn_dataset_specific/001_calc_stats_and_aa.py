@@ -6,7 +6,7 @@ import plotly.graph_objects as go
 from scipy.stats import mannwhitneyu
 from scripts.python.EWAS.routines.correction import correct_pvalues
 from tqdm import tqdm
-from scripts.python.routines.manifest import get_manifest
+from scripts.python.routines.manifest import get_manifest, get_manifest_index
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.scatter import add_scatter_trace
 from scripts.python.routines.plot.box import add_box_trace
@@ -97,6 +97,7 @@ pheno_all, betas_all = get_pheno_betas_with_common_subjects(pheno_all, betas_all
 
 platform = datasets_info.loc['GSEUNN', 'platform']
 manifest = get_manifest(platform)
+manifest_index = get_manifest_index(platform)
 
 pheno_gse = pheno_all.loc[pheno_all['Dataset'] != 'GSEUNN', :]
 pheno_unn = pheno_all.loc[pheno_all['Dataset'] == 'GSEUNN', :]
@@ -179,7 +180,7 @@ save_figure(fig, f"{path_save}/figs/histogram_Age")
 
 cpgs = betas_all.columns.values
 result = {'CpG': cpgs}
-result['Gene'] = np.zeros(len(cpgs), dtype=object)
+result['Gene'] = manifest_index.annotate(cpgs)['Gene'].values
 vt = VarianceThreshold(0.0)
 vt.fit(betas_all)
 vt_metrics = vt.variances_
@@ -189,7 +190,6 @@ for m in metrics:
     result[m] = np.zeros(len(cpgs))
 
 for cpg_id, cpg in tqdm(enumerate(cpgs), desc=f'CpGs', total=len(cpgs)):
-    result['Gene'][cpg_id] = manifest.loc[cpg, 'Gene']
     mannwhitney_stat, mannwhitney_pval = mannwhitneyu(df_unn[cpg].values, df_gse[cpg].values)
     result['mw_stat'][cpg_id] = mannwhitney_stat
     result['mw_pval'][cpg_id] = mannwhitney_pval
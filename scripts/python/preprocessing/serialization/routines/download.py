@@ -1,32 +1,127 @@
 import pandas as pd
+import numpy as np
 import GEOparse
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
-def download_betas_and_pvals_from_gsms(gsms, path):
 
-    for gsm_id, gsm in tqdm(enumerate(gsms)):
-        while True:
+def get_gsm_table(gsm, destdir):
+    """
+    GSM data table indexed by ID_REF. Files already present in destdir are parsed without downloading,
+    so a local directory of GSM files can stand in for GEO.
+    """
+    gsm_data = GEOparse.get_GEO(geo=gsm, destdir=destdir, include_data=True, how="full", silent=True)
+    return gsm_data.table.set_index('ID_REF')
+
+
+def fetch_with_retries(fetch_func, gsm, destdir, max_retries=5, backoff=2.0):
+    for attempt in range(max_retries):
+        try:
+            return fetch_func(gsm, destdir)
+        except (ValueError, ConnectionError, IOError):
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def download_gsms_values(gsms, path, num_values, n_jobs=8, max_retries=5, backoff=2.0, fetch_func=get_gsm_table):
+    """
+    Downloads GSMs in a pool of n_jobs threads and writes the first num_values columns of every GSM table
+    into preallocated float32 subjects x CpGs matrices ({path}/gsms/values_{i}.npy, CpGs of the first GSM).
+    Finished GSMs are appended to {path}/gsms/manifest.txt, so an interrupted download resumes from them.
+    Every GSM is retried max_retries times with exponential backoff; GSMs failed after all retries
+    are reported with RuntimeError after the others are saved.
+
+    Returns:
+        List of num_values DataFrames indexed by subject_id.
+    """
+    gsms = list(gsms)
+    destdir = f"{path}/gsms"
+    if not os.path.exists(destdir):
+        os.makedirs(destdir)
+    fn_info = f"{destdir}/info.json"
+    fn_cpgs = f"{destdir}/cpgs.txt"
+    fn_manifest = f"{destdir}/manifest.txt"
+    fns_values = [f"{destdir}/values_{i}.npy" for i in range(num_values)]
+
+    info = {'gsms': gsms, 'num_values': num_values}
+    is_resume = os.path.isfile(fn_info) and os.path.isfile(fn_cpgs) and all(os.path.isfile(fn) for fn in fns_values)
+    if is_resume:
+        with open(fn_info) as f:
+            is_resume = json.load(f) == info
+
+    gsm_ids = {gsm: gsm_id for gsm_id, gsm in enumerate(gsms)}
+    lock = threading.Lock()
+    done = set()
+    first_table = None
+
+    if is_resume:
+        with open(fn_cpgs) as f:
+            cpgs = pd.Index(f.read().splitlines(), name='ID_REF')
+        values = [np.load(fn, mmap_mode='r+') for fn in fns_values]
+        if os.path.isfile(fn_manifest):
+            with open(fn_manifest) as f:
+                done = set(f.read().splitlines())
+        print(f"Resuming download: {len(done)} of {len(gsms)} GSMs are ready")
+    else:
+        first_table = fetch_with_retries(fetch_func, gsms[0], destdir, max_retries, backoff)
+        cpgs = pd.Index(first_table.index.astype(str), name='ID_REF')
+        with open(fn_cpgs, 'w') as f:
+            f.write('\n'.join(cpgs))
+        values = []
+        for fn in fns_values:
+            v = np.lib.format.open_memmap(fn, mode='w+', dtype=np.float32, shape=(len(gsms), len(cpgs)))
+            v[:] = np.nan
+            values.append(v)
+        with open(fn_manifest, 'w') as f:
+            f.write('')
+        with open(fn_info, 'w') as f:
+            json.dump(info, f)
+
+    def write_gsm(gsm, table):
+        rows = cpgs.get_indexer(table.index.astype(str))
+        is_known = rows >= 0
+        table_values = table.iloc[:, :num_values].to_numpy(dtype=np.float32)
+        with lock:
+            for i in range(num_values):
+                values[i][gsm_ids[gsm], rows[is_known]] = table_values[is_known, i]
+                values[i].flush()
+            with open(fn_manifest, 'a') as f:
+                f.write(f"{gsm}\n")
+            done.add(gsm)
+
+    def process_gsm(gsm):
+        table = fetch_with_retries(fetch_func, gsm, destdir, max_retries, backoff)
+        write_gsm(gsm, table)
+
+    if first_table is not None:
+        write_gsm(gsms[0], first_table)
+    todo = [gsm for gsm in gsms if gsm not in done]
+    failed = {}
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        futures = {executor.submit(process_gsm, gsm): gsm for gsm in todo}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="GSMs"):
             try:
-                gsm_data = GEOparse.get_GEO(geo=gsm, destdir= f"{path}/gsms", include_data=True, how="full", silent=True)
-            except ValueError:
-                continue
-            except ConnectionError:
-                continue
-            except IOError:
-                continue
-            break
-
-        gsm_data.table.set_index('ID_REF', inplace=True)
-        if gsm_id == 0:
-            betas = pd.DataFrame(0, index=gsm_data.table.index, columns=gsms)
-            pvals = pd.DataFrame(0, index=gsm_data.table.index, columns=gsms)
-        betas[gsm] = gsm_data.table.iloc[:, 0]
-        pvals[gsm] = gsm_data.table.iloc[:, 1]
-
-    betas = betas.T
-    betas.index.name = "subject_id"
-    pvals = pvals.T
-    pvals.index.name = "subject_id"
+                future.result()
+            except (ValueError, ConnectionError, IOError) as e:
+                failed[futures[future]] = e
+    if len(failed) > 0:
+        raise RuntimeError(f"Failed to download {len(failed)} GSMs after {max_retries} retries, rerun to resume: {list(failed.keys())}")
+
+    dfs = []
+    for v in values:
+        df = pd.DataFrame(np.array(v), index=gsms, columns=cpgs.values)
+        df.index.name = "subject_id"
+        dfs.append(df)
+    return dfs
+
+
+def download_betas_and_pvals_from_gsms(gsms, path, n_jobs=8, max_retries=5):
+    betas, pvals = download_gsms_values(gsms, path, 2, n_jobs=n_jobs, max_retries=max_retries)
 
     print(f"Number of NaNs in betas: {betas.isna().values.sum()}")
     print(f"Number of NaNs in pvals: {pvals.isna().values.sum()}")
@@ -34,28 +129,9 @@ def download_betas_and_pvals_from_gsms(gsms, path):
     return betas, pvals
 
 
-def download_betas_from_gsms(gsms, path):
-
-    for gsm_id, gsm in tqdm(enumerate(gsms)):
-        while True:
-            try:
-                gsm_data = GEOparse.get_GEO(geo=gsm, destdir= f"{path}/gsms", include_data=True, how="full", silent=True)
-            except ValueError:
-                continue
-            except ConnectionError:
-                continue
-            except IOError:
-                continue
-            break
-
-        gsm_data.table.set_index('ID_REF', inplace=True)
-        if gsm_id == 0:
-            betas = pd.DataFrame(0, index=gsm_data.table.index, columns=gsms)
-        betas[gsm] = gsm_data.table.iloc[:, 0]
-
-    betas = betas.T
-    betas.index.name = "subject_id"
+def download_betas_from_gsms(gsms, path, n_jobs=8, max_retries=5):
+    betas = download_gsms_values(gsms, path, 1, n_jobs=n_jobs, max_retries=max_retries)[0]
 
     print(f"Number of NaNs in betas: {betas.isna().values.sum()}")
 
-    return betas
\ No newline at end of file
+    return betas
@@ -1,5 +1,6 @@
 import pandas as pd
-from tqdm import tqdm
+import numpy as np
+
 
 def get_forbidden_cpgs(path, types):
     forbidden_cpgs = set()
@@ -10,22 +11,83 @@ def get_forbidden_cpgs(path, types):
     return list(forbidden_cpgs)
 
 
+def iter_npy_chunks(fn, index, columns, chunk_size=1000):
+    """
+    Yields DataFrames of chunk_size rows of subjects x CpGs matrix saved in .npy file (e.g. values_{i}.npy of GSMs download),
+    only the current chunk is read from disk.
+    """
+    values = np.load(fn, mmap_mode='r')
+    for start in range(0, values.shape[0], chunk_size):
+        end = min(start + chunk_size, values.shape[0])
+        yield pd.DataFrame(np.array(values[start:end]), index=index[start:end], columns=columns)
+
+
+def get_failed_fractions(pvals, det_pval=0.01) -> pd.Series:
+    """
+    Fraction of subjects with detection p-value above det_pval for every CpG.
+    pvals is a DataFrame or an iterable of DataFrames with the same columns (chunks of subjects).
+    """
+    if isinstance(pvals, pd.DataFrame):
+        pvals = [pvals]
+    num_failed = None
+    num_subjects = 0
+    columns = None
+    for chunk in pvals:
+        if num_failed is None:
+            columns = chunk.columns
+            num_failed = np.zeros(len(columns), dtype=np.int64)
+        elif not chunk.columns.equals(columns):
+            chunk = chunk.loc[:, columns]
+        num_failed += (chunk.to_numpy() > det_pval).sum(axis=0)
+        num_subjects += chunk.shape[0]
+    if num_failed is None:
+        return pd.Series(dtype=float)
+    return pd.Series(num_failed / max(num_subjects, 1), index=columns)
+
+
+def get_passed_cpgs(cpgs, failed_fractions=None, det_cpg_cutoff=0.1, manifest=None, forbidden_cpgs=None) -> pd.Index:
+    """
+    CpGs (in the original order) with failed detection fraction below det_cpg_cutoff,
+    present in manifest index and not forbidden.
+    """
+    cpgs = pd.Index(cpgs)
+    passed = np.ones(len(cpgs), dtype=bool)
+    if failed_fractions is not None:
+        passed &= failed_fractions.reindex(cpgs).fillna(0.0).to_numpy() < det_cpg_cutoff
+    if manifest is not None:
+        passed &= cpgs.isin(manifest.index)
+    if forbidden_cpgs is not None:
+        passed &= ~cpgs.isin(forbidden_cpgs)
+    return cpgs[passed]
+
+
 def betas_pvals_filter(betas: pd.DataFrame, pvals: pd.DataFrame, det_pval=0.01, det_cpg_cutoff=0.1):
-    num_subjects = betas.shape[0]
     num_cpgs = betas.shape[1]
-    passed_cols = []
-    for col_id, col in tqdm(enumerate(betas.columns)):
-        num_failed = (pvals[col].values > det_pval).sum()
-        if num_failed < det_cpg_cutoff * num_subjects:
-            passed_cols.append(col)
-    print(f"Removing {num_cpgs - len(passed_cols)} failed CpGs with detection p-value above {det_pval}")
-    betas = betas.loc[:, passed_cols]
+    failed_fractions = get_failed_fractions(pvals.loc[:, betas.columns], det_pval)
+    passed_cpgs = get_passed_cpgs(betas.columns, failed_fractions, det_cpg_cutoff)
+    print(f"Removing {num_cpgs - len(passed_cpgs)} failed CpGs with detection p-value above {det_pval}")
+    betas = betas.loc[:, passed_cpgs]
     return betas
 
 
 def manifest_filter(betas: pd.DataFrame, manifest: pd.DataFrame):
-    betas_cpgs = betas.columns.values
-    manifest_cpgs = manifest.index.values
-    common_cpgs = list(set(betas_cpgs).intersection(set(manifest_cpgs)))
-    betas = betas.loc[:, common_cpgs]
+    betas = betas.loc[:, betas.columns.isin(manifest.index)]
     return betas
+
+
+def betas_pvals_filter_chunks(betas_chunks, pvals_chunks, det_pval=0.01, det_cpg_cutoff=0.1, manifest=None, forbidden_cpgs=None):
+    """
+    Streaming version of betas_pvals_filter, manifest_filter and forbidden CpGs removal for series that do not fit in memory.
+    pvals_chunks are consumed first to find passed CpGs, then filtered betas chunks are yielded one by one.
+
+    Args:
+        betas_chunks: iterable of DataFrames (chunks of subjects), e.g. iter_npy_chunks()
+        pvals_chunks: iterable of DataFrames (chunks of subjects)
+    """
+    failed_fractions = get_failed_fractions(pvals_chunks, det_pval)
+    passed_cpgs = None
+    for chunk in betas_chunks:
+        if passed_cpgs is None:
+            passed_cpgs = get_passed_cpgs(chunk.columns, failed_fractions, det_cpg_cutoff, manifest, forbidden_cpgs)
+            print(f"Removing {chunk.shape[1] - len(passed_cpgs)} CpGs: failed detection p-value above {det_pval}, absent in manifest or forbidden")
+        yield chunk.loc[:, passed_cpgs]
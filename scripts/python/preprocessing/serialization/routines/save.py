@@ -1,8 +1,17 @@
 import pandas as pd
+from scripts.python.routines.columnar import save_columnar
 
 
-def save_pheno_betas_to_pkl(pheno: pd.DataFrame, betas: pd.DataFrame, path: str):
+def save_pheno_betas_to_pkl(pheno: pd.DataFrame, betas: pd.DataFrame, path: str, betas_format: str = "pkl"):
+    """
+    betas_format: "pkl" - betas.pkl, "columnar" - betas/ directory readable by CpG (see routines/columnar.py),
+    "both" - both of them.
+    """
+    if betas_format not in ["pkl", "columnar", "both"]:
+        raise ValueError(f"Unsupported betas_format: {betas_format}")
     pheno.to_pickle(f"{path}/pheno.pkl")
     pheno.to_excel(f"{path}/pheno.xlsx", index=True)
-    betas.to_pickle(f"{path}/betas.pkl")
-
+    if betas_format in ["pkl", "both"]:
+        betas.to_pickle(f"{path}/betas.pkl")
+    if betas_format in ["columnar", "both"]:
+        save_columnar(betas, f"{path}/betas")
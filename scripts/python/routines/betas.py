@@ -1,4 +1,5 @@
 import pandas as pd
+from scripts.python.routines.columnar import is_columnar, read_frame, ColumnarFrame
 
 
 def betas_drop_na(betas: pd.DataFrame, is_print_na_pairs=False):
@@ -13,3 +14,37 @@ def betas_drop_na(betas: pd.DataFrame, is_print_na_pairs=False):
     betas.dropna(axis='columns', how='any', inplace=True)
     print(f"Number of CpGs after drop_na: {betas.shape[1]}")
     return betas
+
+
+def load_betas(path: str, cpgs=None, subjects=None, name: str = "betas"):
+    """
+    Loads {path}/{name} in the columnar format if it exists (only requested CpGs and subjects are read),
+    otherwise {path}/{name}.pkl. CpGs absent in the dataset are skipped.
+    """
+    fn = f"{path}/{name}"
+    if not is_columnar(fn):
+        fn = f"{path}/{name}.pkl"
+    return read_frame(fn, columns=cpgs, index=subjects, errors='ignore')
+
+
+def iter_betas_chunks(path: str, cpgs, chunk_size: int = 1000, subjects=None, name: str = "betas"):
+    """
+    Yields chunks of chunk_size subjects with requested CpGs of {path}/{name}, CpGs absent in the dataset are skipped.
+    Columnar frames are streamed from disk (only requested CpGs of the current chunk are read),
+    {name}.pkl is loaded once and split into chunks.
+    """
+    fn = f"{path}/{name}"
+    if is_columnar(fn):
+        frame = ColumnarFrame(fn)
+        cpgs = pd.Index(cpgs)
+        cpgs = cpgs[cpgs.isin(frame.float_columns)]
+        for chunk in frame.iter_chunks(cpgs, chunk_size):
+            if subjects is not None:
+                chunk = chunk.loc[chunk.index.isin(subjects), :]
+            yield chunk
+    else:
+        betas = read_frame(f"{fn}.pkl", columns=cpgs, errors='ignore')
+        if subjects is not None:
+            betas = betas.loc[betas.index.isin(subjects), :]
+        for start in range(0, betas.shape[0], chunk_size):
+            yield betas.iloc[start:start + chunk_size, :]
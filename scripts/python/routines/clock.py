@@ -0,0 +1,130 @@
+"""
+Linear epigenetic clocks stored as sparse coefficient vectors with default values of features, in clock.xlsx format:
+
+    feature    coef    default
+    Intercept  b       0.0
+    cg...      w_i     mean value of feature (used when feature is absent in dataset or NaN)
+"""
+import numpy as np
+import pandas as pd
+from scripts.python.routines.betas import iter_betas_chunks
+
+
+class Clock:
+    """
+        Intercept, nonzero coefficients of features and their default values.
+    """
+
+    def __init__(self, features, coefs, defaults, intercept: float = 0.0):
+        coefs = np.asarray(coefs, dtype=np.float64)
+        nonzero = coefs != 0
+        self.features = pd.Index(features)[nonzero]
+        self.coefs = coefs[nonzero]
+        self.defaults = np.asarray(defaults, dtype=np.float64)[nonzero]
+        self.intercept = float(intercept)
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame(
+            {
+                'coef': np.concatenate([[self.intercept], self.coefs]),
+                'default': np.concatenate([[0.0], self.defaults]),
+            },
+            index=pd.Index(['Intercept'] + list(self.features), name='feature'),
+        )
+        return df
+
+    def predict(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Clock values for subjects of df, absent features and NaNs are replaced by default values.
+        """
+        return ClockEngine({'clock': self}).predict(df)['clock'].values
+
+
+def clock_from_frame(df: pd.DataFrame) -> Clock:
+    df = df.copy()
+    if df.index.name != 'feature' and 'feature' in df.columns:
+        df.set_index('feature', inplace=True)
+    intercept = df.at['Intercept', 'coef'] if 'Intercept' in df.index else 0.0
+    df = df.loc[df.index != 'Intercept', :]
+    defaults = df['default'].values if 'default' in df.columns else np.zeros(df.shape[0])
+    return Clock(df.index, df['coef'].values, defaults, intercept)
+
+
+def read_clock(fn: str) -> Clock:
+    if fn.endswith('.xlsx'):
+        df = pd.read_excel(fn, index_col='feature')
+    else:
+        df = pd.read_pickle(fn)
+    return clock_from_frame(df)
+
+
+def clock_from_model(model, features, X_defaults: np.ndarray) -> Clock:
+    """
+    Clock of fitted linear model (coef_, intercept_), defaults are means of X_defaults columns.
+    """
+    coefs = np.asarray(model.coef_).ravel()
+    defaults = np.zeros(len(coefs))
+    nonzero = coefs != 0
+    defaults[nonzero] = np.mean(X_defaults[:, nonzero], axis=0)
+    return Clock(features, coefs, defaults, float(np.asarray(model.intercept_).ravel()[0]))
+
+
+class ClockEngine:
+    """
+        Several clocks applied together: values of all clocks are computed by one matrix product
+        over the union of their features.
+    """
+
+    def __init__(self, clocks: dict):
+        self.names = list(clocks.keys())
+        self.features = pd.Index([])
+        for clock in clocks.values():
+            self.features = self.features.union(clock.features, sort=False)
+        self.coefs = np.zeros((len(self.features), len(self.names)))
+        self.defaults = np.zeros((len(self.features), len(self.names)))
+        self.intercepts = np.zeros(len(self.names))
+        for clock_id, clock in enumerate(clocks.values()):
+            ids = self.features.get_indexer(clock.features)
+            self.coefs[ids, clock_id] = clock.coefs
+            self.defaults[ids, clock_id] = clock.defaults
+            self.intercepts[clock_id] = clock.intercept
+        # contribution of a feature with default value
+        self.default_terms = self.coefs * self.defaults
+
+    def predict(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Values of clocks for subjects of df. Absent features contribute constant default terms,
+        NaNs are replaced by defaults of every clock in one step.
+        """
+        is_present = self.features.isin(df.columns)
+        present = self.features[is_present]
+        X = df.loc[:, present].to_numpy(dtype=np.float64, copy=True)
+        is_nan = np.isnan(X)
+        X[is_nan] = 0.0
+        res = X @ self.coefs[is_present] + is_nan @ self.default_terms[is_present]
+        res += self.intercepts + self.default_terms[~is_present].sum(axis=0)
+        return pd.DataFrame(res, index=df.index, columns=self.names)
+
+    def apply(self, path: str, chunk_size: int = 1000, subjects=None, name: str = "betas") -> pd.DataFrame:
+        """
+        Values of clocks for subjects of dataset {path}, betas are streamed in chunks of chunk_size subjects
+        and only features of clocks are read.
+        """
+        chunks = [self.predict(chunk) for chunk in iter_betas_chunks(path, self.features, chunk_size, subjects, name)]
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=self.names, dtype=np.float64)
+        return pd.concat(chunks, axis=0)
+
+
+def apply_clocks(clocks: dict, datasets: dict, chunk_size: int = 1000, name: str = "betas") -> pd.DataFrame:
+    """
+    Values of clocks (dict of name to Clock) for subjects of datasets (dict of name to dataset path).
+    Returns frame of clocks values with 'dataset' column.
+    """
+    engine = ClockEngine(clocks)
+    res = []
+    for dataset, path in datasets.items():
+        values = engine.apply(path, chunk_size, name=name)
+        values.insert(0, 'dataset', dataset)
+        res.append(values)
+    return pd.concat(res, axis=0)
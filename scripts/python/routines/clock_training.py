@@ -0,0 +1,219 @@
+"""
+Training of ElasticNet clocks: the whole regularization path is computed with warm starts
+(coefficients of the previous alpha start the next one) for every inner CV fold instead of fitting
+every alpha from scratch, outer random splits are processed in parallel.
+Threads are used: coordinate descent of sklearn releases GIL, and scripts calling these functions
+need no main guard, as they would with spawned processes.
+"""
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.linear_model import ElasticNet, enet_path
+from sklearn.model_selection import RepeatedKFold
+
+
+def _run_parallel(func, args_list, n_jobs: int = 1):
+    if n_jobs <= 1 or len(args_list) < 2:
+        return [func(*args) for args in args_list]
+    with ThreadPoolExecutor(max_workers=min(n_jobs, len(args_list))) as executor:
+        return list(executor.map(func, *zip(*args_list)))
+
+
+def get_alpha_grid(X: np.ndarray, y: np.ndarray, l1_ratio: float = 0.5, n_alphas: int = 100, eps: float = 1e-3):
+    """
+    Decreasing alphas from the smallest one zeroing all coefficients, as in ElasticNetCV.
+    """
+    Xy = (X - X.mean(axis=0)).T @ (y - y.mean())
+    alpha_max = np.abs(Xy).max() / (X.shape[0] * max(l1_ratio, 1e-3))
+    return np.logspace(np.log10(alpha_max * eps), np.log10(alpha_max), n_alphas)[::-1]
+
+
+def get_scores(y: np.ndarray, y_pred: np.ndarray, scoring: str = "r2"):
+    """
+    Scores of predictions (samples, alphas) for every alpha, greater is better as in GridSearchCV.
+    """
+    diff = y_pred - y[:, np.newaxis]
+    if scoring == "r2":
+        return 1.0 - np.sum(diff ** 2, axis=0) / np.sum((y - y.mean()) ** 2)
+    elif scoring == "neg_mean_squared_error":
+        return -np.mean(diff ** 2, axis=0)
+    elif scoring == "neg_root_mean_squared_error":
+        return -np.sqrt(np.mean(diff ** 2, axis=0))
+    elif scoring == "neg_mean_absolute_error":
+        return -np.mean(np.abs(diff), axis=0)
+    else:
+        raise ValueError(f"Unsupported scoring: {scoring}")
+
+
+def use_gram(X: np.ndarray, precompute="auto"):
+    if isinstance(precompute, str):
+        if precompute != "auto":
+            raise ValueError(f"Unsupported precompute: {precompute}")
+        return X.shape[1] <= X.shape[0]
+    return bool(precompute)
+
+
+def path_cv_scores(X, y, folds, alphas, l1_ratio: float = 0.5, scoring: str = "r2", max_iter: int = 10000, tol: float = 0.01, precompute="auto"):
+    """
+    Scores (folds, alphas) of ElasticNet path on inner folds [(train_idx, val_idx), ...].
+    If features are fewer than subjects, Gram matrix of all subjects is computed once and
+    Gram matrix of every fold is obtained by subtracting rows of its validation part.
+    """
+    alphas = np.sort(np.asarray(alphas, dtype=np.float64))[::-1]
+    gram_all = None
+    if use_gram(X, precompute):
+        gram_all = X.T @ X
+        Xy_all = X.T @ y
+    scores = np.zeros((len(folds), len(alphas)))
+    for fold_id, (train_idx, val_idx) in enumerate(folds):
+        X_trn = X[train_idx]
+        y_trn = y[train_idx]
+        X_mean = X_trn.mean(axis=0)
+        y_mean = y_trn.mean()
+        X_trn_c = X_trn - X_mean
+        y_trn_c = y_trn - y_mean
+        if gram_all is not None:
+            X_val = X[val_idx]
+            n = len(train_idx)
+            gram = gram_all - X_val.T @ X_val - n * np.outer(X_mean, X_mean)
+            Xy = Xy_all - X_val.T @ y[val_idx] - n * X_mean * y_mean
+            _, coefs, _ = enet_path(X_trn_c, y_trn_c, l1_ratio=l1_ratio, alphas=alphas, precompute=gram, Xy=Xy, max_iter=max_iter, tol=tol, check_input=False)
+        else:
+            _, coefs, _ = enet_path(X_trn_c, y_trn_c, l1_ratio=l1_ratio, alphas=alphas, precompute=False, max_iter=max_iter, tol=tol)
+        intercepts = y_mean - X_mean @ coefs
+        y_pred = X[val_idx] @ coefs + intercepts
+        scores[fold_id] = get_scores(y[val_idx], y_pred, scoring)
+    return alphas, scores
+
+
+def _path_cv_scores_task(X, y, folds, alphas, l1_ratio, scoring, max_iter, tol, precompute):
+    return path_cv_scores(X, y, folds, alphas, l1_ratio, scoring, max_iter, tol, precompute)
+
+
+def search_elastic_net(
+        X: np.ndarray,
+        y: np.ndarray,
+        alphas,
+        l1_ratios=(0.5,),
+        cv=None,
+        scoring: str = "r2",
+        max_iter: int = 10000,
+        tol: float = 0.01,
+        precompute="auto",
+        n_jobs: int = 1,
+):
+    """
+    Replacement of GridSearchCV(ElasticNet) over alphas and l1_ratios.
+
+    Returns:
+        ElasticNet refitted on all subjects with the best parameters,
+        best parameters {'alpha', 'l1_ratio'},
+        cv results in GridSearchCV.cv_results_ format
+    """
+    if cv is None:
+        cv = RepeatedKFold(n_splits=5, n_repeats=1, random_state=1337)
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    folds = list(cv.split(X))
+    # with several threads folds are split between them, every thread computes whole path
+    num_chunks = max(min(n_jobs, len(folds)), 1)
+    folds_chunks = [folds[i::num_chunks] for i in range(num_chunks)]
+    results = []
+    for l1_ratio in l1_ratios:
+        chunks = _run_parallel(_path_cv_scores_task, [(X, y, chunk, alphas, l1_ratio, scoring, max_iter, tol, precompute) for chunk in folds_chunks], n_jobs)
+        alphas_sorted = chunks[0][0]
+        scores = np.zeros((len(folds), len(alphas_sorted)))
+        for chunk_id, (_, chunk_scores) in enumerate(chunks):
+            scores[chunk_id::num_chunks] = chunk_scores
+        for alpha_id, alpha in enumerate(alphas_sorted):
+            res = {'param_alpha': alpha, 'param_l1_ratio': l1_ratio, 'params': {'alpha': alpha, 'l1_ratio': l1_ratio}}
+            for fold_id in range(len(folds)):
+                res[f'split{fold_id}_test_score'] = scores[fold_id, alpha_id]
+            res['mean_test_score'] = scores[:, alpha_id].mean()
+            res['std_test_score'] = scores[:, alpha_id].std()
+            results.append(res)
+    cv_results = pd.DataFrame(results)
+    cv_results['rank_test_score'] = cv_results['mean_test_score'].rank(ascending=False, method='min').astype(int)
+    best_params = cv_results.at[cv_results['mean_test_score'].idxmax(), 'params']
+    model = ElasticNet(alpha=best_params['alpha'], l1_ratio=best_params['l1_ratio'], max_iter=max_iter, tol=tol)
+    model.fit(X, y)
+    return model, dict(best_params), cv_results
+
+
+def _outer_split_task(X, y, train_idx, val_idx, alphas, l1_ratios, inner_cv, scoring, max_iter, tol, precompute):
+    model, params, _ = search_elastic_net(X[train_idx], y[train_idx], alphas, l1_ratios, inner_cv, scoring, max_iter, tol, precompute)
+    y_val_pred = model.predict(X[val_idx])
+    rmse = np.sqrt(np.mean((y[val_idx] - y_val_pred) ** 2))
+    mae = np.mean(np.abs(y[val_idx] - y_val_pred))
+    return model, params, rmse, mae
+
+
+def train_clock_repeated(
+        X: np.ndarray,
+        y: np.ndarray,
+        outer_cv,
+        alphas,
+        l1_ratios=(0.5,),
+        inner_cv=None,
+        scoring: str = "r2",
+        max_iter: int = 10000,
+        tol: float = 0.01,
+        precompute="auto",
+        n_jobs: int = 1,
+):
+    """
+    Clock selection over outer random splits: parameters are searched on the train part of every split
+    with search_elastic_net, the model with the least RMSE on the validation part is selected.
+    Outer splits are processed in a pool of n_jobs threads.
+
+    Args:
+        alphas: array of alphas or function without arguments returning alphas for every outer split
+
+    Returns:
+        dict with 'model', 'params', 'rmse', 'train_idx', 'val_idx' of the best split and
+        'splits' DataFrame with parameters and validation errors of all splits
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    splits = list(outer_cv.split(X))
+    args_list = []
+    for train_idx, val_idx in splits:
+        split_alphas = alphas() if callable(alphas) else alphas
+        args_list.append((X, y, train_idx, val_idx, split_alphas, l1_ratios, inner_cv, scoring, max_iter, tol, precompute))
+    results = _run_parallel(_outer_split_task, args_list, n_jobs)
+    splits_df = pd.DataFrame(
+        [{'split': split_id, **params, 'val_RMSE': rmse, 'val_MAE': mae} for split_id, (_, params, rmse, mae) in enumerate(results)]
+    ).set_index('split')
+    best_id = int(np.argmin([res[2] for res in results]))
+    model, params, rmse, _ = results[best_id]
+    return {
+        'model': model,
+        'params': params,
+        'rmse': rmse,
+        'train_idx': splits[best_id][0],
+        'val_idx': splits[best_id][1],
+        'splits': splits_df,
+    }
+
+
+def save_clock(model, features, path: str, defaults=None):
+    """
+    Saves clock in clock.xlsx (features with nonzero coefficients and 'Intercept', default values if given)
+    and fitted model in clock.pkl. Returns number of features of clock.
+    """
+    coefs = np.asarray(model.coef_).ravel()
+    nonzero = np.abs(coefs) > 0
+    clock_dict = {
+        'feature': ['Intercept'] + list(np.asarray(features)[nonzero]),
+        'coef': [float(model.intercept_)] + list(coefs[nonzero]),
+    }
+    if defaults is not None:
+        clock_dict['default'] = [0.0] + list(np.asarray(defaults)[nonzero])
+    if not os.path.exists(path):
+        os.makedirs(path)
+    pd.DataFrame(clock_dict).to_excel(f"{path}/clock.xlsx", index=False)
+    with open(f"{path}/clock.pkl", 'wb') as handle:
+        pickle.dump(model, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    return int(nonzero.sum())
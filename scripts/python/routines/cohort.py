@@ -0,0 +1,208 @@
+"""
+Assembling of subjects x CpGs matrices of several datasets into one cohort matrix.
+
+Common CpGs are found before reading values (from column names of columnar frames and
+from the first column of text files), then only common CpGs of every dataset are written
+into one preallocated float32 matrix, in memory or straight to disk in the columnar format.
+Peak memory is the cohort matrix plus one dataset (columnar frames and text files are read by blocks),
+instead of several copies made by appending and merging transposed frames dataset by dataset.
+Pickled frames have no header, so they are loaded once to get CpGs (and NaN CpGs), and again when their values are copied.
+"""
+import numpy as np
+import pandas as pd
+from scripts.python.routines.columnar import is_columnar, ColumnarFrame, create_columnar
+
+
+class CohortSource:
+    """
+        Subjects x CpGs values of one dataset.
+
+    Args:
+        fn: columnar frame directory, .pkl file or delimited text file with CpGs in rows (mvalsT_*.txt)
+        subjects: subjects to take in the given order (subjects absent in fn are skipped), all by default
+        transposed: values of .pkl are stored as CpGs x subjects, text files are always transposed
+        delimiter, index_col: options of text files
+    """
+
+    def __init__(self, fn: str, subjects=None, transposed: bool = False, delimiter: str = "\t", index_col=0, chunk_size: int = 50000):
+        self.fn = fn
+        self.subjects = None if subjects is None else pd.Index(subjects)
+        if is_columnar(fn):
+            self.kind = 'columnar'
+            if transposed:
+                raise ValueError(f"Columnar frames are stored as subjects x CpGs: {fn}")
+        elif fn.endswith('.pkl'):
+            self.kind = 'pkl'
+        else:
+            self.kind = 'text'
+            transposed = True
+        self.transposed = transposed
+        self.delimiter = delimiter
+        self.index_col = index_col
+        self.chunk_size = chunk_size
+        self._cpgs = None
+        self._index = None
+        self._na_cpgs = None
+        self._index_name = None
+
+    @classmethod
+    def from_betas(cls, path: str, subjects=None, name: str = "betas"):
+        """
+        Betas of dataset {path}, stored as in load_betas().
+        """
+        fn = f"{path}/{name}"
+        if not is_columnar(fn):
+            fn = f"{fn}.pkl"
+        return cls(fn, subjects)
+
+    def _read_pkl(self) -> pd.DataFrame:
+        df = pd.read_pickle(self.fn)
+        if self.transposed:
+            df = df.T
+        else:
+            df = df.select_dtypes(include=[np.floating])
+        return df
+
+    def _iter_text(self, subjects: pd.Index):
+        # only columns of selected subjects are parsed
+        usecols = [self._index_name] + list(subjects)
+        return pd.read_csv(self.fn, delimiter=self.delimiter, index_col=self._index_name, usecols=usecols, chunksize=self.chunk_size)
+
+    def _read_meta(self):
+        if self.kind == 'columnar':
+            frame = ColumnarFrame(self.fn)
+            self._cpgs, self._index = frame.float_columns, frame.index
+        elif self.kind == 'pkl':
+            df = self._read_pkl()
+            self._cpgs, self._index = df.columns, df.index
+            # NaNs are found while the whole frame is loaded anyway
+            subjects = self.get_subjects()
+            self._na_cpgs = df.columns[df.loc[subjects, :].isna().any(axis=0).values]
+        else:
+            header = pd.read_csv(self.fn, delimiter=self.delimiter, index_col=self.index_col, nrows=0)
+            rows = pd.read_csv(self.fn, delimiter=self.delimiter, usecols=[self.index_col]).iloc[:, 0]
+            self._cpgs, self._index = pd.Index(rows.astype(str).values), header.columns
+            self._index_name = header.index.name
+
+    @property
+    def cpgs(self) -> pd.Index:
+        if self._cpgs is None:
+            self._read_meta()
+        return self._cpgs
+
+    def get_subjects(self) -> pd.Index:
+        if self._index is None:
+            self._read_meta()
+        if self.subjects is None:
+            return self._index
+        return self.subjects[self.subjects.isin(self._index)]
+
+    def iter_blocks(self, cpgs: pd.Index, dtype: str = 'float32', block_size: int = 10000):
+        """
+        Yields (positions of CpGs in cpgs, values of all selected subjects x these CpGs).
+        Columnar frames are read by blocks of block_size CpGs, text files by chunks of rows,
+        .pkl files are loaded whole (metadata of all sources is read before values, so frames are not kept).
+        """
+        subjects = self.get_subjects()
+        if self.kind == 'columnar':
+            frame = ColumnarFrame(self.fn)
+            rows = frame.index.get_indexer(subjects)
+            cols_ids = frame.float_columns.get_indexer(cpgs)
+            for start in range(0, len(cpgs), block_size):
+                ids = cols_ids[start:start + block_size]
+                order = np.argsort(ids)
+                values = np.empty((len(rows), len(ids)), dtype=dtype)
+                # whole columns are contiguous on disk, subjects are selected after reading
+                values[:, order] = frame.data[:, ids[order]][rows, :]
+                yield slice(start, start + len(ids)), values
+        elif self.kind == 'pkl':
+            df = self._read_pkl()
+            yield slice(0, len(cpgs)), df.loc[subjects, cpgs].to_numpy(dtype=dtype)
+        else:
+            for chunk in self._iter_text(subjects):
+                chunk.index = chunk.index.astype(str)
+                chunk = chunk.loc[chunk.index.isin(cpgs), :]
+                if chunk.shape[0] > 0:
+                    yield cpgs.get_indexer(chunk.index), chunk.loc[:, subjects].to_numpy(dtype=dtype).T
+
+    def get_na_cpgs(self, cpgs: pd.Index) -> pd.Index:
+        """
+        CpGs of cpgs with NaNs in selected subjects.
+        """
+        if self.kind == 'pkl':
+            if self._na_cpgs is None:
+                self._read_meta()
+            return cpgs[cpgs.isin(self._na_cpgs)]
+        is_na = np.zeros(len(cpgs), dtype=bool)
+        for cols, values in self.iter_blocks(cpgs):
+            is_na[cols] |= np.isnan(values).any(axis=0)
+        return cpgs[is_na]
+
+
+def get_common_cpgs(sources: dict, cpgs=None) -> pd.Index:
+    """
+    CpGs present in all sources (in the order of the first one), restricted to cpgs if given.
+    """
+    common = None
+    for source in sources.values():
+        common = source.cpgs if common is None else common[common.isin(source.cpgs)]
+    if cpgs is not None:
+        common = common[common.isin(cpgs)]
+    return common
+
+
+def assemble_cohort(sources: dict, cpgs=None, dropna: bool = False, path: str = None, dtype: str = 'float32', block_size: int = 10000):
+    """
+    Stacks subjects of sources (dict of dataset name to CohortSource) over their common CpGs in one pass.
+    With dropna=True CpGs with NaNs in any dataset are excluded before values are written.
+    With path the matrix is written straight to disk in the columnar format.
+
+    Returns:
+        subjects x CpGs DataFrame (ColumnarFrame of path if path is given),
+        Series with dataset of every subject
+    """
+    cpgs = get_common_cpgs(sources, cpgs)
+    if dropna:
+        print(f"Number of common CpGs before drop_na: {len(cpgs)}")
+        is_na = np.zeros(len(cpgs), dtype=bool)
+        for source in sources.values():
+            is_na |= cpgs.isin(source.get_na_cpgs(cpgs))
+        cpgs = cpgs[~is_na]
+        print(f"Number of common CpGs after drop_na: {len(cpgs)}")
+
+    subjects = [source.get_subjects() for source in sources.values()]
+    index = pd.Index(np.concatenate([s.values for s in subjects]) if len(subjects) > 0 else [], name='subject_id')
+    if index.has_duplicates:
+        raise ValueError(f"Subjects in several datasets: {list(index[index.duplicated()].unique())}")
+    datasets = pd.Series(np.repeat(list(sources.keys()), [len(s) for s in subjects]), index=index, name='Dataset')
+
+    if path is None:
+        values = np.empty((len(index), len(cpgs)), dtype=dtype)
+    else:
+        values = create_columnar(path, index, cpgs, dtype)
+    start = 0
+    for source, source_subjects in zip(sources.values(), subjects):
+        rows = slice(start, start + len(source_subjects))
+        for cols, block in source.iter_blocks(cpgs, dtype, block_size):
+            values[rows, cols] = block
+        start += len(source_subjects)
+
+    if path is None:
+        return pd.DataFrame(values, index=index, columns=cpgs, copy=False), datasets
+    values.flush()
+    del values
+    return ColumnarFrame(path), datasets
+
+
+def get_variances(betas, block_size: int = 10000) -> pd.Series:
+    """
+    Variances of CpGs of DataFrame or ColumnarFrame computed by blocks of CpGs.
+    """
+    if isinstance(betas, ColumnarFrame):
+        cpgs, data = betas.float_columns, betas.data
+    else:
+        cpgs, data = betas.columns, betas.to_numpy(copy=False)
+    variances = np.empty(len(cpgs))
+    for start in range(0, len(cpgs), block_size):
+        variances[start:start + block_size] = np.var(data[:, start:start + block_size], axis=0, dtype=np.float64)
+    return pd.Series(variances, index=cpgs, name='variance')
@@ -0,0 +1,163 @@
+"""
+Columnar on-disk format for subjects x CpGs frames (betas, mvals, data_trn_val, ...):
+
+    {path}/data.npy      float32 matrix, Fortran order: every column (CpG) is contiguous on disk
+    {path}/columns.txt   names of the matrix columns, one per line
+    {path}/index.pkl     subjects ids
+    {path}/other.pkl     non-float columns (statuses, datasets, ...), optional
+    {path}/info.json     index name and dtype
+
+The matrix is opened as a memmap, so only requested columns and subjects are read from disk.
+"""
+import numpy as np
+import pandas as pd
+import os
+import json
+
+
+def is_columnar(path: str):
+    return os.path.isdir(path) and os.path.isfile(f"{path}/data.npy")
+
+
+def create_columnar(path: str, index: pd.Index, columns: pd.Index, dtype: str = 'float32', other: pd.DataFrame = None):
+    """
+    Writes metadata of a columnar frame and returns its matrix opened for writing (memmap filled by the caller).
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    data = np.lib.format.open_memmap(f"{path}/data.npy", mode='w+', dtype=dtype, shape=(len(index), len(columns)), fortran_order=True)
+    with open(f"{path}/columns.txt", 'w') as f:
+        f.write('\n'.join(map(str, columns)))
+    pd.Series(index.values).to_pickle(f"{path}/index.pkl")
+    if other is not None and other.shape[1] > 0:
+        other.to_pickle(f"{path}/other.pkl")
+    elif os.path.isfile(f"{path}/other.pkl"):
+        os.remove(f"{path}/other.pkl")
+    with open(f"{path}/info.json", 'w') as f:
+        json.dump({'index_name': index.name, 'dtype': dtype}, f)
+    return data
+
+
+def save_columnar(df: pd.DataFrame, path: str, dtype: str = 'float32'):
+    float_cols = df.select_dtypes(include=[np.floating]).columns
+    other_cols = df.columns.difference(float_cols, sort=False)
+
+    data = create_columnar(path, df.index, float_cols, dtype, df.loc[:, other_cols])
+    chunk_size = 10000
+    for start in range(0, len(float_cols), chunk_size):
+        cols = float_cols[start:start + chunk_size]
+        data[:, start:start + len(cols)] = df.loc[:, cols].to_numpy(dtype=dtype)
+    data.flush()
+    del data
+
+
+class ColumnarFrame:
+    """
+        Lazy handle of a frame saved with save_columnar().
+        Column and subject names are available without reading the matrix.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(f"{path}/info.json") as f:
+            self.info = json.load(f)
+        with open(f"{path}/columns.txt") as f:
+            self.float_columns = pd.Index(f.read().splitlines())
+        self.index = pd.Index(pd.read_pickle(f"{path}/index.pkl").values, name=self.info['index_name'])
+        if os.path.isfile(f"{path}/other.pkl"):
+            self.other = pd.read_pickle(f"{path}/other.pkl")
+        else:
+            self.other = pd.DataFrame(index=self.index)
+        self.columns = self.other.columns.append(self.float_columns)
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = np.load(f"{self.path}/data.npy", mmap_mode='r')
+        return self._data
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.columns)
+
+    def read(self, columns=None, index=None) -> pd.DataFrame:
+        """
+        Reads the selected columns and subjects (all by default) into a DataFrame.
+        Raises KeyError for unknown names, as DataFrame.loc does.
+        """
+        if columns is None:
+            columns = self.columns
+        columns = pd.Index(columns)
+        if index is None:
+            rows = slice(None)
+        else:
+            rows = self.index.get_indexer(pd.Index(index))
+            if np.any(rows < 0):
+                raise KeyError(f"Unknown subjects: {list(pd.Index(index)[rows < 0])}")
+        row_names = self.index[rows]
+
+        is_float = columns.isin(self.float_columns)
+        is_other = columns.isin(self.other.columns)
+        if not np.all(is_float | is_other):
+            raise KeyError(f"Unknown columns: {list(columns[~(is_float | is_other)])}")
+
+        float_cols = columns[is_float]
+        cols_ids = self.float_columns.get_indexer(float_cols)
+        order = np.argsort(cols_ids)
+        values = np.empty((len(row_names), len(cols_ids)), dtype=self.data.dtype)
+        # sorted column ids keep reads sequential on disk
+        values[:, order] = self.data[:, cols_ids[order]][rows, :]
+        df = pd.DataFrame(values, index=row_names, columns=float_cols)
+        if is_other.any():
+            df = pd.concat([self.other.loc[row_names, columns[is_other]], df], axis=1)
+        return df.loc[:, columns]
+
+    def iter_chunks(self, columns=None, chunk_size: int = 1000):
+        """
+        Yields DataFrames of chunk_size consecutive subjects with the selected float columns,
+        only the selected columns of the current chunk of rows are read from disk.
+        """
+        if columns is None:
+            columns = self.float_columns
+        columns = pd.Index(columns)
+        cols_ids = self.float_columns.get_indexer(columns)
+        if np.any(cols_ids < 0):
+            raise KeyError(f"Unknown columns: {list(columns[cols_ids < 0])}")
+        order = np.argsort(cols_ids)
+        cols_sorted = cols_ids[order]
+        for start in range(0, len(self.index), chunk_size):
+            end = min(start + chunk_size, len(self.index))
+            values = np.empty((end - start, len(cols_ids)), dtype=self.data.dtype)
+            # only selected columns of the chunk are read, in the order of the file
+            values[:, order] = self.data[start:end, cols_sorted]
+            yield pd.DataFrame(values, index=self.index[start:end], columns=columns)
+
+
+def read_frame(fn: str, columns=None, index=None, errors: str = 'raise') -> pd.DataFrame:
+    """
+    Reads a frame stored either as a pickle (whole file is loaded, then selected)
+    or in the columnar format (only requested columns and subjects are read).
+    With errors='ignore' requested columns absent from the frame are skipped.
+    """
+    if is_columnar(fn):
+        frame = ColumnarFrame(fn)
+        if columns is not None and errors == 'ignore':
+            columns = pd.Index(columns)
+            columns = columns[columns.isin(frame.columns)]
+        return frame.read(columns=columns, index=index)
+    df = pd.read_pickle(fn)
+    if columns is not None and errors == 'ignore':
+        columns = pd.Index(columns)
+        columns = columns[columns.isin(df.columns)]
+    if columns is not None:
+        df = df.loc[:, columns]
+    if index is not None:
+        df = df.loc[index, :]
+    return df
+
+
+def get_frame_columns(fn: str) -> pd.Index:
+    if is_columnar(fn):
+        return ColumnarFrame(fn).columns
+    return pd.read_pickle(fn).columns
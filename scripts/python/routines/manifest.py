@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import os
 import re
 
@@ -23,7 +24,7 @@ def process_str_elem(x, delimiter: str = ';', missed: str = 'non-genic'):
     return elems
 
 
-def get_manifest(platform="GPL13534", path="E:/YandexDisk/Work/pydnameth/datasets"):
+def read_manifest(platform="GPL13534", path="E:/YandexDisk/Work/pydnameth/datasets"):
 
     fn_pkl = f"{path}/{platform}/manifest/manifest.pkl"
     if os.path.isfile(fn_pkl):
@@ -36,3 +37,78 @@ def get_manifest(platform="GPL13534", path="E:/YandexDisk/Work/pydnameth/dataset
         manifest.to_pickle(fn_pkl)
 
     return manifest
+
+
+# Manifests and their indexes loaded in the current process, keyed by (platform, path)
+_manifests = {}
+_manifest_indexes = {}
+
+
+def get_manifest(platform="GPL13534", path="E:/YandexDisk/Work/pydnameth/datasets"):
+    """
+    Manifest of platform, read once per process.
+    The returned frame is shared between callers and must not be modified in place.
+    """
+    key = (platform, path)
+    if key not in _manifests:
+        _manifests[key] = read_manifest(platform, path)
+    return _manifests[key]
+
+
+class ManifestIndex:
+    """
+        Inverted indexes of manifest columns (value -> CpGs) built once per manifest.
+        ';'-joined values (e.g. several genes of one CpG) are split, so a CpG is found by any of its genes.
+
+    Args:
+        manifest: manifest indexed by CpG
+        cols: indexed columns
+    """
+
+    def __init__(self, manifest: pd.DataFrame, cols=('Gene', 'UCSC_RefGene_Group', 'CHR')):
+        self.manifest = manifest
+        self.index = {}
+        for col in cols:
+            if col not in manifest.columns:
+                continue
+            values = manifest[col].astype(str).reset_index(drop=True)
+            is_multi = values.str.contains(';', regex=False)
+            if is_multi.any():
+                values = pd.concat([values[~is_multi], values[is_multi].str.split(';').explode()])
+            codes, uniques = pd.factorize(values.values)
+            positions = values.index.values
+            # CpGs of every value in manifest order
+            order = np.lexsort((positions, codes))
+            bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+            self.index[col] = dict(zip(uniques, np.split(positions[order], bounds)))
+
+    def get_values(self, col='Gene'):
+        return list(self.index[col].keys())
+
+    def get_cpgs(self, values, col='Gene') -> pd.Index:
+        """
+        CpGs (in manifest order) having any of values in col (values are compared as strings).
+        """
+        if isinstance(values, str):
+            values = [values]
+        col_index = self.index[col]
+        ids = [col_index[str(value)] for value in values if str(value) in col_index]
+        if len(ids) == 0:
+            return self.manifest.index[:0]
+        return self.manifest.index[np.unique(np.concatenate(ids))]
+
+    def annotate(self, cpgs, cols=('Gene',)) -> pd.DataFrame:
+        """
+        Manifest columns for cpgs (NaN for CpGs absent in manifest) with one index join.
+        """
+        return self.manifest.loc[:, list(cols)].reindex(pd.Index(cpgs))
+
+
+def get_manifest_index(platform="GPL13534", path="E:/YandexDisk/Work/pydnameth/datasets"):
+    """
+    Memoized ManifestIndex of platform manifest.
+    """
+    key = (platform, path)
+    if key not in _manifest_indexes:
+        _manifest_indexes[key] = ManifestIndex(get_manifest(platform, path))
+    return _manifest_indexes[key]
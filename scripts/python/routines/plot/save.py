@@ -1,14 +1,113 @@
 import plotly
-import time
-import plotly.offline as py
-import plotly.graph_objs as go
+import os
+import atexit
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import plotly.io as pio
 
+
+supported_formats = ['png', 'pdf', 'svg', 'jpeg', 'webp']
+
+# Formats written by save_figure() and background renderer, both set by set_figure_rendering()
+_formats = ['png', 'pdf']
+_renderer = None
+
+
+def _write_figures(batch, mathjax=None):
+    # kaleido settings of the pipeline process (scope.mathjax = None removes "Loading MathJax" banner from pdf)
+    pio.kaleido.scope.mathjax = mathjax
+    for fig_json, fn, formats in batch:
+        fig = pio.from_json(fig_json)
+        for fmt in formats:
+            fig.write_image(f"{fn}.{fmt}", format=fmt)
+
+
+class FigureRenderer:
+    """
+        Renders plotly figures in a pool of n_jobs persistent processes (every process keeps its own kaleido instance),
+        so the pipeline continues while figures are exported. Figures are sent in batches of batch_size,
+        at most 2 * n_jobs batches are in flight.
+    """
+
+    def __init__(self, n_jobs: int = 2, batch_size: int = 16):
+        self.n_jobs = n_jobs
+        self.batch_size = batch_size
+        self.batch = []
+        self.futures = deque()
+        self.executor = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, fig, fn, formats):
+        # absolute path, as the working directory can change (e.g. hydra multirun) before the figure is rendered
+        self.batch.append((fig.to_json(), os.path.abspath(fn), list(formats)))
+        if len(self.batch) >= self.batch_size:
+            self._submit_batch()
+
+    def _submit_batch(self):
+        if len(self.batch) == 0:
+            return
+        self.futures.append(self.executor.submit(_write_figures, self.batch, pio.kaleido.scope.mathjax))
+        self.batch = []
+        while len(self.futures) > 2 * self.n_jobs:
+            self.futures.popleft().result()
+
+    def wait(self):
+        self._submit_batch()
+        while self.futures:
+            self.futures.popleft().result()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown()
+
+
+def set_figure_rendering(formats=('png', 'pdf'), n_jobs: int = 0, batch_size: int = 16):
+    """
+    Global settings of save_figure(): formats of saved figures (empty list skips saving)
+    and number of background rendering processes (0 renders synchronously).
+    """
+    global _formats, _renderer
+    formats = list(formats)
+    for fmt in formats:
+        if fmt not in supported_formats:
+            raise ValueError(f"Unsupported figure format: {fmt}")
+    wait_figures()
+    if _renderer is not None:
+        _renderer.close()
+        _renderer = None
+    _formats = formats
+    if n_jobs > 0 and len(formats) > 0:
+        _renderer = FigureRenderer(n_jobs, batch_size)
+
+
+def wait_figures():
+    """
+    Waits until all figures passed to save_figure() are rendered.
+    """
+    if _renderer is not None:
+        _renderer.wait()
+
+
+def _close_renderer():
+    if _renderer is not None:
+        _renderer.close()
+
+
+atexit.register(_close_renderer)
+
+
 def save_figure(fig, fn, width=800, height=600, scale=2):
     #py.plot(fig, filename=f"{fn}.png", include_mathjax='cdn')
     #py.plot(fig, filename=f"{fn}.pdf", include_mathjax='cdn')
-    fig.write_image(f"{fn}.png")
-    fig.write_image(f"{fn}.pdf", format="pdf")
+    if len(_formats) == 0:
+        return
+    if _renderer is not None:
+        _renderer.submit(fig, fn, _formats)
+        return
+    for fmt in _formats:
+        fig.write_image(f"{fn}.{fmt}", format=fmt)
     #fig.write_image(f"{fn}.pdf", format="pdf")
     #plotly.io.write_image(fig, f"{fn}.png", width=width, height=height, scale=scale)
     #plotly.io.write_image(fig, f"{fn}.pdf", width=width, height=height, scale=scale)
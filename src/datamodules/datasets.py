@@ -0,0 +1,146 @@
+import torch
+import weakref
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from torch.utils.data import DataLoader, Dataset, BatchSampler, RandomSampler, SequentialSampler
+
+
+class SharedMatrix:
+    """
+        Numpy matrix in a shared memory segment.
+        Pickling transfers only the segment name, so DataLoader workers and fold processes attach
+        to the same memory without copying. The segment is unlinked when the object of the creating
+        process is released or garbage collected, already attached processes keep their mapping.
+
+    Args:
+        array: matrix to publish, copied into the segment once
+    """
+
+    def __init__(self, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        self._finalizer = weakref.finalize(self, self._shm.unlink)
+        self.array[...] = array
+
+    @property
+    def array(self) -> np.ndarray:
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.array
+        return self.array.astype(dtype)
+
+    def release(self):
+        self._finalizer()
+
+    def __getstate__(self):
+        return {'name': self._shm.name, 'shape': self.shape, 'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.shape = state['shape']
+        self.dtype = state['dtype']
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._finalizer = weakref.finalize(self, lambda: None)
+
+
+class FeaturesDataset(Dataset):
+    """
+        Dataset that keeps the subjects x features matrix as one contiguous float32 tensor.
+        Indexing with a sequence of ids returns the whole mini-batch with a single fancy-index,
+        so it is meant to be used with get_batched_dataloader().
+        With shared=True the matrix is published once in shared memory and pickled copies of the
+        dataset (DataLoader workers, spawned processes) attach to it instead of copying the data.
+
+    Args:
+        data: subjects x features frame
+        output: frame with outcome column(s), same index order as data
+        outcome: name of the outcome column
+        shared: keep the matrix in a SharedMatrix
+    """
+
+    def __init__(
+            self,
+            data: pd.DataFrame,
+            output: pd.DataFrame,
+            outcome: str,
+            shared: bool = False
+    ):
+        self.data = data
+        self.output = output
+        self.outcome = outcome
+        self.num_subjects = self.data.shape[0]
+        self.num_features = self.data.shape[1]
+        self.ys = self.output.loc[:, self.outcome].values
+
+        X = self.data.to_numpy(dtype=np.float32)
+        if shared:
+            self.X_shared = SharedMatrix(X)
+            self.X = torch.from_numpy(self.X_shared.array)
+            # the frame is rebuilt over the segment, so the creating process does not keep its own copy
+            self.data = pd.DataFrame(self.X_shared.array, index=data.index, columns=data.columns, copy=False)
+            del X
+        else:
+            self.X_shared = None
+            self.X = torch.from_numpy(np.ascontiguousarray(X))
+        ys = np.asarray(self.ys)
+        if ys.dtype == object:
+            ys = ys.astype(np.int64)
+        self.y = torch.from_numpy(np.ascontiguousarray(ys))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.X_shared is not None:
+            # features are restored from the shared segment
+            state['data'] = None
+            state['X'] = None
+            state['data_index'] = self.data.index
+            state['data_columns'] = self.data.columns
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.X_shared is not None:
+            self.X = torch.from_numpy(self.X_shared.array)
+            self.data = pd.DataFrame(self.X_shared.array, index=self.__dict__.pop('data_index'), columns=self.__dict__.pop('data_columns'), copy=False)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            return (self.X[idx], self.y[idx], idx)
+        ids = torch.as_tensor(np.asarray(idx), dtype=torch.long)
+        return (self.X[ids], self.y[ids], ids)
+
+    def __len__(self):
+        return self.num_subjects
+
+
+def get_batched_dataloader(
+        dataset: Dataset,
+        batch_size: int,
+        num_workers: int = 0,
+        pin_memory: bool = False,
+        shuffle: bool = False,
+        sampler=None,
+        drop_last: bool = False,
+):
+    """
+        DataLoader that draws whole mini-batches of indices and fetches them with one dataset call.
+        Drop-in replacement for DataLoader(dataset=..., batch_size=..., shuffle=.../sampler=...)
+        over FeaturesDataset or a Subset of it.
+    """
+    if sampler is None:
+        if shuffle:
+            sampler = RandomSampler(dataset)
+        else:
+            sampler = SequentialSampler(dataset)
+    batch_sampler = BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last)
+    return DataLoader(
+        dataset=dataset,
+        sampler=batch_sampler,
+        batch_size=None,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+    )
@@ -7,13 +7,15 @@ import numpy as np
 import pandas as pd
 from collections import Counter
 from src.utils import utils
+from src.datamodules.datasets import FeaturesDataset, get_batched_dataloader
+from src.datamodules.imputation import FeaturesImputer, ImputerCache, get_fingerprint
+from scripts.python.routines.columnar import read_frame
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.bar import add_bar_trace
 import plotly.express as px
 from scripts.python.routines.plot.layout import add_layout
 import plotly.graph_objects as go
-from tqdm import tqdm
-from impyute.imputation.cs import fast_knn, mean, median, random, mice, mode, em
+from impyute.imputation.cs import fast_knn, random, mice, mode, em
 from sklearn.experimental import enable_iterative_imputer
 from sklearn.impute import IterativeImputer
 from sklearn.linear_model import BayesianRidge
@@ -24,28 +26,8 @@ from sklearn.neighbors import KNeighborsRegressor
 
 log = utils.get_logger(__name__)
 
-class DNAmDataset(Dataset):
-
-    def __init__(
-            self,
-            data: pd.DataFrame,
-            output: pd.DataFrame,
-            outcome: str
-    ):
-        self.data = data
-        self.output = output
-        self.outcome = outcome
-        self.num_subjects = self.data.shape[0]
-        self.num_features = self.data.shape[1]
-        self.ys = self.output.loc[:, self.outcome].values
-
-    def __getitem__(self, idx: int):
-        x = self.data.iloc[idx, :].to_numpy()
-        y = self.ys[idx]
-        return (x, y, idx)
-
-    def __len__(self):
-        return self.num_subjects
+class DNAmDataset(FeaturesDataset):
+    pass
 
 
 class DNAmDataModuleNoTest(LightningDataModule):
@@ -85,9 +67,11 @@ class DNAmDataModuleNoTest(LightningDataModule):
         self.dataset_val: Optional[Dataset] = None
         self.dataset_tst: Optional[Dataset] = None
 
-        self.trn_val = pd.read_pickle(f"{self.trn_val_fn}")
         features_df = pd.read_excel(self.features_fn)
         self.features_names = features_df.loc[:, 'features'].values
+        # only outcome and features are read from columnar data
+        columns = [self.outcome] + list(self.features_names)
+        self.trn_val = read_frame(f"{self.trn_val_fn}", columns=columns, errors='ignore')
 
         if self.task in ['binary', 'multiclass']:
             self.classes_df = pd.read_excel(self.classes_fn)
@@ -117,7 +101,9 @@ class DNAmDataModuleNoTest(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = DNAmDataset(self.data, self.output, self.outcome)
+        self.dataset = DNAmDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
         self.ids_trn_val = np.arange(self.trn_val.shape[0])
 
@@ -216,7 +202,7 @@ class DNAmDataModuleNoTest(LightningDataModule):
 
     def train_dataloader(self):
         if self.dataloaders_evaluate:
-            return DataLoader(
+            return get_batched_dataloader(
                 dataset=self.dataset_trn,
                 batch_size=self.batch_size,
                 num_workers=self.num_workers,
@@ -234,7 +220,7 @@ class DNAmDataModuleNoTest(LightningDataModule):
                     num_samples=len(weights),
                     replacement=True
                 )
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -242,7 +228,7 @@ class DNAmDataModuleNoTest(LightningDataModule):
                     sampler=weighted_sampler
                 )
             else:
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -251,7 +237,7 @@ class DNAmDataModuleNoTest(LightningDataModule):
                 )
 
     def val_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_val,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -260,7 +246,7 @@ class DNAmDataModuleNoTest(LightningDataModule):
         )
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_tst,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -302,6 +288,7 @@ class DNAmDataModuleSeparate(LightningDataModule):
             seed: int = 1337,
             weighted_sampler = False,
             imputation: str = "median",
+            imputation_k: int = 10,
             **kwargs,
     ):
         super().__init__()
@@ -319,6 +306,8 @@ class DNAmDataModuleSeparate(LightningDataModule):
         self.seed = seed
         self.weighted_sampler = weighted_sampler
         self.imputation = imputation
+        self.imputation_k = imputation_k
+        self.imputer = None
 
         self.split_feature = None
 
@@ -328,10 +317,12 @@ class DNAmDataModuleSeparate(LightningDataModule):
         self.dataset_val: Optional[Dataset] = None
         self.dataset_tst: Optional[Dataset] = None
 
-        self.trn_val = pd.read_pickle(f"{self.trn_val_fn}")
-        self.tst = pd.read_pickle(f"{self.tst_fn}")
         features_df = pd.read_excel(self.features_fn)
         self.features_names = features_df.loc[:, 'features'].values
+        # only outcome and features are read from columnar data
+        columns = [self.outcome] + list(self.features_names)
+        self.trn_val = read_frame(f"{self.trn_val_fn}", columns=columns, errors='ignore')
+        self.tst = read_frame(f"{self.tst_fn}", columns=columns, errors='ignore')
 
         if self.task in ['binary', 'multiclass']:
             self.classes_df = pd.read_excel(self.classes_fn)
@@ -351,14 +342,10 @@ class DNAmDataModuleSeparate(LightningDataModule):
         exist_features = list(set(self.features_names) - set(missed_features))
         if len(missed_features) > 0:
             log.info(f"Perform imputation for {len(missed_features)} features with {self.imputation}")
-            if self.imputation == "median":
-                for f_id, f in enumerate(tqdm(missed_features, desc=f"{self.imputation} calculation")):
-                    self.tst.loc[:, f] = self.trn_val[f].median()
-            elif self.imputation == "mean":
-                for f_id, f in enumerate(tqdm(missed_features, desc=f"{self.imputation} calculation")):
-                    self.tst.loc[:, f] = self.trn_val[f].mean()
-            else:
-                raise ValueError(f"Unsupported imputation: {self.imputation}")
+            self.imputer = FeaturesImputer(method=self.imputation, k=self.imputation_k)
+            self.imputer.fit(self.trn_val.loc[:, self.features_names])
+            imputed = self.imputer.transform(self.tst)
+            self.tst = pd.concat([self.tst.drop(columns=self.tst.columns.intersection(self.features_names)), imputed], axis=1)
 
         self.ids_trn_val = np.arange(self.trn_val.shape[0])
         self.ids_tst = np.arange(self.tst.shape[0]) + self.trn_val.shape[0]
@@ -385,7 +372,9 @@ class DNAmDataModuleSeparate(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = DNAmDataset(self.data, self.output, self.outcome)
+        self.dataset = DNAmDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
     def prepare_data(self):
         pass
@@ -492,7 +481,7 @@ class DNAmDataModuleSeparate(LightningDataModule):
 
     def train_dataloader(self):
         if self.dataloaders_evaluate:
-            return DataLoader(
+            return get_batched_dataloader(
                 dataset=self.dataset_trn,
                 batch_size=self.batch_size,
                 num_workers=self.num_workers,
@@ -510,7 +499,7 @@ class DNAmDataModuleSeparate(LightningDataModule):
                     num_samples=len(weights),
                     replacement=True
                 )
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -518,7 +507,7 @@ class DNAmDataModuleSeparate(LightningDataModule):
                     sampler=weighted_sampler
                 )
             else:
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -527,7 +516,7 @@ class DNAmDataModuleSeparate(LightningDataModule):
                 )
 
     def val_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_val,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -536,7 +525,7 @@ class DNAmDataModuleSeparate(LightningDataModule):
         )
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_tst,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -577,6 +566,7 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
             seed: int = 1337,
             weighted_sampler = False,
             imputation: str = "median",
+            imputation_k: int = 10,
             **kwargs,
     ):
         super().__init__()
@@ -593,6 +583,8 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
         self.seed = seed
         self.weighted_sampler = weighted_sampler
         self.imputation = imputation
+        self.imputation_k = imputation_k
+        self.imputer = None
 
         self.split_feature = None
 
@@ -602,10 +594,12 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
         self.dataset_val: Optional[Dataset] = None
         self.dataset_tst: Optional[Dataset] = None
 
-        self.trn = pd.read_pickle(f"{self.trn_fn}")
-        self.val = pd.read_pickle(f"{self.val_fn}")
         features_df = pd.read_excel(self.features_fn)
         self.features_names = features_df.loc[:, 'features'].values
+        # only outcome and features are read from columnar data
+        columns = [self.outcome] + list(self.features_names)
+        self.trn = read_frame(f"{self.trn_fn}", columns=columns, errors='ignore')
+        self.val = read_frame(f"{self.val_fn}", columns=columns, errors='ignore')
 
         if self.task in ['binary', 'multiclass']:
             self.classes_df = pd.read_excel(self.classes_fn)
@@ -625,14 +619,10 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
         exist_features = list(set(self.features_names) - set(missed_features))
         if len(missed_features) > 0:
             log.info(f"Perform imputation for {len(missed_features)} features with {self.imputation}")
-            if self.imputation == "median":
-                for f_id, f in enumerate(tqdm(missed_features, desc=f"{self.imputation} calculation")):
-                    self.val.loc[:, f] = self.trn[f].median()
-            elif self.imputation == "mean":
-                for f_id, f in enumerate(tqdm(missed_features, desc=f"{self.imputation} calculation")):
-                    self.val.loc[:, f] = self.trn[f].mean()
-            else:
-                raise ValueError(f"Unsupported imputation: {self.imputation}")
+            self.imputer = FeaturesImputer(method=self.imputation, k=self.imputation_k)
+            self.imputer.fit(self.trn.loc[:, self.features_names])
+            imputed = self.imputer.transform(self.val)
+            self.val = pd.concat([self.val.drop(columns=self.val.columns.intersection(self.features_names)), imputed], axis=1)
 
         self.ids_trn = np.arange(self.trn.shape[0])
         self.ids_val = np.arange(self.val.shape[0]) + self.trn.shape[0]
@@ -660,7 +650,9 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = DNAmDataset(self.data, self.output, self.outcome)
+        self.dataset = DNAmDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
     def prepare_data(self):
         pass
@@ -742,7 +734,7 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
 
     def train_dataloader(self):
         if self.dataloaders_evaluate:
-            return DataLoader(
+            return get_batched_dataloader(
                 dataset=self.dataset_trn,
                 batch_size=self.batch_size,
                 num_workers=self.num_workers,
@@ -760,7 +752,7 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
                     num_samples=len(weights),
                     replacement=True
                 )
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -768,7 +760,7 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
                     sampler=weighted_sampler
                 )
             else:
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -777,7 +769,7 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
                 )
 
     def val_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_val,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -786,7 +778,7 @@ class DNAmDataModuleTrainValNoSplit(LightningDataModule):
         )
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_tst,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -825,6 +817,7 @@ class DNAmDataModuleInference(LightningDataModule):
             num_workers: int = 0,
             pin_memory: bool = False,
             imputation: str = "median",
+            imputation_k: int = 10,
             **kwargs,
     ):
         super().__init__()
@@ -839,15 +832,19 @@ class DNAmDataModuleInference(LightningDataModule):
         self.num_workers = num_workers
         self.pin_memory = pin_memory
         self.imputation = imputation
+        self.imputation_k = imputation_k
+        self.imputer = None
 
         self.dataset: Optional[Dataset] = None
 
-        self.trn_val = pd.read_pickle(f"{self.trn_val_fn}")
-        self.inference = pd.read_pickle(f"{self.inference_fn}")
-
         features_df = pd.read_excel(self.features_fn)
         self.features_names = features_df.loc[:, 'features'].values
 
+        # only outcome and features are read from columnar data
+        columns = [self.outcome] + list(self.features_names)
+        self.trn_val = read_frame(f"{self.trn_val_fn}", columns=columns, errors='ignore')
+        self.inference = read_frame(f"{self.inference_fn}", columns=columns, errors='ignore')
+
         if self.task in ['binary', 'multiclass']:
             self.classes_df = pd.read_excel(self.classes_fn)
             self.classes_dict = {}
@@ -863,21 +860,16 @@ class DNAmDataModuleInference(LightningDataModule):
             self.inference[self.outcome].replace(self.classes_dict, inplace=True)
 
         missed_features = list(set(self.features_names) - set(self.inference.columns.values))
-        missed_features_df = pd.DataFrame(index=missed_features, columns=["index"])
-        for mf in missed_features:
-            missed_features_df.at[mf, "index"] = np.where(self.features_names == mf)
+        missed_features_df = pd.DataFrame(index=missed_features)
+        missed_features_df["index"] = pd.Index(self.features_names).get_indexer(missed_features)
         missed_features_df.to_excel("missed_features.xlsx")
         exist_features = list(set(self.features_names) - set(missed_features))
         if len(missed_features) > 0:
             log.info(f"Perform imputation for {len(missed_features)} features with {self.imputation}")
-            if self.imputation == "median":
-                for f_id, f in enumerate(tqdm(missed_features, desc=f"{self.imputation} calculation")):
-                    self.inference.loc[:, f] = self.trn_val[f].median()
-            elif self.imputation == "mean":
-                for f_id, f in enumerate(tqdm(missed_features, desc=f"{self.imputation} calculation")):
-                    self.inference.loc[:, f] = self.trn_val[f].mean()
-            else:
-                raise ValueError(f"Unsupported imputation: {self.imputation}")
+            self.imputer = FeaturesImputer(method=self.imputation, k=self.imputation_k)
+            self.imputer.fit(self.trn_val.loc[:, self.features_names])
+            imputed = self.imputer.transform(self.inference)
+            self.inference = pd.concat([self.inference.drop(columns=self.inference.columns.intersection(self.features_names)), imputed], axis=1)
 
         self.data = self.inference.loc[:, self.features_names]
         self.data = self.data.astype('float32')
@@ -898,7 +890,9 @@ class DNAmDataModuleInference(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = DNAmDataset(self.data, self.output, self.outcome)
+        self.dataset = DNAmDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
     def prepare_data(self):
         pass
@@ -907,7 +901,7 @@ class DNAmDataModuleInference(LightningDataModule):
         pass
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -932,6 +926,33 @@ class DNAmDataModuleInference(LightningDataModule):
         return df
 
 
+def impute_matrix(X: np.ndarray, imputation: str, k: int = 1):
+    """
+    Imputes all NaNs of the matrix with transductive methods (impyute, IterativeImputer).
+    """
+    if imputation == "fast_knn":
+        imputed = fast_knn(X, k=k)
+    elif imputation == "random":
+        imputed = random(X)
+    elif imputation == "mice":
+        imputed = mice(X)
+    elif imputation == "em":
+        imputed = em(X)
+    elif imputation == "mode":
+        imputed = mode(X)
+    elif imputation == "BayesianRidge":
+        estimator = BayesianRidge(n_iter=10, verbose=1)
+        imp = IterativeImputer(estimator=estimator, max_iter=2, verbose=1)
+        imputed = imp.fit_transform(X)
+    elif imputation == "DecisionTreeRegressor":
+        estimator = DecisionTreeRegressor()
+        imp = IterativeImputer(estimator=estimator, max_iter=2, verbose=1)
+        imputed = imp.fit_transform(X)
+    else:
+        raise ValueError(f"Unsupported imputation: {imputation}")
+    return imputed
+
+
 class DNAmDataModuleImpute(LightningDataModule):
 
     def __init__(
@@ -948,6 +969,8 @@ class DNAmDataModuleImpute(LightningDataModule):
             pin_memory: bool = False,
             imputation: str = "median",
             k: int = 1,
+            imputation_cache_dir: str = "",
+            imputation_cache_size_gb: float = 10.0,
             **kwargs,
     ):
         super().__init__()
@@ -964,15 +987,20 @@ class DNAmDataModuleImpute(LightningDataModule):
         self.pin_memory = pin_memory
         self.imputation = imputation
         self.k = k
+        self.imputation_cache_dir = imputation_cache_dir
+        self.imputation_cache_size_gb = imputation_cache_size_gb
+        self.imputer = None
 
         self.dataset: Optional[Dataset] = None
 
-        self.trn_val = pd.read_pickle(f"{self.trn_val_fn}")
-        self.inference = pd.read_pickle(f"{self.inference_fn}")
-
         features_df = pd.read_excel(self.features_fn)
         self.features_names = features_df.loc[:, 'features'].values
 
+        # only outcome and features are read from columnar data
+        columns = [self.outcome] + list(self.features_names)
+        self.trn_val = read_frame(f"{self.trn_val_fn}", columns=columns, errors='ignore')
+        self.inference = read_frame(f"{self.inference_fn}", columns=columns, errors='ignore')
+
         features_impute_df = pd.read_excel(self.features_impute_fn)
         missed_features = features_impute_df.loc[:, 'features'].values
 
@@ -992,40 +1020,41 @@ class DNAmDataModuleImpute(LightningDataModule):
 
         missed_features = list(
             set(missed_features).union(set(self.features_names) - set(self.inference.columns.values)))
-        missed_features_df = pd.DataFrame(index=missed_features, columns=["index"])
-        for mf in missed_features:
-            missed_features_df.at[mf, "index"] = np.where(self.features_names == mf)
+        missed_features_df = pd.DataFrame(index=missed_features)
+        missed_features_df["index"] = pd.Index(self.features_names).get_indexer(missed_features)
         missed_features_df.to_excel("missed_features.xlsx")
         exist_features = list(set(self.features_names) - set(missed_features))
-        if len(missed_features) > 0:
+        if self.imputation_cache_dir != "":
+            cache = ImputerCache(self.imputation_cache_dir, self.imputation_cache_size_gb)
+        else:
+            cache = None
+        if len(missed_features) > 0 and self.imputation in ["median", "mean", "knn"]:
+            log.info(f"Perform imputation for {len(missed_features)} features with {self.imputation}")
+            # imputer depends only on training data, feature list and method
+            key = get_fingerprint(self.trn_val.loc[:, self.features_names], self.imputation, self.k)
+            self.imputer = cache.load(key) if cache is not None else None
+            if self.imputer is None:
+                self.imputer = FeaturesImputer(method=self.imputation, k=self.k)
+                self.imputer.fit(self.trn_val.loc[:, self.features_names])
+                if cache is not None:
+                    cache.save(key, self.imputer)
+            else:
+                log.info(f"Imputer loaded from cache {cache.get_fn(key)}")
+            imputed = self.imputer.transform(self.inference, missed=missed_features, fill_nan=True)
+            self.inference = pd.concat([self.inference.drop(columns=self.inference.columns.intersection(self.features_names)), imputed], axis=1)
+        elif len(missed_features) > 0:
             log.info(f"Perform imputation for {len(missed_features)} features with {self.imputation}")
             inference_index = self.inference.index.values
             df = pd.concat([self.trn_val.loc[:, self.features_names], self.inference.loc[:, exist_features]])
-            df = df.astype(np.float)
-            if self.imputation == "median":
-                imputed_training = median(df.loc[:, self.features_names].values)
-            elif self.imputation == "mean":
-                imputed_training = mean(df.loc[:, self.features_names].values)
-            elif self.imputation == "fast_knn":
-                imputed_training = fast_knn(df.loc[:, self.features_names].values, k=self.k)
-            elif self.imputation == "random":
-                imputed_training = random(df.loc[:, self.features_names].values)
-            elif self.imputation == "mice":
-                imputed_training = mice(df.loc[:, self.features_names].values)
-            elif self.imputation == "em":
-                imputed_training = em(df.loc[:, self.features_names].values)
-            elif self.imputation == "mode":
-                imputed_training = mode(df.loc[:, self.features_names].values)
-            elif self.imputation == "BayesianRidge":
-                estimator = BayesianRidge(n_iter=10, verbose=1)
-                imp = IterativeImputer(estimator=estimator, max_iter=2, verbose=1)
-                imputed_training = imp.fit_transform(df.loc[:, self.features_names].values)
-            elif self.imputation == "DecisionTreeRegressor":
-                estimator = DecisionTreeRegressor()
-                imp = IterativeImputer(estimator=estimator, max_iter=2, verbose=1)
-                imputed_training = imp.fit_transform(df.loc[:, self.features_names].values)
+            df = df.astype(np.float64)
+            key = get_fingerprint(df, self.imputation, self.k)
+            imputed_training = cache.load(key) if cache is not None else None
+            if imputed_training is None:
+                imputed_training = impute_matrix(df.loc[:, self.features_names].values, self.imputation, self.k)
+                if cache is not None:
+                    cache.save(key, imputed_training)
             else:
-                raise ValueError(f"Unsupported imputation: {self.imputation}")
+                log.info(f"Imputation loaded from cache {cache.get_fn(key)}")
             df.loc[:, :] = imputed_training
             self.inference.loc[inference_index, self.features_names] = df.loc[inference_index, self.features_names]
         self.data = self.inference.loc[:, self.features_names]
@@ -1047,7 +1076,9 @@ class DNAmDataModuleImpute(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = DNAmDataset(self.data, self.output, self.outcome)
+        self.dataset = DNAmDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
     def prepare_data(self):
         pass
@@ -1056,7 +1087,7 @@ class DNAmDataModuleImpute(LightningDataModule):
         pass
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
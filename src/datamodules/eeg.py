@@ -7,6 +7,7 @@ import numpy as np
 import pandas as pd
 from collections import Counter
 from src.utils import utils
+from src.datamodules.datasets import FeaturesDataset, get_batched_dataloader
 from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.bar import add_bar_trace
 import plotly.express as px
@@ -17,28 +18,8 @@ from tqdm import tqdm
 
 log = utils.get_logger(__name__)
 
-class EEGDataset(Dataset):
-
-    def __init__(
-            self,
-            data: pd.DataFrame,
-            output: pd.DataFrame,
-            outcome: str
-    ):
-        self.data = data
-        self.output = output
-        self.outcome = outcome
-        self.num_subjects = self.data.shape[0]
-        self.num_features = self.data.shape[1]
-        self.ys = self.output.loc[:, self.outcome].values
-
-    def __getitem__(self, idx: int):
-        x = self.data.iloc[idx, :].to_numpy()
-        y = self.ys[idx]
-        return (x, y, idx)
-
-    def __len__(self):
-        return self.num_subjects
+class EEGDataset(FeaturesDataset):
+    pass
 
 
 class EEGDataModuleSeparate(LightningDataModule):
@@ -139,7 +120,9 @@ class EEGDataModuleSeparate(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = EEGDataset(self.data, self.output, self.outcome)
+        self.dataset = EEGDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
     def prepare_data(self):
         pass
@@ -240,7 +223,7 @@ class EEGDataModuleSeparate(LightningDataModule):
 
     def train_dataloader(self):
         if self.dataloaders_evaluate:
-            return DataLoader(
+            return get_batched_dataloader(
                 dataset=self.dataset_trn,
                 batch_size=self.batch_size,
                 num_workers=self.num_workers,
@@ -258,7 +241,7 @@ class EEGDataModuleSeparate(LightningDataModule):
                     num_samples=len(weights),
                     replacement=True
                 )
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -266,7 +249,7 @@ class EEGDataModuleSeparate(LightningDataModule):
                     sampler=weighted_sampler
                 )
             else:
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -275,7 +258,7 @@ class EEGDataModuleSeparate(LightningDataModule):
                 )
 
     def val_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_val,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -284,7 +267,7 @@ class EEGDataModuleSeparate(LightningDataModule):
         )
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_tst,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -406,7 +389,9 @@ class EEGDataModuleTrainValNoSplit(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = EEGDataset(self.data, self.output, self.outcome)
+        self.dataset = EEGDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
     def prepare_data(self):
         pass
@@ -481,7 +466,7 @@ class EEGDataModuleTrainValNoSplit(LightningDataModule):
 
     def train_dataloader(self):
         if self.dataloaders_evaluate:
-            return DataLoader(
+            return get_batched_dataloader(
                 dataset=self.dataset_trn,
                 batch_size=self.batch_size,
                 num_workers=self.num_workers,
@@ -499,7 +484,7 @@ class EEGDataModuleTrainValNoSplit(LightningDataModule):
                     num_samples=len(weights),
                     replacement=True
                 )
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -507,7 +492,7 @@ class EEGDataModuleTrainValNoSplit(LightningDataModule):
                     sampler=weighted_sampler
                 )
             else:
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -516,7 +501,7 @@ class EEGDataModuleTrainValNoSplit(LightningDataModule):
                 )
 
     def val_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_val,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -525,7 +510,7 @@ class EEGDataModuleTrainValNoSplit(LightningDataModule):
         )
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_tst,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
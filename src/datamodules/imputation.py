@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+import hashlib
+import pickle
+import os
+
+
+class FeaturesImputer:
+    """
+        Imputation of missing features (absent columns) and missing values with statistics fitted
+        once on the training frame and applied as block operations.
+
+        'median' and 'mean' fill with per-feature training statistics.
+        'knn' fills a feature from its k most correlated available features (correlations on training data):
+        z_f = sum_j r_fj * z_j / sum_j |r_fj|, where z are values standardized by training mean and std.
+
+    Args:
+        method: 'median', 'mean' or 'knn'
+        k: number of neighbouring features for 'knn'
+        chunk_size: number of imputed features processed at once, bounds memory of 'knn'
+    """
+
+    def __init__(
+            self,
+            method: str = "median",
+            k: int = 10,
+            chunk_size: int = 1000
+    ):
+        if method not in ["median", "mean", "knn"]:
+            raise ValueError(f"Unsupported imputation: {method}")
+        self.method = method
+        self.k = k
+        self.chunk_size = chunk_size
+
+    def fit(self, trn: pd.DataFrame):
+        self.features = trn.columns.values
+        X = trn.to_numpy(dtype=np.float32)
+        if self.method == "median":
+            if np.isnan(X).any():
+                self.stats = np.nanmedian(X, axis=0).astype(np.float32)
+            else:
+                self.stats = np.median(X, axis=0).astype(np.float32)
+        else:
+            self.stats = np.nanmean(X, axis=0).astype(np.float32)
+        if self.method == "knn":
+            scale = np.nanstd(X, axis=0).astype(np.float32)
+            scale[~(scale > 0)] = 1.0
+            self.scale = scale
+            Z = (X - self.stats) / self.scale
+            Z[np.isnan(Z)] = 0.0
+            self.Z = Z
+        return self
+
+    def transform(self, df: pd.DataFrame, missed=None, fill_nan: bool = False) -> pd.DataFrame:
+        """
+        Returns frame with all fitted features (in fitted order) for subjects of df.
+        Features absent in df or listed in missed are imputed completely,
+        NaNs of the other features are imputed only with fill_nan=True.
+        """
+        X = df.reindex(columns=self.features).to_numpy(dtype=np.float32, copy=True)
+        features = pd.Index(self.features)
+        is_missed = ~features.isin(df.columns)
+        if missed is not None:
+            is_missed |= features.isin(missed)
+        X[:, is_missed] = np.nan
+        if fill_nan:
+            to_fill = np.isnan(X)
+        else:
+            to_fill = np.zeros(X.shape, dtype=bool)
+            to_fill[:, is_missed] = True
+
+        if to_fill.any():
+            if self.method in ["median", "mean"]:
+                X[to_fill] = np.broadcast_to(self.stats, X.shape)[to_fill]
+            else:
+                self._fill_knn(X, to_fill, is_missed)
+
+        return pd.DataFrame(X, index=df.index, columns=self.features)
+
+    def _fill_knn(self, X: np.ndarray, to_fill: np.ndarray, is_missed: np.ndarray):
+        available = np.where(~is_missed)[0]
+        targets_all = np.where(to_fill.any(axis=0))[0]
+        if len(available) == 0:
+            X[to_fill] = np.broadcast_to(self.stats, X.shape)[to_fill]
+            return
+        k = min(self.k, len(available))
+        X_z = (X[:, available] - self.stats[available]) / self.scale[available]
+        available_pos = pd.Series(np.arange(len(available)), index=available)
+        n_trn = self.Z.shape[0]
+        for start in range(0, len(targets_all), self.chunk_size):
+            targets = targets_all[start:start + self.chunk_size]
+            R = self.Z[:, targets].T @ self.Z[:, available] / n_trn
+            # a feature is never its own neighbour
+            is_self = ~is_missed[targets]
+            R[np.where(is_self)[0], available_pos.loc[targets[is_self]].values] = 0.0
+            nb = np.argpartition(-np.abs(R), k - 1, axis=1)[:, :k]
+            w = np.take_along_axis(R, nb, axis=1)
+            Z_nb = X_z[:, nb]
+            mask = ~np.isnan(Z_nb)
+            num = np.where(mask, Z_nb * w, 0.0).sum(axis=2)
+            den = (np.abs(w) * mask).sum(axis=2)
+            z = np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+            vals = self.stats[targets] + self.scale[targets] * z
+            X[:, targets] = np.where(to_fill[:, targets], vals, X[:, targets])
+
+
+def get_fingerprint(*items) -> str:
+    """
+    Content hash of frames, arrays and plain parameters (str, numbers, lists).
+    Frames are hashed by index, columns and float values.
+    """
+    h = hashlib.sha256()
+    for item in items:
+        if isinstance(item, pd.DataFrame):
+            h.update('\n'.join(map(str, item.index.values)).encode())
+            h.update('\n'.join(map(str, item.columns.values)).encode())
+            h.update(np.ascontiguousarray(item.to_numpy(dtype=np.float64)).tobytes())
+        elif isinstance(item, np.ndarray):
+            h.update(str(item.shape).encode())
+            h.update(np.ascontiguousarray(item).tobytes())
+        else:
+            h.update(repr(item).encode())
+        h.update(b'|')
+    return h.hexdigest()
+
+
+class ImputerCache:
+    """
+        Content-addressed on-disk cache of fitted imputers and imputation results.
+        Every entry is a pickle named by its key (see get_fingerprint()). Reading an entry renews its
+        modification time, and the least recently used entries are removed when the total size
+        of the cache exceeds max_size_gb.
+
+    Args:
+        path: cache directory
+        max_size_gb: disk size limit of the cache
+    """
+
+    def __init__(self, path: str, max_size_gb: float = 10.0):
+        self.path = path
+        self.max_size = int(max_size_gb * 1024 ** 3)
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def get_fn(self, key: str):
+        return f"{self.path}/{key}.pkl"
+
+    def load(self, key: str):
+        fn = self.get_fn(key)
+        if not os.path.isfile(fn):
+            return None
+        try:
+            with open(fn, 'rb') as f:
+                obj = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            os.remove(fn)
+            return None
+        os.utime(fn)
+        return obj
+
+    def save(self, key: str, obj):
+        fn = self.get_fn(key)
+        fn_tmp = f"{fn}.{os.getpid()}.tmp"
+        with open(fn_tmp, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(fn_tmp, fn)
+        self.evict(keep=fn)
+
+    def evict(self, keep: str = None):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.pkl'):
+                stat = os.stat(f"{self.path}/{name}")
+                entries.append((stat.st_mtime, stat.st_size, f"{self.path}/{name}"))
+        total = sum(e[1] for e in entries)
+        for mtime, size, fn in sorted(entries):
+            if total <= self.max_size:
+                break
+            if fn == keep:
+                continue
+            os.remove(fn)
+            total -= size
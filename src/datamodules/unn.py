@@ -7,6 +7,7 @@ import numpy as np
 import pandas as pd
 from collections import Counter
 from src.utils import utils
+from src.datamodules.datasets import FeaturesDataset, get_batched_dataloader
 import matplotlib.pyplot as plt
 import os
 from scripts.python.routines.plot.save import save_figure
@@ -20,28 +21,8 @@ import pathlib
 
 log = utils.get_logger(__name__)
 
-class UNNDataset(Dataset):
-
-    def __init__(
-            self,
-            data: pd.DataFrame,
-            output: pd.DataFrame,
-            outcome: str
-    ):
-        self.data = data
-        self.output = output
-        self.outcome = outcome
-        self.num_subjects = self.data.shape[0]
-        self.num_features = self.data.shape[1]
-        self.ys = self.output.loc[:, self.outcome].values
-
-    def __getitem__(self, idx: int):
-        x = self.data.iloc[idx, :].to_numpy()
-        y = self.ys[idx]
-        return (x, y, idx)
-
-    def __len__(self):
-        return self.num_subjects
+class UNNDataset(FeaturesDataset):
+    pass
 
 
 class UNNDataModuleNoTest(LightningDataModule):
@@ -180,7 +161,9 @@ class UNNDataModuleNoTest(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = UNNDataset(self.data, self.output, self.outcome)
+        self.dataset = UNNDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
         self.ids_trn_val = np.arange(self.trn_val.shape[0])
 
@@ -291,7 +274,7 @@ class UNNDataModuleNoTest(LightningDataModule):
 
     def train_dataloader(self):
         if self.dataloaders_evaluate:
-            return DataLoader(
+            return get_batched_dataloader(
                 dataset=self.dataset_trn,
                 batch_size=self.batch_size,
                 num_workers=self.num_workers,
@@ -309,7 +292,7 @@ class UNNDataModuleNoTest(LightningDataModule):
                     num_samples=len(weights),
                     replacement=True
                 )
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -317,7 +300,7 @@ class UNNDataModuleNoTest(LightningDataModule):
                     sampler=weighted_sampler
                 )
             else:
-                return DataLoader(
+                return get_batched_dataloader(
                     dataset=self.dataset_trn,
                     batch_size=self.batch_size,
                     num_workers=self.num_workers,
@@ -326,7 +309,7 @@ class UNNDataModuleNoTest(LightningDataModule):
                 )
 
     def val_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_val,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -335,7 +318,7 @@ class UNNDataModuleNoTest(LightningDataModule):
         )
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset_tst,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -493,7 +476,9 @@ class UNNDataModuleInference(LightningDataModule):
         # self.dims is returned when you call datamodule.size()
         self.dims = (1, self.data.shape[1])
 
-        self.dataset = UNNDataset(self.data, self.output, self.outcome)
+        self.dataset = UNNDataset(self.data, self.output, self.outcome, shared=self.num_workers > 0)
+        # features of the datamodule are the frame of the dataset (over the shared segment with shared=True)
+        self.data = self.dataset.data
 
 
     def prepare_data(self):
@@ -503,7 +488,7 @@ class UNNDataModuleInference(LightningDataModule):
         pass
 
     def test_dataloader(self):
-        return DataLoader(
+        return get_batched_dataloader(
             dataset=self.dataset,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
@@ -1,58 +1,140 @@
-from src.models.old.fcmlp_model import FCMLPModel
-from src.models.old.fcvae_model_v2 import FCVAEModelV2
-from src.models.old.extractor_mlp_model import ExtractorFCMLPModel
-import pickle
-from src.datamodules.to_delete.datasets.dnam_dataset import DNAmDataset
-from torch.utils.data import DataLoader
+"""
+Export of TabNet, NODE and TabTransformer checkpoints to ONNX or TorchScript and their CPU runtime.
+Classification models are exported with two outputs computed in one forward pass:
+raw outputs and probabilities (the produce_probabilities head).
+"""
+import os
+import numpy as np
+import torch
+from src.utils import utils
 
 
-def save_onnx():
+log = utils.get_logger(__name__)
 
-    model_type = "ExtractorFCMLPModel"
 
+export_formats = {
+    'onnx': 'onnx',
+    'torchscript': 'pt',
+}
 
-    model_path = "E:/YandexDisk/Work/dnamvae/models/fcvae_mlp_model/logs/runs/2021-06-11/00-34-12"
-    ckpt_name = "epoch=77_fold_2"
-    ckpt_path = f"{model_path}/checkpoints/{ckpt_name}.ckpt"
 
-    data_path = "E:/YandexDisk/Work/dnamvae/data/datasets/combo/GSE40279_GSE87571_EPIC_GSE55763/vt_score_more_0.005_none/data_nn.pkl"
-    outcome = "age"
+class ExportWrapper(torch.nn.Module):
+    """
+        Model with both heads: returns raw outputs for regression, (raw outputs, probabilities) for classification.
+    """
 
-    if model_type == "FCMLPModel":
-        model = FCMLPModel.load_from_checkpoint(checkpoint_path=ckpt_path)
-    elif model_type == "FCVAEModelV2":
-        model = FCVAEModelV2.load_from_checkpoint(checkpoint_path=ckpt_path)
-    elif model_type == "ExtractorFCMLPModel":
-        model = ExtractorFCMLPModel.load_from_checkpoint(checkpoint_path=ckpt_path)
-    else:
-        raise ValueError("Unsupported model type!")
+    def __init__(self, model, task: str = "regression"):
+        super().__init__()
+        self.model = model
+        self.task = task
+        self.model.produce_probabilities = False
+        self.model.produce_importance = False
+
+    def forward(self, x):
+        raw = self.model(x)
+        if self.task == "classification":
+            return raw, torch.softmax(raw, dim=1)
+        return raw
 
-    # print model hyperparameters
-    print(model.hparams)
 
-    print(model)
+def get_export_path(ckpt_path: str, runtime: str = "onnx", quantize: bool = False):
+    if runtime not in export_formats:
+        raise ValueError(f"Unsupported runtime: {runtime}")
+    suffix = "_int8" if quantize else ""
+    return f"{os.path.splitext(ckpt_path)[0]}{suffix}.{export_formats[runtime]}"
 
-    # switch to evaluation mode
+
+def export_model(model, fn: str, input_dim: int, task: str = "regression", runtime: str = "onnx", quantize: bool = False, opset: int = 13):
+    """
+    Exports LightningModule in eval mode to fn with dynamic batch size.
+    With quantize=True weights of linear layers are converted to int8 (dynamic quantization):
+    by onnxruntime.quantization for ONNX and by torch.quantization for TorchScript.
+    """
+    if runtime not in export_formats:
+        raise ValueError(f"Unsupported runtime: {runtime}")
     model.eval()
-    model.freeze()
+    wrapper = ExportWrapper(model, task).eval()
+    # TabNet ghost batch norm splits batch into virtual batches, 2 rows are enough to trace it
+    x = torch.zeros(2, input_dim, dtype=torch.float32)
+    output_names = ['raw', 'prob'] if task == "classification" else ['raw']
+    # as in LightningModule.to_torchscript(): trainer property of module without Trainer raises while tracing
+    model._jit_is_scripting = True
+    try:
+        _export_wrapper(wrapper, x, fn, output_names, runtime, quantize, opset)
+    finally:
+        model._jit_is_scripting = False
+    log.info(f"Model exported to {fn}")
+    return fn
+
+
+def _export_wrapper(wrapper, x, fn: str, output_names, runtime: str, quantize: bool, opset: int):
+    if runtime == "onnx":
+        fn_fp32 = f"{os.path.splitext(fn)[0]}_fp32.onnx" if quantize else fn
+        torch.onnx.export(
+            wrapper,
+            x,
+            fn_fp32,
+            export_params=True,
+            opset_version=opset,
+            do_constant_folding=True,
+            input_names=['input'],
+            output_names=output_names,
+            dynamic_axes={name: {0: 'batch'} for name in ['input'] + output_names},
+        )
+        if quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(fn_fp32, fn, weight_type=QuantType.QInt8)
+            os.remove(fn_fp32)
+    else:
+        if quantize:
+            wrapper = torch.quantization.quantize_dynamic(wrapper, {torch.nn.Linear}, dtype=torch.qint8)
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(wrapper, x, check_trace=False))
+        torch.jit.save(traced, fn)
+
 
-    # load data
-    f = open(data_path, 'rb')
-    data = pickle.load(f)
-    f.close()
+class ExportedModel:
+    """
+        Exported model scored on CPU: ONNX files with onnxruntime, TorchScript files with torch.jit.
 
-    dataset = DNAmDataset(data, outcome)
-    dataloader = DataLoader(
-        dataset=dataset,
-        batch_size=1,
-        num_workers=0,
-        pin_memory=False,
-        shuffle=False,
-    )
+    Args:
+        fn: .onnx or .pt file saved by export_model()
+        task: 'regression' or 'classification'
+        num_threads: number of intra-op threads, 0 keeps runtime default
+    """
 
-    x, y = next(iter(dataloader))
+    def __init__(self, fn: str, task: str = "regression", num_threads: int = 0):
+        self.fn = fn
+        self.task = task
+        if fn.endswith('.onnx'):
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if num_threads > 0:
+                options.intra_op_num_threads = num_threads
+                options.inter_op_num_threads = 1
+            self.session = ort.InferenceSession(fn, options, providers=['CPUExecutionProvider'])
+            self.module = None
+        else:
+            if num_threads > 0:
+                torch.set_num_threads(num_threads)
+            self.session = None
+            self.module = torch.jit.load(fn, map_location='cpu')
 
-    model.to_onnx(f"{model_path}/checkpoints/{ckpt_name}.onnx", x, export_params=True)
+    def predict(self, X: np.ndarray):
+        """
+        Returns raw outputs and probabilities (None for regression) for rows X.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if self.session is not None:
+            outputs = self.session.run(None, {'input': X})
+        else:
+            with torch.no_grad():
+                outputs = self.module(torch.from_numpy(X))
+            if isinstance(outputs, torch.Tensor):
+                outputs = [outputs]
+            outputs = [output.numpy() for output in outputs]
+        if self.task == "classification":
+            return outputs[0], outputs[1]
+        return outputs[0], None
 
-if __name__ == "__main__":
-    save_onnx()
@@ -0,0 +1,448 @@
+"""
+Compilation of LightGBM, XGBoost and CatBoost models saved by sa pipelines into one flattened array representation
+of tree ensembles and its NumPy batch predictor.
+
+All trees are concatenated into node arrays (feature, threshold, left, right, default_left, missing, value),
+leaves point to themselves, so rows of a batch descend all trees simultaneously in max_depth vectorized steps.
+If numba is installed, rows are scored by compiled loop over trees instead.
+CatBoost oblivious trees are expanded into complete binary trees.
+"""
+import os
+import json
+import tempfile
+import numpy as np
+from src.utils import utils
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+log = utils.get_logger(__name__)
+
+
+tree_models = ['lightgbm', 'xgboost', 'catboost']
+
+# Treatment of missing values in node: NaN replaced by 0.0, NaN and zero go to default child, NaN goes to default child
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+
+
+def _predict_raw_rows(X, feature, threshold, children, default_left, missing, value, roots, strict, out):
+    for row in range(X.shape[0]):
+        for root in roots:
+            node = root
+            while children[2 * node] != node:
+                x = X[row, feature[node]]
+                is_missing = False
+                if np.isnan(x):
+                    if missing[node] == MISSING_NONE:
+                        x = 0.0
+                    else:
+                        is_missing = True
+                elif missing[node] == MISSING_ZERO and abs(x) <= 1e-35:
+                    is_missing = True
+                if is_missing:
+                    go_right = not default_left[node]
+                elif strict:
+                    go_right = x >= threshold[node]
+                else:
+                    go_right = x > threshold[node]
+                node = children[2 * node + go_right]
+            for out_id in range(value.shape[1]):
+                out[row, out_id] += value[node, out_id]
+
+
+_predict_raw_kernel = numba.njit(cache=True, nogil=True)(_predict_raw_rows) if numba is not None else None
+
+
+class TreeEnsemble:
+    """
+        Flattened tree ensemble.
+
+    Args:
+        feature, threshold, left, right, default_left, missing: node arrays of all trees
+        value: (nodes, outputs) values of leaves (zeros for internal nodes)
+        roots: root node of every tree
+        base: initial raw prediction for every output
+        decision: '<=' (LightGBM, CatBoost) or '<' (XGBoost), comparison of feature value and threshold sending row to the left child
+        link: 'identity', 'sigmoid', 'softmax' or 'exp', transformation of raw predictions
+        sigmoid: scale of raw predictions in sigmoid link
+        binary_two_columns: binary probabilities are returned for both classes (CatBoost)
+    """
+
+    def __init__(
+            self,
+            feature,
+            threshold,
+            left,
+            right,
+            default_left,
+            missing,
+            value,
+            roots,
+            base,
+            decision: str = "<=",
+            link: str = "identity",
+            sigmoid: float = 1.0,
+            binary_two_columns: bool = False,
+    ):
+        if decision not in ["<=", "<"]:
+            raise ValueError(f"Unsupported decision type: {decision}")
+        if link not in ["identity", "sigmoid", "softmax", "exp"]:
+            raise ValueError(f"Unsupported link: {link}")
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.missing = np.asarray(missing, dtype=np.int8)
+        self.value = np.asarray(value, dtype=np.float64).reshape(len(self.feature), -1)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.base = np.asarray(base, dtype=np.float64).reshape(self.value.shape[1])
+        self.decision = decision
+        self.link = link
+        self.sigmoid = sigmoid
+        self.binary_two_columns = binary_two_columns
+        self.max_depth = get_max_depth(self.left, self.right, self.roots)
+        # left and right children of node i are children[2 * i] and children[2 * i + 1]
+        self.children = np.stack([self.left, self.right], axis=1).ravel()
+        self.has_zero_missing = bool(np.any(self.missing == MISSING_ZERO))
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    @property
+    def num_outputs(self):
+        return self.value.shape[1]
+
+    def get_leaves(self, X: np.ndarray):
+        """
+        Leaf node of every tree for rows X: (rows, trees) array.
+        """
+        X = np.ascontiguousarray(X, dtype=self.threshold.dtype)
+        num_rows, num_features = X.shape
+        X_flat = X.ravel()
+        offsets = (np.arange(num_rows, dtype=np.int64) * num_features)[:, np.newaxis]
+        has_nan = bool(np.isnan(X).any())
+        check_missing = has_nan or self.has_zero_missing
+        leaves = np.broadcast_to(self.roots, (num_rows, self.num_trees)).copy()
+        for _ in range(self.max_depth):
+            x = np.take(X_flat, offsets + np.take(self.feature, leaves))
+            threshold = np.take(self.threshold, leaves)
+            if check_missing:
+                missing = np.take(self.missing, leaves)
+                is_nan = np.isnan(x)
+                x = np.where(is_nan & (missing == MISSING_NONE), 0.0, x)
+                is_missing = is_nan & (missing != MISSING_NONE)
+                if self.has_zero_missing:
+                    is_missing |= (missing == MISSING_ZERO) & (np.abs(x) <= 1e-35)
+            if self.decision == "<=":
+                go_right = x > threshold
+            else:
+                go_right = x >= threshold
+            if check_missing:
+                go_right = np.where(is_missing, ~np.take(self.default_left, leaves), go_right)
+            leaves = np.take(self.children, 2 * leaves + go_right)
+        return leaves
+
+    def predict_raw(self, X: np.ndarray, batch_size: int = 1024):
+        """
+        Raw predictions (rows, outputs), rows are processed in batches of batch_size.
+        """
+        if _predict_raw_kernel is not None:
+            raw = np.zeros((X.shape[0], self.num_outputs), dtype=np.float64)
+            X = np.ascontiguousarray(X, dtype=self.threshold.dtype)
+            _predict_raw_kernel(X, self.feature, self.threshold, self.children, self.default_left, self.missing, self.value, self.roots, self.decision == "<", raw)
+            raw += self.base
+            return raw
+        raw = np.empty((X.shape[0], self.num_outputs), dtype=np.float64)
+        for start in range(0, X.shape[0], batch_size):
+            leaves = self.get_leaves(X[start:start + batch_size])
+            for out_id in range(self.num_outputs):
+                raw[start:start + batch_size, out_id] = np.take(self.value[:, out_id], leaves).sum(axis=1)
+        raw += self.base
+        return raw
+
+    def transform(self, raw: np.ndarray):
+        if self.link == "sigmoid":
+            prob = 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+            if self.binary_two_columns and raw.shape[1] == 1:
+                prob = np.concatenate([1.0 - prob, prob], axis=1)
+            return prob
+        elif self.link == "softmax":
+            prob = np.exp(raw - raw.max(axis=1, keepdims=True))
+            return prob / prob.sum(axis=1, keepdims=True)
+        elif self.link == "exp":
+            return np.exp(raw)
+        return raw
+
+    def predict(self, X: np.ndarray, batch_size: int = 1024):
+        """
+        Returns raw predictions and transformed predictions (probabilities for classifiers)
+        in shapes of the library predict: (rows,) for single output models.
+        """
+        raw = self.predict_raw(X, batch_size)
+        pred = self.transform(raw)
+        if raw.shape[1] == 1:
+            raw = raw[:, 0]
+        if pred.shape[1] == 1:
+            pred = pred[:, 0]
+        return raw, pred
+
+    def save(self, fn: str):
+        params = {'decision': self.decision, 'link': self.link, 'sigmoid': self.sigmoid, 'binary_two_columns': self.binary_two_columns}
+        np.savez(
+            fn,
+            feature=self.feature,
+            threshold=self.threshold,
+            left=self.left,
+            right=self.right,
+            default_left=self.default_left,
+            missing=self.missing,
+            value=self.value,
+            roots=self.roots,
+            base=self.base,
+            params=json.dumps(params),
+        )
+
+
+def load_tree_ensemble(fn: str) -> TreeEnsemble:
+    data = np.load(fn)
+    params = json.loads(str(data['params']))
+    arrays = {key: data[key] for key in data.files if key != 'params'}
+    return TreeEnsemble(**arrays, **params)
+
+
+def get_max_depth(left, right, roots):
+    nodes = roots
+    depth = 0
+    while True:
+        nodes = nodes[left[nodes] != nodes]
+        if len(nodes) == 0:
+            return depth
+        nodes = np.concatenate([left[nodes], right[nodes]])
+        depth += 1
+
+
+def concat_trees(trees, num_outputs: int, threshold_dtype):
+    """
+    Concatenates trees given as dicts of local node arrays (children of leaves are -1) into node arrays of ensemble.
+    """
+    arrays = {key: [] for key in ['feature', 'threshold', 'left', 'right', 'default_left', 'missing', 'value']}
+    roots = np.zeros(len(trees), dtype=np.int32)
+    offset = 0
+    for tree_id, tree in enumerate(trees):
+        num_nodes = len(tree['left'])
+        ids = np.arange(offset, offset + num_nodes, dtype=np.int32)
+        is_leaf = np.asarray(tree['left']) < 0
+        roots[tree_id] = offset
+        arrays['left'].append(np.where(is_leaf, ids, np.asarray(tree['left']) + offset))
+        arrays['right'].append(np.where(is_leaf, ids, np.asarray(tree['right']) + offset))
+        arrays['feature'].append(np.where(is_leaf, 0, tree['feature']))
+        arrays['threshold'].append(np.where(is_leaf, 0.0, tree['threshold']))
+        arrays['default_left'].append(tree['default_left'])
+        arrays['missing'].append(tree['missing'])
+        value = np.zeros((num_nodes, num_outputs))
+        if tree['value'].ndim == 1:
+            value[is_leaf, tree['output']] = tree['value'][is_leaf]
+        else:
+            value[is_leaf, :] = tree['value'][is_leaf, :]
+        arrays['value'].append(value)
+        offset += num_nodes
+    res = {key: np.concatenate(values) for key, values in arrays.items()}
+    res['threshold'] = res['threshold'].astype(threshold_dtype)
+    res['roots'] = roots
+    return res
+
+
+def _parse_lightgbm_node(node, tree):
+    node_id = len(tree['left'])
+    for key in tree:
+        tree[key].append(-1 if key in ['left', 'right'] else 0)
+    if 'leaf_value' in node:
+        tree['value'][node_id] = node['leaf_value']
+        return node_id
+    if node['decision_type'] != '<=':
+        raise ValueError(f"Unsupported LightGBM decision type: {node['decision_type']}, categorical features are not supported")
+    tree['feature'][node_id] = node['split_feature']
+    tree['threshold'][node_id] = node['threshold']
+    tree['default_left'][node_id] = node['default_left']
+    tree['missing'][node_id] = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}[node['missing_type']]
+    tree['left'][node_id] = _parse_lightgbm_node(node['left_child'], tree)
+    tree['right'][node_id] = _parse_lightgbm_node(node['right_child'], tree)
+    return node_id
+
+
+def compile_lightgbm(booster, num_iteration: int = None) -> TreeEnsemble:
+    """
+    Compiles lgb.Booster, by default up to its best iteration as in sa pipelines.
+    """
+    if num_iteration is None and booster.best_iteration > 0:
+        num_iteration = booster.best_iteration
+    dump = booster.dump_model(num_iteration=num_iteration)
+    if dump.get('average_output', False):
+        raise ValueError("LightGBM random forest models are not supported")
+    num_outputs = dump['num_tree_per_iteration']
+    trees = []
+    for tree_info in dump['tree_info']:
+        tree = {key: [] for key in ['feature', 'threshold', 'left', 'right', 'default_left', 'missing', 'value']}
+        _parse_lightgbm_node(tree_info['tree_structure'], tree)
+        tree = {key: np.asarray(values) for key, values in tree.items()}
+        tree['output'] = tree_info['tree_index'] % num_outputs
+        trees.append(tree)
+
+    objective = dump['objective'].split(' ')
+    link = "identity"
+    sigmoid = 1.0
+    if objective[0] in ['binary', 'cross_entropy']:
+        link = "sigmoid"
+        for param in objective[1:]:
+            if param.startswith('sigmoid:'):
+                sigmoid = float(param.split(':')[1])
+    elif objective[0] == 'multiclass':
+        link = "softmax"
+    elif objective[0] in ['poisson', 'gamma', 'tweedie']:
+        link = "exp"
+    elif objective[0] == 'multiclassova':
+        raise ValueError(f"Unsupported LightGBM objective: {objective[0]}")
+
+    arrays = concat_trees(trees, num_outputs, np.float64)
+    return TreeEnsemble(**arrays, base=np.zeros(num_outputs), decision="<=", link=link, sigmoid=sigmoid)
+
+
+def compile_xgboost(booster) -> TreeEnsemble:
+    """
+    Compiles xgb.Booster with gbtree booster. Initial prediction (base_score) is calibrated with
+    the margin of the booster, as its representation differs between XGBoost versions.
+    """
+    import xgboost as xgb
+    model = json.loads(booster.save_raw(raw_format='json'))
+    learner = model['learner']
+    if learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Unsupported XGBoost booster: {learner['gradient_booster']['name']}")
+    num_outputs = max(int(learner['learner_model_param']['num_class']), 1)
+    tree_info = learner['gradient_booster']['model']['tree_info']
+    trees = []
+    for tree_id, tree_json in enumerate(learner['gradient_booster']['model']['trees']):
+        if np.any(np.asarray(tree_json['split_type']) != 0):
+            raise ValueError("Categorical features of XGBoost are not supported")
+        left = np.asarray(tree_json['left_children'])
+        trees.append({
+            'feature': np.asarray(tree_json['split_indices']),
+            'threshold': np.asarray(tree_json['split_conditions']),
+            'left': left,
+            'right': np.asarray(tree_json['right_children']),
+            'default_left': np.asarray(tree_json['default_left'], dtype=bool),
+            'missing': np.full(len(left), MISSING_NAN),
+            'value': np.asarray(tree_json['split_conditions']),
+            'output': tree_info[tree_id],
+        })
+
+    objective = learner['objective']['name']
+    if objective in ['binary:logistic', 'reg:logistic']:
+        link = "sigmoid"
+    elif objective in ['multi:softprob', 'multi:softmax']:
+        link = "softmax"
+    elif objective in ['count:poisson', 'reg:gamma', 'reg:tweedie']:
+        link = "exp"
+    else:
+        link = "identity"
+
+    arrays = concat_trees(trees, num_outputs, np.float32)
+    ensemble = TreeEnsemble(**arrays, base=np.zeros(num_outputs), decision="<", link=link)
+    X_base = np.zeros((1, booster.num_features()), dtype=np.float32)
+    margin = booster.predict(xgb.DMatrix(X_base, feature_names=booster.feature_names), output_margin=True)
+    ensemble.base = np.asarray(margin, dtype=np.float64).reshape(num_outputs) - ensemble.predict_raw(X_base)[0]
+    return ensemble
+
+
+def compile_catboost(model) -> TreeEnsemble:
+    """
+    Compiles CatBoost model with numerical features only.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model.save_model(f"{tmp_dir}/model.json", format='json')
+        with open(f"{tmp_dir}/model.json") as f:
+            model_json = json.load(f)
+    float_features = {info['feature_index']: info for info in model_json['features_info'].get('float_features', [])}
+    trees = []
+    num_outputs = 1
+    for tree_json in model_json['oblivious_trees']:
+        splits = tree_json['splits']
+        for split in splits:
+            if split['split_type'] != 'FloatFeature':
+                raise ValueError(f"Unsupported CatBoost split type: {split['split_type']}")
+        depth = len(splits)
+        num_leaves = 2 ** depth
+        leaf_values = np.asarray(tree_json['leaf_values']).reshape(num_leaves, -1)
+        num_outputs = leaf_values.shape[1]
+        # complete binary tree in heap order, nodes of level l split by splits[depth - 1 - l],
+        # so the position of a leaf in the last level is its index in leaf_values
+        num_internal = num_leaves - 1
+        heap = np.arange(num_internal)
+        levels = np.floor(np.log2(heap + 1)).astype(int)
+        split_ids = depth - 1 - levels
+        features = [float_features[splits[i]['float_feature_index']] for i in split_ids]
+        value = np.zeros((num_internal + num_leaves, num_outputs))
+        value[num_internal:] = leaf_values
+        trees.append({
+            'feature': np.concatenate([[info['flat_feature_index'] for info in features], np.zeros(num_leaves, dtype=int)]),
+            'threshold': np.concatenate([[splits[i]['border'] for i in split_ids], np.zeros(num_leaves)]),
+            'left': np.concatenate([2 * heap + 1, np.full(num_leaves, -1)]),
+            'right': np.concatenate([2 * heap + 2, np.full(num_leaves, -1)]),
+            'default_left': np.concatenate([[info['nan_value_treatment'] != 'AsTrue' for info in features], np.zeros(num_leaves, dtype=bool)]),
+            'missing': np.full(num_internal + num_leaves, MISSING_NAN),
+            'value': value,
+        })
+
+    scale, bias = model_json.get('scale_and_bias', [1.0, [0.0] * num_outputs])
+    for tree in trees:
+        tree['value'] = tree['value'] * scale
+    loss_function = model_json['model_info'].get('params', {}).get('loss_function', {}).get('type', '')
+    if loss_function in ['Logloss', 'CrossEntropy']:
+        link = "sigmoid"
+    elif loss_function in ['MultiClass', 'MultiClassOneVsAll']:
+        link = "softmax"
+    else:
+        # CatBoost regressors predict raw values by default
+        link = "identity"
+
+    arrays = concat_trees(trees, num_outputs, np.float32)
+    return TreeEnsemble(**arrays, base=np.broadcast_to(np.asarray(bias, dtype=np.float64), num_outputs), decision="<=", link=link, binary_two_columns=True)
+
+
+def compile_model(model_type: str, model) -> TreeEnsemble:
+    if model_type == "lightgbm":
+        ensemble = compile_lightgbm(model)
+    elif model_type == "xgboost":
+        ensemble = compile_xgboost(model)
+    elif model_type == "catboost":
+        ensemble = compile_catboost(model)
+    else:
+        raise ValueError(f"Unsupported model_type for compilation: {model_type}")
+    log.info(f"Compiled {model_type}: {ensemble.num_trees} trees, {len(ensemble.feature)} nodes, max depth {ensemble.max_depth}")
+    return ensemble
+
+
+def get_compiled_path(ckpt_path: str):
+    return f"{os.path.splitext(ckpt_path)[0]}_trees.npz"
+
+
+def compiled_predict_func(model_type: str, model, output: str = "pred", batch_size: int = 1024):
+    """
+    predict_func for SHAP and LIME: the model is compiled on the first call.
+    output: 'pred' (predictions or probabilities, as predict of the library) or 'raw'
+    """
+    compiled = {}
+
+    def predict_func(X):
+        if 'ensemble' not in compiled:
+            compiled['ensemble'] = compile_model(model_type, model)
+        raw, pred = compiled['ensemble'].predict(X, batch_size)
+        return raw if output == "raw" else pred
+
+    return predict_func
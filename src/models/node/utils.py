@@ -112,15 +112,18 @@ class Entmax15Function(Function):
     @staticmethod
     def forward(ctx, input, dim=-1):
         ctx.dim = dim
+        output = Entmax15Function._forward(input, dim)
+        ctx.save_for_backward(output)
+        return output
 
+    @staticmethod
+    def _forward(input, dim=-1):
         max_val, _ = input.max(dim=dim, keepdim=True)
         input = input - max_val  # same numerical stability trick as for softmax
         input = input / 2  # divide by 2 to solve actual Entmax
 
         tau_star, _ = Entmax15Function._threshold_and_support(input, dim)
-        output = torch.clamp(input - tau_star, min=0) ** 2
-        ctx.save_for_backward(output)
-        return output
+        return torch.clamp(input - tau_star, min=0) ** 2
 
     @staticmethod
     def backward(ctx, grad_output):
@@ -185,11 +188,17 @@ class Entmoid15(Function):
         return grad_input
 
 
+# Autograd functions can not be saved in traced modules, their forward passes are traced instead (export of models)
 def entmax15(input, dim=-1):
+    if torch.jit.is_tracing():
+        return Entmax15Function._forward(input, dim)
     return Entmax15Function.apply(input, dim)
 
 
-entmoid15 = Entmoid15.apply
+def entmoid15(input):
+    if torch.jit.is_tracing():
+        return Entmoid15._forward(input)
+    return Entmoid15.apply(input)
 
 
 class Lambda(nn.Module):
@@ -63,6 +63,11 @@ def extras(config: DictConfig) -> None:
             if config.datamodule.get("num_workers"):
                 config.datamodule.num_workers = 0
 
+    # formats of saved figures (empty list skips saving) and background rendering processes
+    if config.get("plot_formats") is not None or config.get("plot_n_jobs"):
+        from scripts.python.routines.plot.save import set_figure_rendering
+        set_figure_rendering(config.get("plot_formats", ['png', 'pdf']), config.get("plot_n_jobs", 0))
+
     # disable adding new keys to config
     OmegaConf.set_struct(config, True)
 
@@ -8,7 +8,6 @@ from scripts.python.routines.plot.save import save_figure
 from scripts.python.routines.plot.scatter import add_scatter_trace
 from scripts.python.routines.plot.layout import add_layout
 import plotly.express as px
-import re
 
 disease = "Schizophrenia"
 data_type = "harmonized"
@@ -17,7 +16,7 @@ run_type = "trn_val_tst"
 tst_dataset = "GSE116379"
 
 num_realizations = 8
-n_feats = np.linspace(10, 500, 50, dtype=int)
+n_feats = np.linspace(10, 1000, 100, dtype=int)
 
 base_dir = f"/common/home/yusipov_i/data/dnam/datasets/meta/GPL13534_Blood/{disease}"
 models_dir = f"{base_dir}/{data_type}/models"
@@ -38,42 +37,32 @@ parts = ['train', 'val', 'test']
 baseline_fn = f"{base_dir}/harmonized/models/baseline/{disease}_{data_type}_trn_val_tst_{model_type}/runs/2022-03-31_00-58-59/metrics_val_best_0002.xlsx"
 baseline_metrics_df = pd.read_excel(baseline_fn, index_col="metric")
 
+project_name = f'{disease}_{data_type}_{run_type}_{model_type}_{tst_dataset}_n_feats'
+# one n_feats.xlsx table for every realization of hyperparameters
+files = glob(f"{models_dir}/{project_name}/multiruns/*/*/n_feats.xlsx")
+if len(files) != num_realizations:
+    print(f"Available files:")
+    for f in files:
+        print(f)
+    raise ValueError("Some files are missed!")
+tables = {file: pd.read_excel(file, index_col="n_feat") for file in files}
+
 metrics_global_df = pd.DataFrame(
     index=n_feats,
     columns=[x + f"_train" for x in list(metrics.keys())] + [x + f"_val" for x in list(metrics.keys())] + [x + f"_test" for x in list(metrics.keys())] + ['file']
 )
 metrics_global_df.index.name = "n_feat"
 for n_feat in n_feats:
-    print(n_feat)
-    project_name = f'{disease}_{data_type}_{run_type}_{model_type}_{tst_dataset}_{n_feat}'
-    files = glob(f"{models_dir}/{project_name}/multiruns/*/*/metrics_{optimized_part}_best_*.xlsx")
-
-    if len(files) != num_realizations:
-        print(len(files))
-        print(f"Available files for {n_feat}:")
-        for f in files:
-            print(f)
-        raise ValueError("Some files are missed!")
-
-    metrics_local_df = pd.DataFrame(index=files, columns=[optimized_metric])
-    for file in files:
-        df = pd.read_excel(file, index_col="metric")
-        metrics_local_df.at[file, optimized_metric] = df.at[optimized_metric, optimized_part]
-    metrics_local_df.sort_values([optimized_metric], ascending=[False if direction == "max" else True], inplace=True)
-    best_file = metrics_local_df.index.values[0]
+    missed = [file for file, table in tables.items() if n_feat not in table.index]
+    if len(missed) > 0:
+        raise ValueError(f"No {n_feat} features in {missed}")
+    # column optimized_metric holds config.optimized_metric of config.optimized_part for the best fold
+    values = pd.Series({file: table.at[n_feat, 'optimized_metric'] for file, table in tables.items()})
+    best_file = values.idxmax() if direction == "max" else values.idxmin()
     metrics_global_df.at[n_feat, 'file'] = best_file
-    print(best_file)
-
-    head, tail = os.path.split(best_file)
-    search_string = 'metrics_.*_best_(\d*).xlsx'
-    search_split_id = re.search(search_string, tail)
-    split_id = search_split_id.group(1)
-    print(split_id)
-
     for part in parts:
-        df = pd.read_excel(f"{head}/metrics_{part}_best_{split_id}.xlsx", index_col="metric")
         for metric in metrics:
-            metrics_global_df.at[n_feat, f"{metric}_{part}"] = df.at[metric, part]
+            metrics_global_df.at[n_feat, f"{metric}_{part}"] = tables[best_file].at[n_feat, f"{metric}_{part}"]
 
 Path(f"{models_dir}/iterative/{disease}_{data_type}_{run_type}_{model_type}_{tst_dataset}").mkdir(parents=True, exist_ok=True)
 metrics_global_df.to_excel(f"{models_dir}/iterative/{disease}_{data_type}_{run_type}_{model_type}_{tst_dataset}/metrics.xlsx", index=True)
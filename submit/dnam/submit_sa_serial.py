@@ -34,46 +34,48 @@ feat_imp_df.index.name = "features"
 feat_imp_df.sort_values(['importance'], ascending=[False], inplace=True)
 cpgs_path = f"{base_dir}/{data_type}/cpgs/serial/{run_type}/{model_type}/{tst_dataset}"
 Path(cpgs_path).mkdir(parents=True, exist_ok=True)
-n_feats = np.linspace(10, 1000, 100, dtype=int)
-# n_feats = [10]
+# all numbers of features are trained in one job on the data loaded once,
+# leading features of features_fn are taken for every number
+n_feats = {'start': 10, 'stop': 1000, 'num': 100}
+n_feat_max = n_feats['stop']
+feats_df = feat_imp_df.head(n_feat_max)
+features_fn = f"{cpgs_path}/{n_feat_max}.xlsx"
+feats_df.to_excel(features_fn, index=True)
 
-for n_feat in n_feats:
-    project_name = f'{disease}_{data_type}_{run_type}_{model_type}_{tst_dataset}_{n_feat}'
-    feats_df = feat_imp_df.head(n_feat)
-    feats_df.to_excel(f"{cpgs_path}/{n_feat}.xlsx", index=True)
-    features_fn = f"{cpgs_path}/{n_feat}.xlsx"
+project_name = f'{disease}_{data_type}_{run_type}_{model_type}_{tst_dataset}_n_feats'
 
-    args = f"--multirun " \
-           f"disease={disease} " \
-           f"data_type={data_type} " \
-           f"model_type={model_type} " \
-           f"project_name={project_name} " \
-           f"tst_dataset={tst_dataset} " \
-           f"logger=many_loggers " \
-           f"logger.wandb.offline=True " \
-           f"base_dir={base_dir} " \
-           f"in_dim={n_feat} " \
-           f"datamodule.features_fn={features_fn} " \
-           f"experiment=dnam/multiclass/{run_type}/sa "
+args = f"--multirun " \
+       f"disease={disease} " \
+       f"data_type={data_type} " \
+       f"model_type={model_type} " \
+       f"project_name={project_name} " \
+       f"tst_dataset={tst_dataset} " \
+       f"logger=many_loggers " \
+       f"logger.wandb.offline=True " \
+       f"base_dir={base_dir} " \
+       f"in_dim={n_feat_max} " \
+       f"n_feats={{start:{n_feats['start']},stop:{n_feats['stop']},num:{n_feats['num']}}} " \
+       f"datamodule.features_fn={features_fn} " \
+       f"experiment=dnam/multiclass/{run_type}/sa "
 
-    if model_type == 'catboost':
-        args += f"catboost.learning_rate={','.join(str(x) for x in catboost_learning_rate)} " \
-                f"catboost.depth={','.join(str(x) for x in catboost_depth)} " \
-                f"catboost.min_data_in_leaf={','.join(str(x) for x in catboost_min_data_in_leaf)} " \
-                f"catboost.max_leaves={','.join(str(x) for x in catboost_max_leaves)} "
-    elif model_type == 'lightgbm':
-        args += f"lightgbm.learning_rate={','.join(str(x) for x in lightgbm_learning_rate)} " \
-                f"lightgbm.num_leaves={','.join(str(x) for x in lightgbm_num_leaves)} " \
-                f"lightgbm.min_data_in_leaf={','.join(str(x) for x in lightgbm_min_data_in_leaf)} " \
-                f"lightgbm.feature_fraction={','.join(str(x) for x in lightgbm_feature_fraction)} " \
-                f"lightgbm.bagging_fraction={','.join(str(x) for x in lightgbm_bagging_fraction)} "
-    elif model_type == 'xgboost':
-        args += f"xgboost.learning_rate={','.join(str(x) for x in xgboost_learning_rate)} " \
-                f"xgboost.booster={','.join(str(x) for x in xgboost_booster)} " \
-                f"xgboost.max_depth={','.join(str(x) for x in xgboost_max_depth)} " \
-                f"xgboost.gamma={','.join(str(x) for x in xgboost_gamma)} " \
-                f"xgboost.subsample={','.join(str(x) for x in xgboost_subsample)} "
-    else:
-        raise ValueError(f"Unsupported model_type: {model_type}")
+if model_type == 'catboost':
+    args += f"catboost.learning_rate={','.join(str(x) for x in catboost_learning_rate)} " \
+            f"catboost.depth={','.join(str(x) for x in catboost_depth)} " \
+            f"catboost.min_data_in_leaf={','.join(str(x) for x in catboost_min_data_in_leaf)} " \
+            f"catboost.max_leaves={','.join(str(x) for x in catboost_max_leaves)} "
+elif model_type == 'lightgbm':
+    args += f"lightgbm.learning_rate={','.join(str(x) for x in lightgbm_learning_rate)} " \
+            f"lightgbm.num_leaves={','.join(str(x) for x in lightgbm_num_leaves)} " \
+            f"lightgbm.min_data_in_leaf={','.join(str(x) for x in lightgbm_min_data_in_leaf)} " \
+            f"lightgbm.feature_fraction={','.join(str(x) for x in lightgbm_feature_fraction)} " \
+            f"lightgbm.bagging_fraction={','.join(str(x) for x in lightgbm_bagging_fraction)} "
+elif model_type == 'xgboost':
+    args += f"xgboost.learning_rate={','.join(str(x) for x in xgboost_learning_rate)} " \
+            f"xgboost.booster={','.join(str(x) for x in xgboost_booster)} " \
+            f"xgboost.max_depth={','.join(str(x) for x in xgboost_max_depth)} " \
+            f"xgboost.gamma={','.join(str(x) for x in xgboost_gamma)} " \
+            f"xgboost.subsample={','.join(str(x) for x in xgboost_subsample)} "
+else:
+    raise ValueError(f"Unsupported model_type: {model_type}")
 
-    os.system(f"sbatch run_multiclass_trn_val_tst_sa.sh \"{args}\"")
+os.system(f"sbatch run_multiclass_trn_val_tst_sa.sh \"{args}\"")
@@ -0,0 +1,86 @@
+import json
+import pickle
+import threading
+import urllib.request
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("lightgbm")
+pytest.importorskip("sklearn")
+
+from sklearn.linear_model import ElasticNet
+from scripts.python.routines.columnar import save_columnar
+from experiment.batch_inference import ModelRegistry, score_file, get_request_handler
+from http.server import ThreadingHTTPServer
+
+
+def get_registry(tmp_path, num_features=5):
+    rng = np.random.default_rng(0)
+    features = [f"cg{i:08d}" for i in range(num_features)]
+    X = rng.random((100, num_features)).astype(np.float32)
+    model = ElasticNet(alpha=1e-4).fit(X, X @ np.arange(num_features))
+    with open(f"{tmp_path}/elastic_net.pkl", 'wb') as f:
+        pickle.dump(model, f)
+    registry = ModelRegistry()
+    registry.register("age", "elastic_net", f"{tmp_path}/elastic_net.pkl", features, batch_size=7)
+    return registry, model, features
+
+
+def get_cohort(features, num_subjects=23):
+    rng = np.random.default_rng(1)
+    index = pd.Index([f"GSM{i:07d}" for i in range(num_subjects)], name='subject_id')
+    df = pd.DataFrame(rng.random((num_subjects, len(features))), index=index, columns=features)
+    df['Age'] = 0.0
+    return df
+
+
+def test_score_columnar_file(tmp_path):
+    registry, model, features = get_registry(tmp_path)
+    df = get_cohort(features)
+    save_columnar(df, f"{tmp_path}/cohort")
+    num_subjects = score_file(registry.get("age"), f"{tmp_path}/cohort", f"{tmp_path}/predictions.csv", chunk_size=10)
+    assert num_subjects == df.shape[0]
+    res = pd.read_csv(f"{tmp_path}/predictions.csv", index_col=0)
+    assert list(res.index) == list(df.index)
+    assert np.allclose(res['Estimation'].values, model.predict(df.loc[:, features].values.astype(np.float32)), atol=1e-4)
+
+
+def test_http_predict(tmp_path):
+    registry, model, features = get_registry(tmp_path)
+    df = get_cohort(features, 4)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), get_request_handler(registry))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/models") as response:
+            assert json.loads(response.read()) == ["age"]
+        request = urllib.request.Request(f"{url}/predict/age", data=df.to_json(orient='split').encode(), method='POST')
+        with urllib.request.urlopen(request) as response:
+            res = json.loads(response.read())
+        assert res['index'] == list(df.index)
+        assert np.allclose(np.array(res['data'])[:, 0], model.predict(df.loc[:, features].values.astype(np.float32)), atol=1e-4)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("runtime", ["native", "compiled"])
+def test_binary_lightgbm(tmp_path, runtime):
+    import lightgbm as lgb
+    rng = np.random.default_rng(2)
+    features = [f"cg{i:08d}" for i in range(4)]
+    X = rng.random((200, len(features))).astype(np.float32)
+    y = (X[:, 0] + 0.1 * rng.random(200) > 0.5).astype(int)
+    model = lgb.train({'objective': 'binary', 'verbose': -1, 'num_threads': 1}, lgb.Dataset(X, label=y), num_boost_round=20)
+    model.save_model(f"{tmp_path}/lightgbm.txt")
+    registry = ModelRegistry()
+    registry.register("status", "lightgbm", f"{tmp_path}/lightgbm.txt", features, task="classification", runtime=runtime)
+    df = get_cohort(features, 30)
+    res = registry.get("status").predict(df)
+    prob = model.predict(df.loc[:, features].values.astype(np.float32))
+    assert np.allclose(res["pred_prob_1"].values, prob, atol=1e-5)
+    assert np.allclose(res["pred_prob_0"].values, 1 - prob, atol=1e-5)
+    assert list(res["pred"].values) == list((prob > 0.5).astype(int))
+    assert 0 < res["pred"].sum() < 30
@@ -0,0 +1,65 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.python.routines.columnar import save_columnar
+from scripts.python.routines.clock import Clock, ClockEngine, clock_from_frame, apply_clocks
+
+
+def get_clocks(cpgs, seed=0):
+    rng = np.random.default_rng(seed)
+    clocks = {}
+    for name in ['clock_1', 'clock_2']:
+        coefs = rng.normal(size=len(cpgs)) * (rng.random(len(cpgs)) < 0.5)
+        clocks[name] = Clock(cpgs, coefs, rng.random(len(cpgs)), rng.normal())
+    return clocks
+
+
+def naive_predict(clock, betas):
+    values = []
+    for subject in betas.index:
+        value = clock.intercept
+        for cpg, coef, default in zip(clock.features, clock.coefs, clock.defaults):
+            x = betas.at[subject, cpg] if cpg in betas.columns else np.nan
+            value += coef * (default if np.isnan(x) else x)
+        values.append(value)
+    return np.array(values)
+
+
+@pytest.mark.parametrize("columnar", [True, False])
+def test_apply_clocks(tmp_path, columnar):
+    rng = np.random.default_rng(1)
+    cpgs = [f"cg{i:08d}" for i in range(30)]
+    clocks = get_clocks(cpgs)
+    datasets = {}
+    for dataset_id in range(2):
+        index = pd.Index([f"GSM{dataset_id}{i:06d}" for i in range(17)], name='subject_id')
+        # every dataset lacks some CpGs and has NaNs
+        betas = pd.DataFrame(rng.random((17, 25)), index=index, columns=list(rng.permutation(cpgs)[:25]))
+        betas = betas.mask(rng.random(betas.shape) < 0.1).astype(np.float32)
+        path = f"{tmp_path}/dataset_{dataset_id}"
+        if columnar:
+            save_columnar(betas, f"{path}/betas")
+        else:
+            os.makedirs(path)
+            betas.to_pickle(f"{path}/betas.pkl")
+        datasets[f"dataset_{dataset_id}"] = (path, betas)
+
+    res = apply_clocks(clocks, {name: path for name, (path, _) in datasets.items()}, chunk_size=5)
+    for name, (path, betas) in datasets.items():
+        values = res.loc[res['dataset'] == name, :]
+        assert list(values.index) == list(betas.index)
+        for clock_name, clock in clocks.items():
+            assert np.allclose(values[clock_name].values, naive_predict(clock, betas.astype(np.float64)))
+
+
+def test_clock_frame_roundtrip():
+    cpgs = [f"cg{i:08d}" for i in range(10)]
+    clock = get_clocks(cpgs)['clock_1']
+    df = clock.to_frame()
+    assert df.index[0] == 'Intercept'
+    assert df.shape[0] == len(clock.features) + 1
+    clock_2 = clock_from_frame(df)
+    betas = pd.DataFrame(np.random.default_rng(2).random((4, 10)), columns=cpgs)
+    assert np.allclose(clock_2.predict(betas), ClockEngine({'c': clock}).predict(betas)['c'].values)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import ElasticNet, ElasticNetCV
+from sklearn.model_selection import GridSearchCV, KFold, RepeatedKFold
+from scripts.python.routines.clock_training import get_alpha_grid, path_cv_scores, search_elastic_net, train_clock_repeated, save_clock
+
+
+def get_data(n=120, p=15, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, p))
+    y = X[:, :4] @ np.array([3.0, -2.0, 1.0, 0.5]) + rng.normal(size=n) + 40
+    return X, y
+
+
+def test_search_elastic_net_as_grid_search():
+    X, y = get_data()
+    alphas = np.logspace(-3, 0, 7)
+    cv = RepeatedKFold(n_splits=3, n_repeats=2, random_state=1)
+    model, params, cv_results = search_elastic_net(X, y, alphas, [0.3, 0.7], cv, max_iter=100000, tol=1e-10)
+    grid = GridSearchCV(ElasticNet(max_iter=100000, tol=1e-10), {'alpha': alphas, 'l1_ratio': [0.3, 0.7]}, scoring='r2', cv=cv).fit(X, y)
+    assert params['alpha'] == pytest.approx(grid.best_params_['alpha'])
+    assert params['l1_ratio'] == grid.best_params_['l1_ratio']
+    ref = pd.DataFrame(grid.cv_results_).set_index(['param_alpha', 'param_l1_ratio'])['mean_test_score']
+    res = cv_results.set_index(['param_alpha', 'param_l1_ratio'])['mean_test_score']
+    assert np.allclose(res.loc[ref.index].values, ref.values, atol=1e-6)
+    assert np.allclose(model.coef_, grid.best_estimator_.coef_, atol=1e-6)
+
+
+def test_alpha_grid_as_elastic_net_cv():
+    X, y = get_data()
+    cv = KFold(n_splits=4)
+    alphas = get_alpha_grid(X, y, 0.5, 10)
+    assert np.count_nonzero(ElasticNet(alpha=alphas[0] * 1.001).fit(X, y).coef_) == 0
+    assert np.count_nonzero(ElasticNet(alpha=alphas[0] * 0.9).fit(X, y).coef_) > 0
+    ref = ElasticNetCV(alphas=alphas, cv=cv, tol=1e-10, max_iter=100000).fit(X, y)
+    _, params, _ = search_elastic_net(X, y, alphas, [0.5], cv, scoring='neg_mean_squared_error', max_iter=100000, tol=1e-10, n_jobs=2)
+    assert params['alpha'] == pytest.approx(ref.alpha_)
+
+
+def test_gram_reuse():
+    X, y = get_data()
+    folds = list(KFold(n_splits=3, shuffle=True, random_state=0).split(X))
+    alphas = np.logspace(-3, 0, 5)
+    _, scores_gram = path_cv_scores(X, y, folds, alphas, tol=1e-10, precompute=True)
+    _, scores = path_cv_scores(X, y, folds, alphas, tol=1e-10, precompute=False)
+    assert np.allclose(scores_gram, scores, atol=1e-8)
+
+
+def test_train_clock_repeated_and_save(tmp_path):
+    X, y = get_data()
+    outer_cv = RepeatedKFold(n_splits=3, n_repeats=1, random_state=1)
+    res = train_clock_repeated(X, y, outer_cv, np.logspace(-3, 0, 5), inner_cv=KFold(n_splits=3), n_jobs=2)
+    assert res['rmse'] == pytest.approx(res['splits']['val_RMSE'].min())
+    assert len(res['train_idx']) + len(res['val_idx']) == X.shape[0]
+    features = [f"f{i}" for i in range(X.shape[1])]
+    num_features = save_clock(res['model'], features, str(tmp_path))
+    clock = pd.read_excel(f"{tmp_path}/clock.xlsx")
+    assert list(clock.columns) == ['feature', 'coef']
+    assert clock.at[0, 'feature'] == 'Intercept'
+    assert num_features == clock.shape[0] - 1 == np.count_nonzero(res['model'].coef_)
+    assert (tmp_path / "clock.pkl").exists()
@@ -0,0 +1,70 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from scripts.python.routines.columnar import save_columnar
+from scripts.python.routines.cohort import CohortSource, assemble_cohort, get_variances
+
+
+def get_betas(subjects, cpgs, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.random((len(subjects), len(cpgs))), index=pd.Index(subjects, name='subject_id'), columns=cpgs)
+    return df
+
+
+def test_assemble_cohort(tmp_path):
+    betas_1 = get_betas([f"A{i}" for i in range(6)], [f"cg{i:02d}" for i in range(10)], 0)
+    betas_1.iloc[2, 3] = np.nan
+    betas_2 = get_betas([f"B{i}" for i in range(5)], [f"cg{i:02d}" for i in range(12)][::-1], 1)
+    betas_3 = get_betas([f"C{i}" for i in range(4)], [f"cg{i:02d}" for i in range(1, 11)], 2)
+    save_columnar(betas_1, f"{tmp_path}/1/betas")
+    betas_2.to_pickle(f"{tmp_path}/betas_2.pkl")
+    betas_3.T.rename_axis('ID_REF').to_csv(f"{tmp_path}/mvalsT_3.txt", sep="\t")
+
+    subjects_1 = ['A4', 'A0', 'A2', 'X0']
+    sources = {
+        'D1': CohortSource.from_betas(f"{tmp_path}/1", subjects_1),
+        'D2': CohortSource(f"{tmp_path}/betas_2.pkl"),
+        'D3': CohortSource(f"{tmp_path}/mvalsT_3.txt", index_col='ID_REF', chunk_size=3),
+    }
+    ref = pd.concat([betas_1.loc[subjects_1[:3]], betas_2, betas_3], axis=0, join='inner').astype('float32')
+    ref = ref.loc[:, ~ref.isna().any()]
+
+    for path in [None, f"{tmp_path}/cohort"]:
+        betas, datasets = assemble_cohort(sources, dropna=True, path=path, block_size=4)
+        if path is not None:
+            betas = betas.read()
+        assert list(betas.index) == list(ref.index)
+        assert list(betas.columns) == [f"cg{i:02d}" for i in range(1, 10) if i != 3]
+        assert np.array_equal(betas.values, ref.loc[:, betas.columns].values)
+        assert list(datasets.values) == ['D1'] * 3 + ['D2'] * 5 + ['D3'] * 4
+        assert np.allclose(get_variances(betas, 3).values, betas.values.var(axis=0))
+
+
+def test_pkl_sources_loaded_one_at_a_time(tmp_path, monkeypatch):
+    betas_1 = get_betas([f"A{i}" for i in range(4)], [f"cg{i:02d}" for i in range(8)], 0)
+    betas_1.iloc[1, 2] = np.nan
+    betas_2 = get_betas([f"B{i}" for i in range(3)], [f"cg{i:02d}" for i in range(2, 10)], 1)
+    betas_1.to_pickle(f"{tmp_path}/betas_1.pkl")
+    betas_2.to_pickle(f"{tmp_path}/betas_2.pkl")
+    sources = {
+        'D1': CohortSource(f"{tmp_path}/betas_1.pkl"),
+        'D2': CohortSource(f"{tmp_path}/betas_2.pkl"),
+    }
+
+    # every loaded frame is released before the next one is read
+    read_pickle = pd.read_pickle
+    loaded = []
+
+    def read_pickle_once(fn, *args, **kwargs):
+        assert all(frame() is None for frame in loaded)
+        df = read_pickle(fn, *args, **kwargs)
+        loaded.append(weakref.ref(df))
+        return df
+
+    monkeypatch.setattr(pd, "read_pickle", read_pickle_once)
+    betas, datasets = assemble_cohort(sources, dropna=True)
+    assert len(loaded) == 4
+    assert list(betas.columns) == [f"cg{i:02d}" for i in range(3, 8)]
+    assert np.array_equal(betas.values, pd.concat([betas_1, betas_2], join='inner').loc[:, betas.columns].values.astype('float32'))
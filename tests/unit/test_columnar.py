@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from scripts.python.routines.columnar import save_columnar, read_frame, is_columnar, get_frame_columns
+
+
+def get_frame(num_subjects=13, num_cpgs=7, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.Index([f"GSM{i:07d}" for i in range(num_subjects)], name='subject_id')
+    df = pd.DataFrame(rng.random((num_subjects, num_cpgs)), index=index, columns=[f"cg{i:08d}" for i in range(num_cpgs)])
+    df['Status'] = rng.integers(0, 2, num_subjects)
+    return df
+
+
+def test_columnar_roundtrip(tmp_path):
+    df = get_frame()
+    fn = f"{tmp_path}/data"
+    save_columnar(df, fn)
+    assert is_columnar(fn)
+    assert set(get_frame_columns(fn)) == set(df.columns)
+
+    res = read_frame(fn, columns=list(df.columns))
+    assert res.index.equals(df.index)
+    assert np.array_equal(res['Status'].values, df['Status'].values)
+    assert np.allclose(res.iloc[:, :-1].values, df.iloc[:, :-1].values.astype(np.float32))
+
+
+def test_columnar_selection(tmp_path):
+    df = get_frame()
+    fn = f"{tmp_path}/data"
+    save_columnar(df, fn)
+    columns = ['Status', 'cg00000005', 'cg00000001']
+    index = df.index[[7, 2, 11]]
+    res = read_frame(fn, columns=columns + ['cg99999999'], index=index, errors='ignore')
+    assert list(res.columns) == columns
+    assert list(res.index) == list(index)
+    assert np.allclose(res.loc[:, columns[1:]].values, df.loc[index, columns[1:]].values.astype(np.float32))
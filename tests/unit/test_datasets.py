@@ -0,0 +1,25 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from src.datamodules.datasets import FeaturesDataset
+
+
+def test_shared_features_dataset_keeps_one_copy():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.random((20, 4)), index=[f"s{i}" for i in range(20)], columns=[f"f{i}" for i in range(4)])
+    output = pd.DataFrame({'Age': rng.random(20)}, index=data.index)
+    dataset = FeaturesDataset(data, output, 'Age', shared=True)
+
+    # frame and tensor of the creating process are views of the shared segment
+    assert np.shares_memory(dataset.data.to_numpy(), dataset.X_shared.array)
+    assert np.shares_memory(dataset.X.numpy(), dataset.X_shared.array)
+    assert list(dataset.data.columns) == list(data.columns)
+    assert np.allclose(dataset.data.values, data.values)
+
+    clone = pickle.loads(pickle.dumps(dataset))
+    X, y, ids = clone[[3, 5]]
+    assert np.allclose(X.numpy(), data.values[[3, 5]])
+    assert list(clone.data.index) == list(data.index)
+    dataset.X_shared.release()
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.python.preprocessing.serialization.routines.download import download_gsms_values
+
+
+def get_tables(num_gsms=6, num_cpgs=9, seed=0):
+    rng = np.random.default_rng(seed)
+    cpgs = pd.Index([f"cg{i:08d}" for i in range(num_cpgs)], name='ID_REF')
+    tables = {}
+    for i in range(num_gsms):
+        table = pd.DataFrame({'VALUE': rng.random(num_cpgs), 'Detection Pval': rng.random(num_cpgs)}, index=cpgs)
+        # tables of different GSMs may list CpGs in different order
+        tables[f"GSM{i:07d}"] = table.iloc[rng.permutation(num_cpgs)]
+    return tables
+
+
+def test_download_values(tmp_path):
+    tables = get_tables()
+    betas, pvals = download_gsms_values(list(tables), str(tmp_path), 2, n_jobs=3, fetch_func=lambda gsm, destdir: tables[gsm])
+    for gsm, table in tables.items():
+        assert np.allclose(betas.loc[gsm, table.index].values, table['VALUE'].values.astype(np.float32))
+        assert np.allclose(pvals.loc[gsm, table.index].values, table['Detection Pval'].values.astype(np.float32))
+
+
+def test_download_retries_and_resume(tmp_path):
+    tables = get_tables()
+    gsms = list(tables)
+    calls = {gsm: 0 for gsm in gsms}
+
+    def flaky_fetch(gsm, destdir):
+        calls[gsm] += 1
+        if gsm == gsms[1] and calls[gsm] < 3:
+            raise ConnectionError("connection reset")
+        if gsm == gsms[2]:
+            raise ConnectionError("not available")
+        return tables[gsm]
+
+    with pytest.raises(RuntimeError, match=gsms[2]):
+        download_gsms_values(gsms, str(tmp_path), 1, n_jobs=2, max_retries=3, backoff=0.0, fetch_func=flaky_fetch)
+    assert calls[gsms[1]] == 3
+
+    def fetch(gsm, destdir):
+        calls[gsm] += 1
+        return tables[gsm]
+
+    betas = download_gsms_values(gsms, str(tmp_path), 1, n_jobs=2, fetch_func=fetch)[0]
+    # only the failed GSM is fetched again
+    assert calls[gsms[2]] == 4
+    assert all(calls[gsm] == 1 for gsm in gsms if gsm not in gsms[1:3])
+    assert not betas.isna().any().any()
+    assert np.allclose(betas.loc[gsms[2], tables[gsms[2]].index].values, tables[gsms[2]]['VALUE'].values.astype(np.float32))
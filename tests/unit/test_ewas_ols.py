@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+import statsmodels.formula.api as smf
+
+from scripts.python.EWAS.routines.ols import get_design, ols_mass, corr_mass
+
+
+@pytest.fixture
+def pheno_betas():
+    rng = np.random.default_rng(0)
+    n = 60
+    pheno = pd.DataFrame(
+        {'Age': rng.normal(50, 10, n), 'Status': rng.choice(['Control', 'ESRD', 'Case'], n)},
+        index=[f"s{i}" for i in range(n)]
+    )
+    pheno.loc['s3', 'Age'] = np.nan
+    betas = pd.DataFrame(rng.random((n, 7)), index=pheno.index, columns=[f"cg{i:08d}" for i in range(7)])
+    betas.iloc[5, 2] = np.nan
+    return pheno, betas
+
+
+@pytest.mark.parametrize("chunk_size", [3, 100])
+def test_ols_mass_matches_statsmodels(pheno_betas, chunk_size):
+    pheno, betas = pheno_betas
+    formula = "Age + C(Status)"
+    design = get_design(pheno, formula)
+    result = ols_mass(design, betas, chunk_size=chunk_size, anova=True, is_progress=False)
+
+    df = pd.merge(pheno, betas, left_index=True, right_index=True)
+    for cpg in betas.columns:
+        reg = smf.ols(formula=f"{cpg} ~ {formula}", data=df).fit()
+        assert np.isclose(reg.rsquared, result.at[cpg, 'R2'])
+        assert np.isclose(reg.rsquared_adj, result.at[cpg, 'R2_adj'])
+        for t in reg.params.index:
+            assert np.isclose(reg.params[t], result.at[cpg, f"{t}_coef"])
+            assert np.isclose(reg.tvalues[t], result.at[cpg, f"{t}_tvalue"])
+            assert np.isclose(reg.pvalues[t], result.at[cpg, f"{t}_pvalue"])
+        anova = sm.stats.anova_lm(reg, typ=2)
+        for t in ['Age', 'C(Status)']:
+            assert np.isclose(anova.at[t, 'F'], result.at[cpg, f"{t}_F"])
+            assert np.isclose(anova.at[t, 'PR(>F)'], result.at[cpg, f"{t}_pval"])
+
+
+@pytest.mark.parametrize("method", ['pearson', 'spearman'])
+def test_corr_mass_matches_scipy(pheno_betas, method):
+    from scipy.stats import pearsonr, spearmanr
+    pheno, betas = pheno_betas
+    betas = betas.drop(columns=betas.columns[2])
+    result = corr_mass(pheno['Age'], betas, method)
+    ids = pheno.index[pheno['Age'].notnull()]
+    func = pearsonr if method == 'pearson' else spearmanr
+    for cpg in betas.columns:
+        r, pval = func(pheno.loc[ids, 'Age'].values, betas.loc[ids, cpg].values)
+        assert np.isclose(r, result.at[cpg, f"{method}_r"])
+        assert np.isclose(pval, result.at[cpg, f"{method}_pval"])
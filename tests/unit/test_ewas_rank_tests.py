@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import kruskal, mannwhitneyu
+
+from scripts.python.EWAS.routines.rank_tests import mannwhitneyu_mass, kruskal_mass
+
+
+def get_groups(sizes, num_cpgs=11, seed=0):
+    rng = np.random.default_rng(seed)
+    groups = []
+    for g_id, size in enumerate(sizes):
+        # rounding produces ties
+        vals = np.round(rng.random((size, num_cpgs)) + 0.1 * g_id, 1)
+        groups.append(pd.DataFrame(vals, columns=[f"cg{i:08d}" for i in range(num_cpgs)]))
+    return groups
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_mannwhitneyu_mass_matches_scipy(n_jobs):
+    data_1, data_2 = get_groups([25, 31])
+    result = mannwhitneyu_mass(data_1, data_2, chunk_size=4, n_jobs=n_jobs)
+    for cpg in data_1.columns:
+        stat, pval = mannwhitneyu(data_1[cpg].values, data_2[cpg].values, alternative='two-sided', method='asymptotic')
+        assert np.isclose(stat, result.at[cpg, 'statistic'])
+        assert np.isclose(pval, result.at[cpg, 'pval'])
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_kruskal_mass_matches_scipy(n_jobs):
+    groups = get_groups([20, 14, 33])
+    result = kruskal_mass(groups, chunk_size=4, n_jobs=n_jobs)
+    for cpg in groups[0].columns:
+        stat, pval = kruskal(*[g[cpg].values for g in groups])
+        assert np.isclose(stat, result.at[cpg, 'statistic'])
+        assert np.isclose(pval, result.at[cpg, 'pval'])
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+shap = pytest.importorskip("shap")
+
+from experiment.explainers import batch_predict_func, kernel_shap_values, get_parts_shap_values, lime_explanations
+
+
+class LinearExplainer:
+    """
+    Exact SHAP values of linear model with zero background, stands in for KernelExplainer.
+    """
+    def __init__(self, coefs):
+        self.coefs = coefs
+        self.expected_value = [0.0]
+
+    def shap_values(self, X, nsamples="auto", silent=False):
+        return [X * self.coefs]
+
+
+class LinearLimeExplainer:
+    """
+    Stands in for LimeTabularExplainer: weights of linear model, perturbations scored in one predict_fn call.
+    """
+    def __init__(self, coefs):
+        self.coefs = coefs
+
+    def explain_instance(self, data_row, predict_fn, num_features=10):
+        perturbed = data_row[np.newaxis, :] + np.random.default_rng(0).standard_normal((50, len(data_row)))
+        predict_fn(perturbed)
+        explanation = type('Explanation', (), {})()
+        explanation.predicted_value = float(data_row @ self.coefs)
+        explanation.local_pred = [explanation.predicted_value]
+        weights = list(enumerate(self.coefs * data_row))[:num_features]
+        explanation.as_map = lambda: {1: weights}
+        return explanation
+
+
+def test_batch_predict_func():
+    calls = []
+
+    def predict(X):
+        calls.append(X.shape[0])
+        return X.sum(axis=1)
+
+    X = np.random.default_rng(0).random((25, 3))
+    res = batch_predict_func(predict, batch_size=10)(X)
+    assert calls == [10, 10, 5]
+    assert np.allclose(res, X.sum(axis=1))
+
+
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_kernel_shap_values(n_jobs):
+    rng = np.random.default_rng(0)
+    coefs = rng.random(4)
+    X = rng.random((17, 4))
+    res = kernel_shap_values(LinearExplainer(coefs), X, n_jobs=n_jobs)
+    assert np.allclose(res[0], X * coefs)
+
+
+def test_parts_shap_values_computed_once():
+    X = np.random.default_rng(0).random((12, 3))
+    calls = []
+
+    def calc(ids):
+        calls.append(ids)
+        return X[ids] * 2
+
+    parts_ids = {'trn': np.array([5, 1, 7]), 'val': np.array([0, 3]), 'tst': None, 'all': np.arange(12)}
+    res = get_parts_shap_values(calc, parts_ids)
+    assert len(calls) == 1 and len(calls[0]) == 12
+    assert 'tst' not in res
+    for part in ['trn', 'val', 'all']:
+        assert np.allclose(res[part], X[parts_ids[part]] * 2)
+
+
+def test_raw_to_prob_shap_values():
+    from experiment.explainers import raw_to_prob_shap_values
+    rng = np.random.default_rng(0)
+    num_classes, num_subjects, num_features = 3, 20, 6
+    shap_values = [rng.standard_normal((num_subjects, num_features)) for _ in range(num_classes)]
+    expected_value = rng.standard_normal(num_classes)
+    raw = expected_value[np.newaxis, :] + np.stack([v.sum(axis=1) for v in shap_values], axis=1)
+    prob = np.exp(raw) / np.exp(raw).sum(axis=1, keepdims=True)
+    base_prob = prob.mean(axis=0)
+    raw[0, 1] += 0.1
+
+    shap_values_prob, report = raw_to_prob_shap_values(shap_values, expected_value, base_prob, raw, prob, ['a', 'b', 'c'])
+    for class_id in range(num_classes):
+        assert np.allclose(shap_values_prob[class_id].sum(axis=1), prob[:, class_id] - base_prob[class_id])
+        assert np.allclose(shap_values_prob[class_id] / shap_values[class_id], (shap_values_prob[class_id] / shap_values[class_id])[:, [0]])
+    assert list(report['raw_num_above_tol']) == [0, 1, 0]
+    assert report['prob_num_above_tol'].sum() == 0
+    assert report['contrib_num_above_tol'].sum() == 0
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_lime_explanations(n_jobs):
+    rng = np.random.default_rng(0)
+    coefs = rng.random(4)
+    X = rng.random((9, 4))
+    res = lime_explanations(LinearLimeExplainer(coefs), lambda x: x @ coefs, X, n_jobs=n_jobs, num_features=3)
+    assert len(res) == 9
+    for row, explanation in zip(X, res):
+        assert np.isclose(explanation['predicted_value'], row @ coefs)
+        assert [feat_id for feat_id, _ in explanation['map'][1]] == [0, 1, 2]
+
+
+def get_lightgbm_predict_func():
+    lgb = pytest.importorskip("lightgbm")
+    rng = np.random.default_rng(0)
+    X = rng.random((200, 4))
+    y = X[:, 0] * 2 + X[:, 1] + 0.1 * rng.random(200)
+    model = lgb.train({'objective': 'regression', 'verbose': -1, 'num_threads': 2}, lgb.Dataset(X, label=y), num_boost_round=20)
+
+    # closure over the booster, OpenMP runtime of lightgbm is already used in this process
+    def predict_func(X):
+        return model.predict(X)
+    predict_func(X)
+    return predict_func, X
+
+
+def test_kernel_shap_values_lightgbm():
+    predict_func, X = get_lightgbm_predict_func()
+    explainer = shap.KernelExplainer(predict_func, X[:10])
+    res_serial = kernel_shap_values(explainer, X[:8], n_jobs=1)
+    res = kernel_shap_values(explainer, X[:8], n_jobs=2)
+    assert np.allclose(res, res_serial)
+    assert np.allclose(res.sum(axis=1) + explainer.expected_value, predict_func(X[:8]))
+
+
+def test_lime_explanations_lightgbm():
+    lime_tabular = pytest.importorskip("lime.lime_tabular")
+    predict_func, X = get_lightgbm_predict_func()
+    explainer = lime_tabular.LimeTabularExplainer(X, mode='regression', random_state=0)
+    res = lime_explanations(explainer, predict_func, X[:6], n_jobs=2, num_features=2)
+    assert len(res) == 6
+    for row, explanation in zip(X[:6], res):
+        assert np.isclose(explanation['predicted_value'], predict_func(row[np.newaxis, :])[0])
+        assert len(explanation['map'][1]) == 2
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from scripts.python.preprocessing.serialization.routines.filter import betas_pvals_filter, betas_pvals_filter_chunks, manifest_filter, iter_npy_chunks
+
+
+def get_data(num_subjects=50, num_cpgs=30, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.Index([f"GSM{i:07d}" for i in range(num_subjects)], name='subject_id')
+    columns = [f"cg{i:08d}" for i in range(num_cpgs)]
+    betas = pd.DataFrame(rng.random((num_subjects, num_cpgs)), index=index, columns=columns)
+    pvals = pd.DataFrame(rng.random((num_subjects, num_cpgs)) * 0.005, index=index, columns=columns)
+    pvals.iloc[:10, :5] = 0.5
+    pvals.iloc[:3, 5:10] = 0.5
+    return betas, pvals
+
+
+def test_betas_pvals_filter():
+    betas, pvals = get_data()
+    res = betas_pvals_filter(betas, pvals, 0.01, 0.1)
+    assert list(res.columns) == list(betas.columns[5:])
+
+
+def test_manifest_filter():
+    betas, _ = get_data()
+    manifest = pd.DataFrame(index=betas.columns[::-2].append(pd.Index(['cg99999999'])))
+    res = manifest_filter(betas, manifest)
+    assert list(res.columns) == list(betas.columns[1::2])
+
+
+def test_filter_chunks(tmp_path):
+    betas, pvals = get_data()
+    np.save(f"{tmp_path}/betas.npy", betas.values)
+    np.save(f"{tmp_path}/pvals.npy", pvals.values)
+    manifest = pd.DataFrame(index=betas.columns[:-2])
+    forbidden_cpgs = [betas.columns[7]]
+    chunks = betas_pvals_filter_chunks(
+        iter_npy_chunks(f"{tmp_path}/betas.npy", betas.index, betas.columns, chunk_size=7),
+        iter_npy_chunks(f"{tmp_path}/pvals.npy", pvals.index, pvals.columns, chunk_size=7),
+        0.01, 0.1, manifest, forbidden_cpgs
+    )
+    res = pd.concat(list(chunks))
+    expected = manifest_filter(betas_pvals_filter(betas, pvals, 0.01, 0.1), manifest).drop(columns=forbidden_cpgs)
+    assert res.index.equals(betas.index)
+    assert list(res.columns) == list(expected.columns)
+    assert np.allclose(res.values, expected.values)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+lgb = pytest.importorskip("lightgbm")
+xgb = pytest.importorskip("xgboost")
+
+from experiment import fold_data
+from experiment.fold_data import lightgbm_fold_datasets, xgboost_fold_dmatrices, release_fold_data
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.random((120, 5)).astype('float32')
+    y = 2 * X[:, 0] + X[:, 1] + 0.01 * rng.random(120)
+    ids_tst = np.arange(100, 120)
+    folds = [(np.arange(0, 80), np.arange(80, 100)), (np.arange(20, 100), np.arange(0, 20))]
+    return X, y, [f"f{i}" for i in range(5)], ids_tst, folds
+
+
+def test_lightgbm_fold_datasets(data):
+    X, y, feature_names, ids_tst, folds = data
+    params = {'objective': 'regression', 'verbose': -1, 'num_threads': 1, 'min_data_in_leaf': 5}
+    for ids_trn, ids_val in folds:
+        ds_trn, ds_val = lightgbm_fold_datasets("key", X, y, feature_names, params, ids_trn, ids_val, ids_tst)
+        model = lgb.train(params, ds_trn, num_boost_round=20, valid_sets=[ds_val], valid_names=['val'])
+        assert ds_trn.num_data() == len(ids_trn)
+        assert np.allclose(ds_val.get_label(), y[ids_val])
+        assert np.mean((model.predict(X[ids_val]) - y[ids_val]) ** 2) < np.var(y[ids_val])
+    # binned once for all folds
+    dataset = fold_data._cache['lightgbm'][2]
+    lightgbm_fold_datasets("key", X, y, feature_names, params, *folds[0], ids_tst)
+    assert fold_data._cache['lightgbm'][2] is dataset
+    release_fold_data("key")
+    assert 'lightgbm' not in fold_data._cache
+
+
+def test_xgboost_fold_dmatrices(data):
+    X, y, feature_names, ids_tst, folds = data
+    params = {'objective': 'reg:squarederror', 'max_depth': 3, 'nthread': 1}
+    for ids_trn, ids_val in folds:
+        dmat_trn, dmat_val, dmat_tst = xgboost_fold_dmatrices("key", X, y, feature_names, params, ids_trn, ids_val, ids_tst)
+        assert isinstance(dmat_trn, xgb.QuantileDMatrix)
+        assert dmat_trn.num_row() == len(ids_trn)
+        assert np.allclose(dmat_val.get_label(), y[ids_val])
+        assert np.allclose(dmat_tst.get_label(), y[ids_tst])
+        assert dmat_trn.feature_names == feature_names
+        model = xgb.train(params, dmat_trn, num_boost_round=10, evals=[(dmat_trn, "train"), (dmat_val, "val")], verbose_eval=False)
+        # bins of evaluation sets are cuts of the train matrix
+        assert np.allclose(model.predict(dmat_tst), model.predict(xgb.DMatrix(X[ids_tst], feature_names=feature_names)))
+    # quantiles are sketched once for all folds
+    ref = fold_data._cache['xgboost_quantile'][2]
+    xgboost_fold_dmatrices("key", X, y, feature_names, params, *folds[0], ids_tst)
+    assert fold_data._cache['xgboost_quantile'][2] is ref
+    release_fold_data()
+    assert len(fold_data._cache) == 0
+
+
+def test_xgboost_fold_dmatrices_gblinear(data):
+    X, y, feature_names, ids_tst, folds = data
+    params = {'booster': 'gblinear', 'objective': 'reg:squarederror', 'nthread': 1}
+    ids_trn, ids_val = folds[1]
+    dmat_trn, dmat_val, dmat_tst = xgboost_fold_dmatrices("key", X, y, feature_names, params, ids_trn, ids_val, ids_tst)
+    assert not isinstance(dmat_trn, xgb.QuantileDMatrix)
+    assert dmat_trn.num_row() == len(ids_trn)
+    assert np.allclose(dmat_val.get_label(), y[ids_val])
+    xgb.train(params, dmat_trn, num_boost_round=3, evals=[(dmat_val, "val")], verbose_eval=False)
+    release_fold_data()
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from experiment.fold_registry import FoldRegistry
+
+
+def test_fold_registry(tmp_path):
+    df = pd.DataFrame({'Age': np.arange(6, dtype=float)}, index=[f"s{i}" for i in range(6)])
+    ids_tst = np.array([5])
+    registry = FoldRegistry(df.index, ["pred", "pred_prob_0"], dtypes={"pred": "int64"})
+    registry.add_fold(0, np.array([0, 1, 2]), np.array([3, 4]), ids_tst)
+    registry.add_fold(1, np.array([2, 3, 4]), np.array([0]), ids_tst)
+    registry.set_predictions(1, np.array([2, 3, 4]), [[1, 0.2], [0, 0.9], [1, 0.1]])
+    registry.set_predictions(1, ids_tst, [[1, 0.3]])
+
+    cv_ids = registry.get_cv_ids()
+    assert list(cv_ids.columns) == ["fold_0000", "fold_0001"]
+    assert list(cv_ids["fold_0000"]) == ["train"] * 3 + ["val"] * 2 + ["test"]
+    assert pd.isna(cv_ids.at["s1", "fold_0001"])
+
+    predictions = registry.get_fold_table(1, df, ["Age"])
+    assert list(predictions.columns) == ["fold_0001", "Age", "pred", "pred_prob_0"]
+    assert list(predictions["pred"]) == [0, 0, 1, 0, 1, 1]
+    assert np.isclose(predictions.at["s3", "pred_prob_0"], 0.9)
+    assert pd.isna(predictions.at["s0", "pred_prob_0"])
+    predictions.to_excel(tmp_path / "predictions.xlsx", index=True)
+    saved = pd.read_excel(tmp_path / "predictions.xlsx", index_col=0)
+    assert list(saved["fold_0001"].fillna("")) == ["val", "", "train", "train", "train", "test"]
+
+    registry.assign_predictions(df, 1)
+    assert df["pred"].dtype == np.int64
+    assert df["pred_prob_0"].dtype == np.float32
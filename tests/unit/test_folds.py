@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+
+from experiment.folds import run_folds, get_fold_threads, share_matrix
+
+
+def fit_fold(fold_idx, X, y, ids, num_threads=1):
+    X = np.asarray(X)
+    coef, *_ = np.linalg.lstsq(X[ids], y[ids], rcond=None)
+    return fold_idx, coef, num_threads
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_run_folds_keeps_order(n_jobs):
+    rng = np.random.default_rng(0)
+    X_all = rng.random((50, 3))
+    y_all = rng.random(50)
+    X = share_matrix(X_all, n_jobs)
+    tasks = [{'fold_idx': fold_idx, 'X': X, 'y': y_all, 'ids': rng.choice(50, 20, replace=False)} for fold_idx in range(7)]
+    results = list(run_folds(fit_fold, tasks, n_jobs=n_jobs))
+    assert [r[0] for r in results] == list(range(7))
+    for task, (_, coef, num_threads) in zip(tasks, results):
+        ids = task['ids']
+        assert np.allclose(coef, np.linalg.lstsq(X_all[ids], y_all[ids], rcond=None)[0])
+        assert num_threads == get_fold_threads(n_jobs)
+
+
+def get_pid(fold_idx, num_threads=1):
+    return os.getpid()
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_run_folds_workers_exit():
+    # cached fold data of workers is released with them
+    pids = list(run_folds(get_pid, [{'fold_idx': fold_idx} for fold_idx in range(4)], n_jobs=2))
+    assert os.getpid() not in pids
+    assert not any(is_alive(pid) for pid in pids)
+    # interrupted fold loop (pruned trial)
+    fold_results = run_folds(get_pid, [{'fold_idx': fold_idx} for fold_idx in range(4)], n_jobs=2)
+    pid = next(fold_results)
+    fold_results.close()
+    assert not is_alive(pid)
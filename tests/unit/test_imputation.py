@@ -0,0 +1,67 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.datamodules.imputation import FeaturesImputer, ImputerCache, get_fingerprint
+
+
+def get_data(num_subjects=60, num_features=40, seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.random((num_subjects, 5))
+    X = base[:, np.arange(num_features) % 5] + 0.01 * rng.standard_normal((num_subjects, num_features))
+    return pd.DataFrame(X, columns=[f"cg{i:08d}" for i in range(num_features)])
+
+
+@pytest.mark.parametrize("method", ["median", "mean"])
+def test_statistics_imputation(method):
+    trn = get_data()
+    tst = get_data(seed=1).drop(columns=trn.columns[:10])
+    tst.iloc[0, 0] = np.nan
+    res = FeaturesImputer(method).fit(trn).transform(tst)
+    assert list(res.columns) == list(trn.columns)
+    expected = getattr(trn.iloc[:, :10], method)().values
+    assert np.allclose(res.iloc[:, :10].values, expected[np.newaxis, :], atol=1e-6)
+    assert np.isnan(res.iloc[0, 10])
+    res = FeaturesImputer(method).fit(trn).transform(tst, fill_nan=True)
+    assert np.isclose(res.iloc[0, 10], getattr(trn.iloc[:, 10], method)(), atol=1e-6)
+
+
+def test_knn_imputation_uses_correlated_features():
+    trn = get_data()
+    tst_full = get_data(seed=1)
+    missed = list(trn.columns[:10])
+    res = FeaturesImputer("knn", k=3).fit(trn).transform(tst_full, missed=missed)
+    assert not res.isna().any().any()
+    assert np.allclose(res.iloc[:, 10:].values, tst_full.iloc[:, 10:].values.astype(np.float32))
+    knn_err = np.abs(res.loc[:, missed].values - tst_full.loc[:, missed].values).mean()
+    mean_err = np.abs(trn.loc[:, missed].mean().values - tst_full.loc[:, missed].values).mean()
+    assert knn_err < 0.2 * mean_err
+
+
+def test_unsupported_method():
+    with pytest.raises(ValueError):
+        FeaturesImputer("mice")
+
+
+def test_imputer_cache_lru(tmp_path):
+    trn = get_data()
+    key = get_fingerprint(trn, "median", 1)
+    assert key == get_fingerprint(trn.copy(), "median", 1)
+    assert key != get_fingerprint(trn, "mean", 1)
+
+    cache = ImputerCache(str(tmp_path), max_size_gb=1.0)
+    assert cache.load(key) is None
+    cache.save(key, FeaturesImputer("median").fit(trn))
+    assert np.allclose(cache.load(key).stats, trn.median().values)
+
+    entry_size = os.path.getsize(cache.get_fn(key))
+    cache.max_size = int(2.5 * entry_size)
+    keys = [get_fingerprint(trn, "median", k) for k in range(2, 4)]
+    for k in keys:
+        time.sleep(0.01)
+        cache.save(k, FeaturesImputer("median").fit(trn))
+    # the oldest entry is evicted first
+    assert not os.path.isfile(cache.get_fn(key))
+    assert all(os.path.isfile(cache.get_fn(k)) for k in keys)
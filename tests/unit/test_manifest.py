@@ -0,0 +1,39 @@
+import pandas as pd
+
+from scripts.python.routines.manifest import ManifestIndex, get_manifest, get_manifest_index
+
+
+def get_manifest_frame():
+    manifest = pd.DataFrame(
+        {
+            'Gene': ['A;B', 'B', 'non-genic', 'C;A', 'B;C'],
+            'UCSC_RefGene_Group': ['Body;TSS200', 'Body', 'non-genic', 'TSS1500', 'Body'],
+            'CHR': [1, 1, 2, 2, 'X'],
+        },
+        index=pd.Index([f"cg{i:08d}" for i in range(5)], name='CpG')
+    )
+    return manifest
+
+
+def test_manifest_index():
+    manifest = get_manifest_frame()
+    index = ManifestIndex(manifest)
+    assert list(index.get_cpgs('A')) == ['cg00000000', 'cg00000003']
+    assert list(index.get_cpgs(['B', 'missed'])) == ['cg00000000', 'cg00000001', 'cg00000004']
+    assert len(index.get_cpgs(['missed'])) == 0
+    assert list(index.get_cpgs('Body', col='UCSC_RefGene_Group')) == ['cg00000000', 'cg00000001', 'cg00000004']
+    assert list(index.get_cpgs([2], col='CHR')) == ['cg00000002', 'cg00000003']
+    assert set(index.get_values('Gene')) == {'A', 'B', 'C', 'non-genic'}
+
+    annotation = index.annotate(['cg00000003', 'cg99999999', 'cg00000001'], ['Gene', 'CHR'])
+    assert list(annotation['Gene'].values[[0, 2]]) == ['C;A', 'B']
+    assert pd.isna(annotation.iloc[1, 0])
+
+
+def test_manifest_memoized(tmp_path):
+    path = tmp_path / "GPL00000" / "manifest"
+    path.mkdir(parents=True)
+    get_manifest_frame().to_pickle(f"{path}/manifest.pkl")
+    manifest = get_manifest("GPL00000", str(tmp_path))
+    assert get_manifest("GPL00000", str(tmp_path)) is manifest
+    assert get_manifest_index("GPL00000", str(tmp_path)).manifest is manifest
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from omegaconf import OmegaConf
+
+from experiment.n_feats import get_n_feats, sweep_n_feats
+
+
+def fit_fold(config, feature_names, fold_idx, X, y, ids_trn, ids_val, ids_tst=None, data_key=None, num_threads=1):
+    X = np.asarray(X)
+    assert X.shape[1] == len(feature_names)
+    assert X.flags['F_CONTIGUOUS']
+    coef, *_ = np.linalg.lstsq(X[ids_trn], y[ids_trn], rcond=None)
+    return {'y_trn_pred': X[ids_trn] @ coef, 'y_val_pred': X[ids_val] @ coef}
+
+
+def test_get_n_feats():
+    config = OmegaConf.create({'n_feats': {'start': 10, 'stop': 100, 'num': 10}})
+    assert get_n_feats(config, 1000) == list(range(10, 101, 10))
+    config = OmegaConf.create({'n_feats': [30, 10, 10, 500]})
+    assert get_n_feats(config, 100) == [10, 30]
+
+
+def test_sweep_n_feats(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    X = rng.random((60, 8))
+    y = X[:, 0] + X[:, 1] + 0.01 * rng.random(60)
+    folds = list(enumerate([(np.arange(0, 40), np.arange(40, 60)), (np.arange(20, 60), np.arange(0, 20))]))
+    config = OmegaConf.create({'n_feats': [1, 2, 8], 'optimized_metric': 'mse', 'direction': 'min'})
+
+    def eval_fold(fold_res, ids_trn, ids_val):
+        return {
+            part: pd.DataFrame({part: [np.mean((y[ids] - fold_res[f'y_{key}_pred']) ** 2)]}, index=['mse'])
+            for part, key, ids in [('train', 'trn', ids_trn), ('val', 'val', ids_val)]
+        }
+
+    res = sweep_n_feats(config, fit_fold, eval_fold, X, y, [f"f{i}" for i in range(8)], folds)
+    assert list(res.index) == [1, 2, 8]
+    assert res.at[2, 'mse_val'] < 0.001 < res.at[1, 'mse_val']
+    assert np.isclose(res.at[2, 'optimized_metric'], res.at[2, 'mse_val'])
+    assert res.at[2, 'mse_cv_mean_val'] >= res.at[2, 'mse_val']
+    saved = pd.read_excel("n_feats.xlsx", index_col="n_feat")
+    assert np.allclose(saved['mse_val'].values, res['mse_val'].values)
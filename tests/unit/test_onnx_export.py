@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("pytorch_lightning")
+
+from src.inference.onnx import export_model, ExportedModel
+
+
+model_types = ["tabnet", "node", "tab_transformer"]
+num_cat = 2
+
+
+def get_model(model_type, task, input_dim=7, output_dim=3):
+    torch.manual_seed(0)
+    output_dim = output_dim if task == "classification" else 1
+    if model_type == "tabnet":
+        pytest.importorskip("pytorch_tabnet")
+        from src.models.tabnet.model import TabNetModel
+        model = TabNetModel(task=task, loss_type="MSE", input_dim=input_dim, output_dim=output_dim)
+    elif model_type == "node":
+        from src.models.node.model import NodeModel
+        model = NodeModel(task=task, loss_type="MSE", input_dim=input_dim, output_dim=output_dim, num_trees=16, num_layers=2, depth=3)
+    else:
+        pytest.importorskip("einops")
+        from src.models.tab_transformer.model import TabTransformerModel
+        model = TabTransformerModel(
+            task=task,
+            loss_type="MSE",
+            input_dim=input_dim,
+            output_dim=output_dim,
+            categories=[3] * num_cat,
+            num_continuous=input_dim - num_cat,
+            dim=8,
+            depth=2,
+            heads=2,
+            dim_head=4,
+        )
+        model.ids_cat = list(range(num_cat))
+        model.ids_con = list(range(num_cat, input_dim))
+    model.eval()
+    return model
+
+
+def get_X(model_type, num_rows, seed, input_dim=7):
+    rng = np.random.default_rng(seed)
+    X = rng.random((num_rows, input_dim)).astype(np.float32)
+    if model_type == "tab_transformer":
+        X[:, :num_cat] = rng.integers(0, 3, (num_rows, num_cat))
+    return X
+
+
+def lightning_outputs(model, X):
+    with torch.no_grad():
+        model.produce_probabilities = False
+        # NODE layers are initialized by the first batch
+        raw = model(torch.from_numpy(X)).numpy()
+        model.produce_probabilities = True
+        prob = model(torch.from_numpy(X)).numpy()
+        model.produce_probabilities = False
+    return raw, prob
+
+
+@pytest.mark.parametrize("model_type", model_types)
+@pytest.mark.parametrize("runtime", ["torchscript", "onnx"])
+def test_export_parity(tmp_path, runtime, model_type):
+    if runtime == "onnx":
+        pytest.importorskip("onnxruntime")
+    model = get_model(model_type, "classification")
+    X = get_X(model_type, 301, 0)
+    raw, prob = lightning_outputs(model, X)
+    fn = export_model(model, f"{tmp_path}/model.{'onnx' if runtime == 'onnx' else 'pt'}", 7, "classification", runtime)
+    assert not model._jit_is_scripting
+    # batch size differs from the traced one
+    raw_exp, prob_exp = ExportedModel(fn, "classification", num_threads=1).predict(X)
+    assert np.allclose(raw_exp, raw, atol=1e-4)
+    assert np.allclose(prob_exp, prob, atol=1e-5)
+
+
+@pytest.mark.parametrize("model_type", model_types)
+def test_export_regression_quantized(tmp_path, model_type):
+    model = get_model(model_type, "regression")
+    X = get_X(model_type, 64, 1)
+    raw = lightning_outputs(model, X)[0]
+    fn = export_model(model, f"{tmp_path}/model_int8.pt", 7, "regression", "torchscript", quantize=True)
+    raw_exp, prob_exp = ExportedModel(fn, "regression").predict(X)
+    assert prob_exp is None
+    assert raw_exp.shape == raw.shape
+    assert np.allclose(raw_exp, raw, atol=0.1 * np.abs(raw).max() + 1e-3)
@@ -0,0 +1,94 @@
+import os
+import pickle
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+optuna = pytest.importorskip("optuna")
+pytest.importorskip("hydra_plugins.hydra_optuna_sweeper")
+
+from experiment.pruning import TrialReporter, get_xgboost_mode
+
+
+repo_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def test_reporter_prunes_worse_trial(tmp_path):
+    storage = f"sqlite:///{tmp_path}/study.db"
+    study = optuna.create_study(study_name="test", storage=storage, direction="maximize")
+    pruner = {"_target_": "optuna.pruners.MedianPruner", "n_startup_trials": 2, "n_warmup_steps": 0}
+    for number in range(3):
+        trial = study.ask()
+        reporter = TrialReporter(trial.number, "test", storage, pruner, steps_per_fold=11)
+        for epoch in range(10):
+            reporter.report_epoch(0, epoch, 1.0 / (epoch + 1), "min")
+        reporter.report_fold(0, 0.9, "max")
+        study.tell(trial, 0.9)
+
+    trial = study.ask()
+    reporter = pickle.loads(pickle.dumps(TrialReporter(trial.number, "test", storage, pruner, steps_per_fold=11)))
+    with pytest.raises(optuna.TrialPruned):
+        reporter.report_epoch(0, 0, 10.0, "min")
+    # losses are negated for maximized studies
+    study = optuna.load_study(study_name="test", storage=storage)
+    assert study.trials[0].intermediate_values[0] == -1.0
+    assert study.trials[0].intermediate_values[10] == 0.9
+
+
+def test_xgboost_mode():
+    assert [get_xgboost_mode(metric) for metric in ["auc", "aucpr", "ndcg@5", "map@3-", "logloss", "mae", "merror"]] == ["max"] * 4 + ["min"] * 3
+
+
+app = """
+import hydra
+import optuna
+from omegaconf import DictConfig
+
+
+@hydra.main(config_path=None, config_name=None)
+def main(config: DictConfig):
+    if config.x < 0:
+        raise optuna.TrialPruned()
+    return config.x
+
+
+if __name__ == "__main__":
+    main()
+"""
+
+
+def run_sweep(tmp_path, n_trials):
+    cmd = [
+        sys.executable, "app.py", "--multirun",
+        "hydra/sweeper=pruning_optuna",
+        f"hydra.sweeper.storage=sqlite:///{tmp_path}/optuna/study.db",
+        "hydra.sweeper.study_name=test",
+        "hydra.sweeper.direction=maximize",
+        f"hydra.sweeper.n_trials={n_trials}",
+        "hydra.sweeper.n_jobs=2",
+        "hydra.sweeper.sampler.seed=1",
+        f"hydra.sweep.dir={tmp_path}/multirun",
+        "+x=interval(-1,1)",
+    ]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([repo_dir, os.environ.get("PYTHONPATH", "")]))
+    subprocess.run(cmd, cwd=tmp_path, env=env, check=True, capture_output=True)
+
+
+def test_sweeper_resumes_study(tmp_path):
+    (tmp_path / "app.py").write_text(textwrap.dedent(app))
+    run_sweep(tmp_path, 3)
+    study = optuna.load_study(study_name="test", storage=f"sqlite:///{tmp_path}/optuna/study.db")
+    assert len(study.trials) == 3
+    states = {trial.state for trial in study.trials}
+    assert states <= {optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED}
+    for trial in study.trials:
+        is_pruned = trial.state == optuna.trial.TrialState.PRUNED
+        assert is_pruned == (trial.params["+x"] < 0)
+
+    # finished trials count towards n_trials of the next run
+    run_sweep(tmp_path, 5)
+    study = optuna.load_study(study_name="test", storage=f"sqlite:///{tmp_path}/optuna/study.db")
+    assert len(study.trials) == 5
+    assert (tmp_path / "multirun" / "optimization_results.yaml").exists()
@@ -0,0 +1,131 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+from omegaconf import OmegaConf
+
+pytest.importorskip("pytorch_lightning")
+pytest.importorskip("torchmetrics")
+pytest.importorskip("xgboost")
+pytest.importorskip("shap")
+pytest.importorskip("lime")
+pytest.importorskip("wandb")
+
+from scripts.python.routines.plot.save import set_figure_rendering
+
+
+class TableDataModule:
+    """
+    Datamodule interface used by process() of sa pipelines: 80 train/validation rows and 20 test rows.
+    """
+
+    def __init__(self, task, seed=1):
+        rng = np.random.default_rng(seed)
+        self.task = task
+        self.split_feature = None
+        self.feature_names = [f"cg{i:08d}" for i in range(6)]
+        X = rng.random((100, len(self.feature_names))).astype('float32')
+        if task == "regression":
+            outcome = 20 + 60 * X[:, 0] + 5 * rng.random(100)
+            self.class_names = []
+        else:
+            self.class_names = ["Control", "Case"] if task == "binary" else ["Control", "Case", "Other"]
+            outcome = np.minimum((X[:, 0] * len(self.class_names)).astype(int), len(self.class_names) - 1)
+        self.df = pd.DataFrame(X, columns=self.feature_names, index=[f"s{i}" for i in range(100)])
+        self.df.insert(0, "Status", outcome)
+        self.ids_trn_val = np.arange(80)
+        self.ids_tst = np.arange(80, 100)
+
+    def perform_split(self):
+        self.ids_trn, self.ids_val = self.ids_trn_val[:64], self.ids_trn_val[64:]
+
+    def setup(self, stage=None):
+        pass
+
+    def refresh_datasets(self):
+        pass
+
+    def plot_split(self, suffix=''):
+        pass
+
+    def get_trn_val_y(self):
+        return self.df["Status"].values[self.ids_trn_val]
+
+    def get_feature_names(self):
+        return list(self.feature_names)
+
+    def get_outcome_name(self):
+        return "Status"
+
+    def get_class_names(self):
+        return list(self.class_names)
+
+    def get_df(self):
+        return self.df
+
+
+@pytest.mark.parametrize("task", ["regression", "multiclass", "binary"])
+def test_process_with_test_part(tmp_path, monkeypatch, task):
+    monkeypatch.chdir(tmp_path)
+    set_figure_rendering([])
+    sa = importlib.import_module(f"experiment.{task}.trn_val_tst.sa")
+    objective = {"regression": "reg:squarederror", "multiclass": "multi:softprob", "binary": "binary:logistic"}[task]
+    config = OmegaConf.create({
+        "seed": 1,
+        "project_name": "test",
+        "logger": {},
+        "model_type": "xgboost",
+        "out_dim": 1 if task == "regression" else (2 if task == "binary" else 3),
+        "cv_is_split": True,
+        "cv_n_splits": 2,
+        "cv_n_repeats": 1,
+        "optimized_metric": "mean_absolute_error" if task == "regression" else "accuracy_weighted",
+        "optimized_part": "val",
+        "optimized_mean": "cv_mean_val_test",
+        "direction": "min" if task == "regression" else "max",
+        "max_epochs": 5,
+        "patience": 5,
+        "num_top_features": 3,
+        "num_examples": 1,
+        "is_shap": False,
+        "is_lime": False,
+        "datamodule": {
+            "_target_": "tests.unit.test_sa_pipelines.TableDataModule",
+            "task": task,
+        },
+        "xgboost": {
+            "booster": "gbtree",
+            "learning_rate": 0.1,
+            "max_depth": 3,
+            "gamma": 0,
+            "sampling_method": "uniform",
+            "subsample": 1,
+            "objective": objective,
+            "verbosity": 0,
+            "eval_metric": "mae" if task == "regression" else ("logloss" if task == "binary" else "mlogloss"),
+        },
+    })
+    if task == "multiclass":
+        config.xgboost.output_dim = 3
+    if task == "binary":
+        # binary pipeline always logs to wandb
+        monkeypatch.setenv("WANDB_MODE", "disabled")
+        config.logger = {"wandb": {"_target_": "pytorch_lightning.loggers.wandb.WandbLogger", "project": "test", "save_dir": str(tmp_path)}}
+
+    sa.process(config)
+
+    cv_ids = pd.read_excel("cv_ids.xlsx", index_col=0)
+    test_label = "Test" if task == "binary" else "test"
+    for col in cv_ids.columns:
+        assert list(cv_ids[col].values[80:]) == [test_label] * 20
+    # test part of every fold is evaluated, and of the best fold saved
+    assert len(list(tmp_path.glob("metrics_test_best_*.xlsx"))) == 1
+
+
+@pytest.mark.parametrize("options", [{"is_shuffle": False}, {"cv_groups": "Sex"}])
+def test_binary_rejects_unsupported_split_options(options):
+    sa = importlib.import_module("experiment.binary.trn_val_tst.sa")
+    config = OmegaConf.create({"seed": 1, "project_name": "test", "logger": {}, "is_shuffle": True, **options})
+    with pytest.raises(ValueError):
+        sa.process(config)
@@ -0,0 +1,51 @@
+import os
+import pytest
+
+go = pytest.importorskip("plotly.graph_objects")
+
+from scripts.python.routines.plot.save import save_figure, set_figure_rendering, wait_figures
+
+
+def get_figure():
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=[0, 1, 2], y=[2, 0, 1]))
+    return fig
+
+
+def test_skip_figures(tmp_path):
+    set_figure_rendering([])
+    try:
+        save_figure(get_figure(), f"{tmp_path}/fig")
+        assert len(os.listdir(tmp_path)) == 0
+    finally:
+        set_figure_rendering()
+
+
+def test_unsupported_format():
+    with pytest.raises(ValueError):
+        set_figure_rendering(['bmp'])
+
+
+def test_background_rendering(tmp_path):
+    pytest.importorskip("kaleido")
+    set_figure_rendering(['png'], n_jobs=2, batch_size=2)
+    try:
+        for fig_id in range(5):
+            save_figure(get_figure(), f"{tmp_path}/fig_{fig_id}")
+        wait_figures()
+        assert sorted(os.listdir(tmp_path)) == [f"fig_{fig_id}.png" for fig_id in range(5)]
+    finally:
+        set_figure_rendering()
+
+
+def test_render_worker_mathjax():
+    pio = pytest.importorskip("plotly.io")
+    pytest.importorskip("kaleido")
+    from scripts.python.routines.plot.save import _write_figures
+    mathjax = pio.kaleido.scope.mathjax
+    try:
+        # settings of the pipeline process are applied in render processes
+        _write_figures([], None)
+        assert pio.kaleido.scope.mathjax is None
+    finally:
+        pio.kaleido.scope.mathjax = mathjax
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.inference.trees import compile_model, load_tree_ensemble
+
+
+def get_data(num_rows=500, num_features=8, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((num_rows, num_features)).astype(np.float32)
+    y = X[:, 0] * 3 + X[:, 1]
+    X[rng.random(X.shape) < 0.05] = np.nan
+    X[rng.random(X.shape) < 0.05] = 0.0
+    return X, y
+
+
+@pytest.mark.parametrize("objective", ["regression", "multiclass"])
+def test_lightgbm(objective):
+    lgb = pytest.importorskip("lightgbm")
+    X, y = get_data()
+    params = {'objective': objective, 'num_leaves': 7, 'verbose': -1}
+    if objective == "multiclass":
+        params['num_class'] = 3
+        y = np.digitize(y, [1.3, 2.5])
+    model = lgb.train(params, lgb.Dataset(X, y), 30)
+    raw, pred = compile_model("lightgbm", model).predict(X)
+    assert np.allclose(raw, model.predict(X, raw_score=True), atol=1e-10)
+    assert np.allclose(pred, model.predict(X), atol=1e-10)
+
+
+def test_xgboost_binary(tmp_path):
+    xgb = pytest.importorskip("xgboost")
+    X, y = get_data()
+    feature_names = [f"cg{i:08d}" for i in range(X.shape[1])]
+    dmat = xgb.DMatrix(X, (y > 2).astype(int), feature_names=feature_names)
+    model = xgb.train({'objective': 'binary:logistic', 'max_depth': 4}, dmat, 30)
+    ensemble = compile_model("xgboost", model)
+    ensemble.save(f"{tmp_path}/trees.npz")
+    raw, pred = load_tree_ensemble(f"{tmp_path}/trees.npz").predict(X)
+    assert np.allclose(raw, model.predict(dmat, output_margin=True), atol=1e-5)
+    assert np.allclose(pred, model.predict(dmat), atol=1e-6)
+
+
+def test_catboost_multiclass():
+    catboost = pytest.importorskip("catboost")
+    X, y = get_data()
+    model = catboost.CatBoost({'loss_function': 'MultiClass', 'iterations': 30, 'depth': 4, 'verbose': 0, 'allow_writing_files': False})
+    model.fit(X, np.digitize(y, [1.3, 2.5]))
+    raw, pred = compile_model("catboost", model).predict(X)
+    assert np.allclose(raw, model.predict(X, prediction_type="RawFormulaVal"), atol=1e-10)
+    assert np.allclose(pred, model.predict(X, prediction_type="Probability"), atol=1e-10)